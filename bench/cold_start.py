@@ -0,0 +1,85 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.memory import synthetic
+from storage.compact import UserTasks
+from storage.base import Task
+from storage.journal import JournalStorage
+from storage.json_store import JsonStorage
+from storage.snapshot import SnapshotStorage, convert
+
+
+# Время запуска хранилища (до готовности отвечать) и первого обращения
+# к пользователю при разном числе пользователей в файле.
+#
+#   python bench/cold_start.py --users 10000 100000
+#
+# Снимок замеряется первым: таблица предметов общая на процесс.
+
+
+def prepare(tmp, users, dates, tasks, seed):
+    raw = {}
+    for user_id, date_ord, items in synthetic(users, dates, tasks, seed):
+        raw.setdefault(str(user_id), {})[str(date_ord)] = [list(item) for item in items]
+    json_path = os.path.join(tmp, f'{users}.json')
+    with open(json_path, 'w', encoding='utf-8') as f:
+        json.dump(raw, f, ensure_ascii=False)
+
+    snapshot_path = os.path.join(tmp, f'{users}.snap')
+    compact = {user_id: UserTasks({int(date_ord): [Task(*item) for item in items]
+                                   for date_ord, items in user_data.items()})
+               for user_id, user_data in raw.items()}
+    convert(compact, snapshot_path, users * dates * tasks)
+    return json_path, snapshot_path, list(raw)
+
+
+async def measure(storage, user_ids, samples):
+    started = time.perf_counter()
+    await storage.start()
+    loaded = time.perf_counter() - started
+
+    # Первое обращение к случайным пользователям
+    first = []
+    for user_id in random.sample(user_ids, samples):
+        started = time.perf_counter()
+        await storage.get_user(user_id)
+        first.append(time.perf_counter() - started)
+    await storage.close()
+    return loaded, statistics.median(first)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--dates', type=int, default=5, help='дат на пользователя')
+    parser.add_argument('--tasks', type=int, default=3, help='заданий на дату')
+    parser.add_argument('--samples', type=int, default=100, help='сколько пользователей читается после запуска')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for users in args.users:
+            json_path, snapshot_path, user_ids = prepare(tmp, users, args.dates, args.tasks, args.seed)
+            print(f"{users} пользователей: JSON {os.path.getsize(json_path) / 2 ** 20:.1f} МБ, "
+                  f"снимок {os.path.getsize(snapshot_path) / 2 ** 20:.1f} МБ")
+            storages = {
+                'snapshot': SnapshotStorage(snapshot_path, 5, 100),
+                'json': JsonStorage(json_path, 5, 100),
+                'journal': JournalStorage(json_path, 5, 100),
+            }
+            for name, storage in storages.items():
+                loaded, first = asyncio.run(measure(storage, user_ids, min(args.samples, users)))
+                print(f"  {name:8} запуск {loaded * 1000:9.1f} мс  первое чтение {first * 1e6:7.1f} мкс")
+
+
+if __name__ == "__main__":
+    main()
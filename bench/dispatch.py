@@ -0,0 +1,142 @@
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from handlers.buttons import TextCommands
+
+
+# Стоимость выбора обработчика для одного сообщения.
+# Старый способ - фильтры обработчиков из handlers/routes.py в порядке
+# регистрации, каждый кнопочный фильтр - отдельная лямбда; новый -
+# один поиск в таблице TextCommands, а затем те же фильтры состояний.
+#
+#   python bench/dispatch.py --updates 200000
+
+
+BUTTONS = [
+    "❓ Помощь", "📝 Добавить ДЗ", "➕ Продолжить ввод", "📋 Показать весь список",
+    "✏️ Удалить задание", "🗑️ Очистить", "🧹 Очистить всё", "📅 Удалить по дате",
+]
+COMMANDS = ["/start", "/help", "/list", "/clear"]
+STATES = [
+    "waiting_for_date", "waiting_for_homework", "waiting_for_continue_date",
+    "waiting_for_continue_homework", "waiting_for_select_task_to_delete",
+    "waiting_for_task_number", "waiting_for_delete_date",
+]
+
+
+class Message:
+    __slots__ = ('text', 'state')
+
+    def __init__(self, text, state):
+        self.text = text
+        self.state = state
+
+
+def command(name):
+    def check(message):
+        return message.text.split(maxsplit=1)[0].split('@')[0] == name
+    return check
+
+def text_is(text):
+    return lambda message: message.text == text
+
+def state_is(state):
+    return lambda message: message.state == state
+
+
+async def handler(message, state=None):
+    return message.text
+
+
+# Порядок регистрации обработчиков до перехода на таблицу
+def legacy_filters():
+    return [
+        command("/start"),
+        text_is("❓ Помощь"), command("/help"),
+        text_is("📝 Добавить ДЗ"),
+        state_is("waiting_for_date"), state_is("waiting_for_homework"),
+        text_is("➕ Продолжить ввод"),
+        state_is("waiting_for_continue_date"), state_is("waiting_for_continue_homework"),
+        text_is("📋 Показать весь список"), command("/list"),
+        text_is("✏️ Удалить задание"),
+        state_is("waiting_for_select_task_to_delete"), state_is("waiting_for_task_number"),
+        text_is("🗑️ Очистить"), command("/clear"),
+        text_is("🧹 Очистить всё"),
+        text_is("📅 Удалить по дате"),
+        state_is("waiting_for_delete_date"),
+        text_is("⛔ Стоп"),
+        lambda message: True,
+    ]
+
+# Текущий порядок: таблица, затем команды с аргументами (/start@bot ...)
+# и обработчики состояний
+def table_filters(buttons):
+    return [
+        buttons.filter,
+        command("/start"), command("/help"),
+        state_is("waiting_for_date"), state_is("waiting_for_homework"),
+        state_is("waiting_for_continue_date"), state_is("waiting_for_continue_homework"),
+        command("/list"),
+        state_is("waiting_for_select_task_to_delete"), state_is("waiting_for_task_number"),
+        command("/clear"),
+        state_is("waiting_for_delete_date"),
+        text_is("⛔ Стоп"),
+        lambda message: True,
+    ]
+
+
+def make_messages(count, button_share):
+    messages = []
+    for _ in range(count):
+        if random.random() < button_share:
+            messages.append(Message(random.choice(BUTTONS + COMMANDS), None))
+        else:
+            # Текст задания или дата в одном из состояний либо вне их
+            messages.append(Message("Математика: стр. 45, №123", random.choice(STATES + [None])))
+    return messages
+
+
+def run_filters(filters, messages):
+    started = time.perf_counter()
+    for message in messages:
+        for check in filters:
+            if check(message):
+                break
+    return time.perf_counter() - started
+
+
+# Таблица: поиск обработчика и его вызов для нажатий кнопок
+async def run_dispatch(buttons, messages):
+    started = time.perf_counter()
+    for message in messages:
+        await buttons.dispatch(message, None)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--updates', type=int, default=200000)
+    parser.add_argument('--buttons', type=float, default=0.5, help='доля нажатий кнопок среди сообщений')
+    args = parser.parse_args()
+
+    buttons = TextCommands()
+    buttons(*BUTTONS, *COMMANDS)(handler)
+    messages = make_messages(args.updates, args.buttons)
+
+    for name, filters in (('lambdas', legacy_filters()), ('table', table_filters(buttons))):
+        elapsed = run_filters(filters, messages)
+        print(f"{name:8} select={elapsed / len(messages) * 1e9:7.0f} ns/update")
+
+    pressed = [message for message in messages if message.text in buttons]
+    elapsed = asyncio.run(run_dispatch(buttons, pressed))
+    print(f"{'table':8} dispatch={elapsed / len(pressed) * 1e9:7.0f} ns/button")
+
+
+if __name__ == "__main__":
+    main()
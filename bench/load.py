@@ -0,0 +1,272 @@
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+# Нагрузочный тест бота без сети: синтетические обновления подаются
+# в Dispatcher.feed_update из main.py, а ответы бота перехватывает
+# сессия-заглушка вместо запросов к Telegram. Каждый пользователь
+# проходит типичные сценарии (добавить, продолжить, список, удалить
+# задание, удалить по дате), одновременно работают --concurrency человек.
+#
+#   python bench/load.py --users 2000 --mode journal --out load.json
+#   python bench/load.py --users 2000 --mode journal --baseline load.json
+#
+# С --baseline результат сравнивается с сохранённым: если какой-то
+# показатель хуже более чем на --threshold, код выхода 1.
+
+
+# Показатель -> True, если больше - лучше
+METRICS = {
+    'updates_per_sec': True,
+    'latency_p50_ms': False,
+    'latency_p95_ms': False,
+    'latency_p99_ms': False,
+    'bytes_written_per_update': False,
+    'peak_memory_mb': False,
+}
+
+STOP = "⛔ Стоп"
+SUBJECTS = ["Математика", "Физика", "История", "Английский", "УПС та ПНШВ", "Химия"]
+
+
+def make_session_class():
+    from aiogram.client.session.base import BaseSession
+
+    # Сессия бота, которая ничего не отправляет, а только считает вызовы API
+    class RecordingSession(BaseSession):
+        def __init__(self):
+            super().__init__()
+            self.calls = {}
+            self.text_bytes = 0
+
+        async def make_request(self, bot, method, timeout=None):
+            name = method.__api_method__
+            self.calls[name] = self.calls.get(name, 0) + 1
+            text = getattr(method, 'text', None)
+            if isinstance(text, str):
+                self.text_bytes += len(text.encode('utf-8'))
+            return True
+
+        async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+            yield b''
+
+        async def close(self):
+            pass
+
+    return RecordingSession
+
+
+# Обновления одного пользователя. Сценарии выбираются случайно,
+# но только осмысленные: продолжить и удалить можно лишь существующую дату.
+class UserScript:
+    def __init__(self, user_id, flows, tasks):
+        self.user_id = user_id
+        self.flows = flows
+        self.tasks = tasks
+        self.dates = {}  # дата -> сколько заданий
+
+    def _task(self):
+        return f"{random.choice(SUBJECTS)}: стр. {random.randint(1, 300)}, №{random.randint(1, 999)}"
+
+    def _date(self):
+        return date.today().toordinal() + random.randint(0, 30)
+
+    def _text(self, date_ord):
+        return date.fromordinal(date_ord).strftime("%d.%m.%Y")
+
+    def flow(self):
+        flows = [self.add, self.show_list]
+        if self.dates:
+            flows += [self.continue_input, self.delete_task, self.clear_date]
+        return random.choice(flows)()
+
+    def add(self):
+        date_ord = self._date()
+        count = random.randint(1, self.tasks)
+        # Добавление на существующую дату заменяет её задания
+        self.dates[date_ord] = count
+        return ["📝 Добавить ДЗ", self._text(date_ord)] + [self._task() for _ in range(count)] + [STOP]
+
+    def continue_input(self):
+        date_ord = random.choice(list(self.dates))
+        count = random.randint(1, self.tasks)
+        self.dates[date_ord] += count
+        return ["➕ Продолжить ввод", self._text(date_ord)] + [self._task() for _ in range(count)] + [STOP]
+
+    def show_list(self):
+        return ["📋 Показать весь список"]
+
+    def delete_task(self):
+        date_ord = random.choice(list(self.dates))
+        number = random.randint(1, self.dates[date_ord])
+        self.dates[date_ord] -= 1
+        if not self.dates[date_ord]:
+            del self.dates[date_ord]
+        return ["✏️ Удалить задание", self._text(date_ord), str(number)]
+
+    def clear_date(self):
+        date_ord = random.choice(list(self.dates))
+        del self.dates[date_ord]
+        return ["🗑️ Очистить", "📅 Удалить по дате", self._text(date_ord)]
+
+    def texts(self):
+        for _ in range(self.flows):
+            yield from self.flow()
+
+
+def make_update(update_id, user_id, text):
+    from aiogram.types import Chat, Message, Update, User
+
+    return Update(
+        update_id=update_id,
+        message=Message(
+            message_id=update_id,
+            date=datetime.now(timezone.utc),
+            chat=Chat(id=user_id, type='private'),
+            from_user=User(id=user_id, is_bot=False, first_name='Bench'),
+            text=text,
+        ),
+    )
+
+
+# Счётчик байтов, переданных в write() всеми потоками процесса (Linux)
+def bytes_written():
+    try:
+        with open('/proc/self/io', 'r') as f:
+            for line in f:
+                if line.startswith('wchar:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def percentile(values, share):
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+async def run(args):
+    from main import create_bot, dp
+
+    session = make_session_class()()
+    bot = create_bot(session)
+    await dp.emit_startup(bot=bot)
+
+    update_ids = itertools.count(1)
+    latencies = []
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def user_session(user_id):
+        script = UserScript(user_id, args.flows, args.tasks)
+        async with semaphore:
+            for text in script.texts():
+                update = make_update(next(update_ids), user_id, text)
+                started = time.perf_counter()
+                await dp.feed_update(bot, update)
+                latencies.append(time.perf_counter() - started)
+
+    written = bytes_written()
+    started = time.perf_counter()
+    await asyncio.gather(*(user_session(user_id) for user_id in range(1, args.users + 1)))
+    # Финальный сброс хранилища - тоже часть работы
+    await dp.emit_shutdown(bot=bot)
+    elapsed = time.perf_counter() - started
+    if written is not None:
+        written = bytes_written() - written
+
+    latencies.sort()
+    updates = len(latencies)
+    return {
+        'mode': args.mode,
+        'users': args.users,
+        'concurrency': args.concurrency,
+        'updates': updates,
+        'seconds': round(elapsed, 3),
+        'updates_per_sec': round(updates / elapsed, 1),
+        'latency_p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'latency_p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+        'latency_p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        'bytes_written_per_update': round(written / updates, 1) if written is not None else None,
+        # ru_maxrss в Linux - в килобайтах
+        'peak_memory_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'api_calls': session.calls,
+        'api_text_bytes': session.text_bytes,
+    }
+
+
+# Показатели, которые ухудшились больше чем на threshold относительно baseline
+def regressions(result, baseline, threshold):
+    found = []
+    for name, higher_is_better in METRICS.items():
+        old, new = baseline.get(name), result.get(name)
+        if not old or new is None:
+            continue
+        change = (old - new) / old if higher_is_better else (new - old) / old
+        if change > threshold:
+            found.append(f"{name}: {old} -> {new} ({change:+.0%})")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--flows', type=int, default=5, help='сценариев на пользователя')
+    parser.add_argument('--tasks', type=int, default=4, help='наибольшее число заданий в одном вводе')
+    parser.add_argument('--concurrency', type=int, default=50, help='одновременно работающих пользователей')
+    parser.add_argument('--mode', default='json', help='STORAGE_MODE: json, journal, snapshot или sqlite')
+    parser.add_argument('--send-limits', action='store_true',
+                        help='соблюдать ограничения Telegram на частоту отправки (SEND_RATE, SEND_CHAT_RATE)')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--out', help='файл для результата в JSON')
+    parser.add_argument('--baseline', help='сохранённый результат для сравнения')
+    parser.add_argument('--threshold', type=float, default=0.2, help='допустимое ухудшение (0.2 = 20%%)')
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # config читает окружение при импорте, поэтому всё задаётся до импорта main
+        os.environ.update({
+            'BOT_TOKEN': '123456:bench',
+            'STORAGE_MODE': args.mode,
+            'DATA_FILE': os.path.join(tmp, 'homework_data.json'),
+            'SQLITE_FILE': os.path.join(tmp, 'homework_data.db'),
+            'SNAPSHOT_FILE': os.path.join(tmp, 'homework_data.snap'),
+            'DRAFTS_FILE': os.path.join(tmp, 'homework_drafts.jsonl'),
+            'FSM_FILE': os.path.join(tmp, 'homework_fsm.db'),
+            'ARCHIVE_FILE': os.path.join(tmp, 'homework_archive.db'),
+            'CLASSES_FILE': os.path.join(tmp, 'homework_classes.db'),
+        })
+        if not args.send_limits:
+            # Заглушка отвечает мгновенно, ограничения Telegram не нужны
+            os.environ.update({'SEND_RATE': '0', 'SEND_CHAT_RATE': '0'})
+        os.environ.pop('SHARD_INDEX', None)
+        result = asyncio.run(run(args))
+
+    print(json.dumps(result, ensure_ascii=False, indent=4))
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=4)
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        found = regressions(result, baseline, args.threshold)
+        for line in found:
+            print(f"Регрессия {line}")
+        if found:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage.base import decode_user
+from storage.json_store import JsonStorage
+from storage.journal import JournalStorage
+from storage.sqlite import SqliteStorage
+
+
+# Замер задержек цикла событий при одновременной работе многих пользователей.
+# Сравнивается старый способ (синхронное чтение и перезапись всего файла
+# на каждое сохранение) с хранилищами из storage/.
+#
+#   python bench/loop_stall.py --users 5000 --active 200 --ops 20
+
+
+# Старые load_user_data/save_user_data из handlers/routes.py
+class LegacyFileStorage:
+    def __init__(self, path):
+        self.path = path
+
+    def _load_all(self):
+        with open(self.path, 'r', encoding='utf-8') as f:
+            return json.loads(f.read())
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def get_user(self, user_id):
+        return self._load_all().get(str(user_id), {})
+
+    async def append_tasks(self, user_id, date_ord, items):
+        all_data = self._load_all()
+        user_data = all_data.get(str(user_id), {})
+        tasks = user_data.get(str(date_ord), "")
+        count = len(tasks.split('\n')) if tasks else 0
+        tasks += "".join(f"\n{count + i}. {item}" for i, item in enumerate(items, 1))
+        user_data[str(date_ord)] = tasks.strip()
+        all_data[str(user_id)] = user_data
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump(all_data, f, ensure_ascii=False, indent=4)
+
+
+def make_data(users, dates, tasks):
+    base = 739600
+    return {
+        str(user_id): {
+            str(base + d): [[user_id * 1000 + d * 10 + t, f"Математика: стр. {t}, №{d}", 0] for t in range(tasks)]
+            for d in range(dates)
+        }
+        for user_id in range(1, users + 1)
+    }
+
+
+def make_legacy_data(users, dates, tasks):
+    base = 739600
+    return {
+        str(user_id): {
+            str(base + d): "\n".join(f"{t + 1}. Математика: стр. {t}, №{d}" for t in range(tasks))
+            for d in range(dates)
+        }
+        for user_id in range(1, users + 1)
+    }
+
+
+# Фоновая задача: просыпается каждую миллисекунду и записывает опоздание
+async def sample_lag(lags, stop):
+    interval = 0.001
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        started = loop.time()
+        await asyncio.sleep(interval)
+        lags.append(max(0.0, loop.time() - started - interval))
+
+
+async def user_session(storage, user_id, ops):
+    for i in range(ops):
+        await storage.get_user(user_id)
+        await storage.append_tasks(user_id, 739600, [f"Задание {i}"])
+        await asyncio.sleep(random.random() * 0.01)
+
+
+async def run(name, storage, args):
+    await storage.start()
+    lags = []
+    stop = asyncio.Event()
+    sampler = asyncio.create_task(sample_lag(lags, stop))
+
+    started = time.perf_counter()
+    active = random.sample(range(1, args.users + 1), args.active)
+    await asyncio.gather(*(user_session(storage, user_id, args.ops) for user_id in active))
+    await storage.close()
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    await sampler
+    lags.sort()
+    stalled = sum(lag for lag in lags if lag > 0.005)
+    print(f"{name:10} ops={args.active * args.ops:6} time={elapsed:7.2f}s "
+          f"lag p50={statistics.median(lags) * 1000:7.2f}ms "
+          f"p99={lags[int(len(lags) * 0.99)] * 1000:8.2f}ms "
+          f"max={lags[-1] * 1000:8.2f}ms stalled={stalled:6.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=5000, help='пользователей в файле')
+    parser.add_argument('--dates', type=int, default=5)
+    parser.add_argument('--tasks', type=int, default=4)
+    parser.add_argument('--active', type=int, default=100, help='одновременно работающих пользователей')
+    parser.add_argument('--ops', type=int, default=10, help='сохранений на пользователя')
+    parser.add_argument('--modes', default='legacy,json,journal,sqlite')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in args.modes.split(','):
+            storage = prepare(mode, tmp, args)
+            asyncio.run(run(mode, storage, args))
+
+
+def prepare(mode, tmp, args):
+    path = os.path.join(tmp, f'{mode}.json')
+    if mode == 'legacy':
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(make_legacy_data(args.users, args.dates, args.tasks), f, ensure_ascii=False, indent=4)
+        return LegacyFileStorage(path)
+
+    data = make_data(args.users, args.dates, args.tasks)
+    if mode == 'sqlite':
+        db_path = os.path.join(tmp, 'bench.db')
+        asyncio.run(import_into(db_path, data))
+        return SqliteStorage(db_path)
+
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    if mode == 'journal':
+        return JournalStorage(path, 0.5, 100)
+    return JsonStorage(path, 0.5, 100)
+
+
+async def import_into(db_path, data):
+    storage = SqliteStorage(db_path)
+    await storage.start()
+    ids = itertools.count(1)
+    await storage.import_users({user_id: decode_user(raw, ids) for user_id, raw in data.items()})
+    await storage.close()
+
+
+if __name__ == "__main__":
+    main()
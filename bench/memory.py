@@ -0,0 +1,119 @@
+import argparse
+import gc
+import os
+import random
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage.base import Task, ordinal_to_date
+from storage.compact import UserTasks
+
+
+# Память на одно задание при разных представлениях данных в памяти:
+#
+#   strings - старый вид: {"user_id": {"ДД.ММ.ГГГГ": "1. ...\n2. ..."}}
+#   objects - {"user_id": {дата: [Task, ...]}} с обычным dataclass (__dict__)
+#   slots   - то же с Task на __slots__
+#   compact - {"user_id": UserTasks} (storage/compact.py)
+#
+#   python bench/memory.py --users 10000 100000
+
+
+SUBJECTS = ["Математика", "Физика", "История", "Английский", "УПС та ПНШВ", "Химия", "Рус. яз."]
+
+
+@dataclass(frozen=True)
+class DictTask:
+    id: int
+    text: str
+    created: int
+
+
+# Одни и те же синтетические данные для каждого представления:
+# (user_id, дата, [(id, текст, время)])
+def synthetic(users, dates, tasks, seed):
+    rng = random.Random(seed)
+    today = date.today().toordinal()
+    task_id = 0
+    for user_id in range(1, users + 1):
+        user_id = 10 ** 9 + user_id
+        for date_ord in rng.sample(range(today - 60, today + 30), dates):
+            items = []
+            for _ in range(tasks):
+                task_id += 1
+                if rng.random() < 0.8:
+                    text = f"{rng.choice(SUBJECTS)}: стр. {rng.randint(1, 300)}, №{rng.randint(1, 999)}"
+                else:
+                    text = f"Подготовить доклад на {rng.randint(3, 10)} минут"
+                items.append((task_id, text, 1767225600 + rng.randint(0, 10 ** 7)))
+            yield user_id, date_ord, items
+
+
+def build_strings(rows):
+    data = {}
+    for user_id, date_ord, items in rows:
+        data.setdefault(str(user_id), {})[ordinal_to_date(date_ord)] = "\n".join(
+            f"{i}. {text}" for i, (_, text, _) in enumerate(items, 1))
+    return data
+
+def build_objects(rows, task_class):
+    data = {}
+    for user_id, date_ord, items in rows:
+        data.setdefault(str(user_id), {})[date_ord] = [task_class(*item) for item in items]
+    return data
+
+def build_compact(rows):
+    return {user_id: UserTasks(user_data) for user_id, user_data in build_objects(rows, Task).items()}
+
+
+FORMS = {
+    'strings': build_strings,
+    'objects': lambda rows: build_objects(rows, DictTask),
+    'slots': lambda rows: build_objects(rows, Task),
+    'compact': build_compact,
+}
+
+
+# Сколько памяти занимают построенные данные (без промежуточных объектов)
+def measure(build, users, dates, tasks, seed):
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    started = time.perf_counter()
+    data = build(synthetic(users, dates, tasks, seed))
+    elapsed = time.perf_counter() - started
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del data
+    return size, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--dates', type=int, default=5, help='дат на пользователя')
+    parser.add_argument('--tasks', type=int, default=3, help='заданий на дату')
+    parser.add_argument('--forms', nargs='+', default=list(FORMS), choices=list(FORMS))
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    for users in args.users:
+        count = users * args.dates * args.tasks
+        print(f"{users} пользователей, {count} заданий")
+        baseline = None
+        for name in args.forms:
+            size, elapsed = measure(FORMS[name], users, args.dates, args.tasks, args.seed)
+            per_task = size / count
+            baseline = baseline or per_task
+            print(f"  {name:8} {per_task:7.1f} байт/задание  {size / 2 ** 20:8.1f} МБ  "
+                  f"x{per_task / baseline:.2f}  ({elapsed:.1f} с)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+from os import getenv, path
+from dotenv import load_dotenv
+
+load_dotenv()
+
+TOKEN = getenv('BOT_TOKEN')
+
+# Файл для хранения данных
+DATA_FILE = getenv('DATA_FILE', 'homework_data.json')
+
+# Как часто (в секундах) изменения из памяти сбрасываются на диск.
+# Это верхняя граница потери данных при аварийном завершении.
+FLUSH_INTERVAL = float(getenv('FLUSH_INTERVAL', '5'))
+
+# Сколько изменённых пользователей можно накопить до внеочередного сброса
+FLUSH_MAX_DIRTY = int(getenv('FLUSH_MAX_DIRTY', '100'))
+
+# Режим хранения: json - файл целиком, journal - снимок + журнал изменений,
+# snapshot - двоичный снимок с ленивой загрузкой пользователей + журнал,
+# sqlite - база SQLite (одна строка на задание)
+STORAGE_MODE = getenv('STORAGE_MODE', 'json')
+
+# Файл базы для режима sqlite
+SQLITE_FILE = getenv('SQLITE_FILE', 'homework_data.db')
+
+# Двоичный снимок для режима snapshot (журнал - SNAPSHOT_FILE.journal)
+SNAPSHOT_FILE = getenv('SNAPSHOT_FILE', 'homework_data.snap')
+
+# Журнал черновиков: задания, введённые до нажатия "⛔ Стоп"
+DRAFTS_FILE = getenv('DRAFTS_FILE', 'homework_drafts.jsonl')
+
+# Состояния диалогов (FSM): база SQLite и через сколько секунд без
+# обращений сессия удаляется (0 - не удаляется). Изменения
+# записываются раз в FLUSH_INTERVAL.
+FSM_FILE = getenv('FSM_FILE', 'homework_fsm.db')
+FSM_TTL = float(getenv('FSM_TTL', '86400'))
+
+# Сколько памяти (в байтах) отводится под кэш готовых ответов со списками
+VIEW_CACHE_BYTES = int(getenv('VIEW_CACHE_BYTES', '8388608'))
+
+# Сжатие журнала: как часто проверять и с какого размера (в байтах) сжимать
+JOURNAL_COMPACT_INTERVAL = float(getenv('JOURNAL_COMPACT_INTERVAL', '60'))
+JOURNAL_COMPACT_BYTES = int(getenv('JOURNAL_COMPACT_BYTES', '1048576'))
+
+# Сколько обновлений разных пользователей обрабатывается одновременно
+MAX_CONCURRENT_UPDATES = int(getenv('MAX_CONCURRENT_UPDATES', '100'))
+
+# Адрес Bot API. Для нагрузочных прогонов без сети бот можно направить
+# на локальную заглушку tools/fake_api.py: API_URL=http://127.0.0.1:8081
+API_URL = getenv('API_URL', 'https://api.telegram.org')
+
+# Способ получения обновлений: polling или webhook
+BOT_MODE = getenv('BOT_MODE', 'polling')
+
+# Настройки webhook: адрес, который слушает бот, путь и секрет,
+# который Telegram передаёт в заголовке X-Telegram-Bot-Api-Secret-Token.
+# WEBHOOK_URL - внешний адрес для setWebhook; если пусто, webhook не
+# регистрируется (удобно для локальной проверки).
+WEBHOOK_HOST = getenv('WEBHOOK_HOST', '127.0.0.1')
+WEBHOOK_PORT = int(getenv('WEBHOOK_PORT', '8080'))
+WEBHOOK_PATH = getenv('WEBHOOK_PATH', '/webhook')
+WEBHOOK_URL = getenv('WEBHOOK_URL', '')
+WEBHOOK_SECRET = getenv('WEBHOOK_SECRET') or None
+
+# Очередь отправки: не больше SEND_RATE сообщений в секунду всего и
+# SEND_CHAT_RATE в один чат (с запасом SEND_CHAT_BURST подряд),
+# не больше SEND_CONCURRENCY запросов одновременно. 0 - без ограничения.
+SEND_RATE = float(getenv('SEND_RATE', '30'))
+SEND_CHAT_RATE = float(getenv('SEND_CHAT_RATE', '1'))
+SEND_CHAT_BURST = int(getenv('SEND_CHAT_BURST', '3'))
+SEND_CONCURRENCY = int(getenv('SEND_CONCURRENCY', '20'))
+
+# Напоминания: за REMINDER_DAYS_BEFORE дней до даты в REMINDER_HOUR часов
+# по времени сервера (-1 - напоминания выключены). Не больше
+# REMINDER_CONCURRENCY напоминаний отправляется одновременно.
+# REMINDERS_FILE - пользователи, отключившие напоминания командой /remind.
+REMINDER_HOUR = int(getenv('REMINDER_HOUR', '18'))
+REMINDER_DAYS_BEFORE = int(getenv('REMINDER_DAYS_BEFORE', '1'))
+REMINDER_CONCURRENCY = int(getenv('REMINDER_CONCURRENCY', '10'))
+REMINDERS_FILE = getenv('REMINDERS_FILE', 'homework_reminders.json')
+
+# Общие списки классов (/class, /join, /publish): база SQLite, одна на
+# все шарды, которую каждый процесс перечитывает раз в CLASS_SYNC_INTERVAL
+# секунд, и сколько уведомлений о публикации отправляется одновременно
+CLASSES_FILE = getenv('CLASSES_FILE', 'homework_classes.db')
+CLASS_SYNC_INTERVAL = float(getenv('CLASS_SYNC_INTERVAL', '1'))
+CLASS_NOTIFY_CONCURRENCY = int(getenv('CLASS_NOTIFY_CONCURRENCY', '10'))
+
+# Архив: даты старше ARCHIVE_AFTER_DAYS дней переносятся из хранилища
+# в сжатый архив ARCHIVE_FILE (0 - не переносятся). Проверка идёт раз
+# в ARCHIVE_INTERVAL секунд пачками по ARCHIVE_BATCH пользователей.
+ARCHIVE_AFTER_DAYS = int(getenv('ARCHIVE_AFTER_DAYS', '0'))
+ARCHIVE_FILE = getenv('ARCHIVE_FILE', 'homework_archive.db')
+ARCHIVE_INTERVAL = float(getenv('ARCHIVE_INTERVAL', '3600'))
+ARCHIVE_BATCH = int(getenv('ARCHIVE_BATCH', '100'))
+
+# Метрики в формате Prometheus: http://METRICS_HOST:METRICS_PORT/metrics
+# (0 - сервер метрик не запускается)
+METRICS_HOST = getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(getenv('METRICS_PORT', '0'))
+
+# Как часто (в секундах) замерять опоздание цикла событий
+LOOP_LAG_INTERVAL = float(getenv('LOOP_LAG_INTERVAL', '0.5'))
+
+# Обновления, обработка которых дольше SLOW_UPDATE_MS миллисекунд,
+# записываются в SLOW_UPDATE_LOG (0 - не записываются)
+SLOW_UPDATE_MS = float(getenv('SLOW_UPDATE_MS', '0'))
+SLOW_UPDATE_LOG = getenv('SLOW_UPDATE_LOG', 'slow_updates.jsonl')
+
+# Количество процессов-шардов для sharding.py (пользователь -> user_id % SHARDS)
+SHARDS = int(getenv('SHARDS', '2'))
+
+# Номер шарда задаётся процессу-шарду запускающим процессом.
+# У каждого шарда свои файлы данных, кроме общей базы классов.
+SHARD_INDEX = getenv('SHARD_INDEX')
+if SHARD_INDEX is not None:
+    def _shard_path(file_name):
+        root, ext = path.splitext(file_name)
+        return f"{root}.shard{SHARD_INDEX}{ext}"
+
+    DATA_FILE = _shard_path(DATA_FILE)
+    SQLITE_FILE = _shard_path(SQLITE_FILE)
+    SNAPSHOT_FILE = _shard_path(SNAPSHOT_FILE)
+    DRAFTS_FILE = _shard_path(DRAFTS_FILE)
+    FSM_FILE = _shard_path(FSM_FILE)
+    SLOW_UPDATE_LOG = _shard_path(SLOW_UPDATE_LOG)
+    REMINDERS_FILE = _shard_path(REMINDERS_FILE)
+    ARCHIVE_FILE = _shard_path(ARCHIVE_FILE)
+    # SEND_RATE - ограничение Telegram на весь бот, а очередь отправки
+    # у каждого шарда своя: делим его поровну. Чат целиком живёт
+    # в одном шарде, поэтому SEND_CHAT_RATE не меняется.
+    SEND_RATE /= SHARDS
+    # Каждый шард отдаёт метрики на своём порту
+    if METRICS_PORT:
+        METRICS_PORT += int(SHARD_INDEX)
@@ -0,0 +1,63 @@
+import re
+
+from storage.base import date_to_ordinal
+
+
+# Разбор сообщения с несколькими заданиями сразу.
+#
+# Каждая строка - отдельное задание. Если в сообщении есть нумерация
+# или маркеры списка ("1.", "2)", "-", "•"), они убираются, а строки без
+# них считаются продолжением предыдущего задания (длинный пункт,
+# перенесённый при копировании из чата класса).
+#
+# Строка, начинающаяся с даты и двоеточия, открывает блок заданий на
+# эту дату (без двоеточия дата - просто начало задания):
+#
+#   26.02.2026:
+#   1. Математика: стр. 45, №123
+#   2. Физика: параграф 5
+#   27.02.2026: История - конспект
+ITEM_MARKER = re.compile(r'^\s*(?:\d{1,3}[.)]|[-•*—–])\s+')
+DATE_HEADER = re.compile(r'^\s*(\d{1,2}\.\d{1,2}\.\d{4})\s*:\s*(.*)$')
+
+
+def split_tasks(lines):
+    numbered = any(ITEM_MARKER.match(line) for line in lines)
+    tasks = []
+    for line in lines:
+        if not line.strip():
+            continue
+        marker = ITEM_MARKER.match(line)
+        if marker:
+            tasks.append(line[marker.end():].strip())
+        elif numbered and tasks:
+            tasks[-1] += ' ' + line.strip()
+        else:
+            tasks.append(line.strip())
+    return [task for task in tasks if task]
+
+
+def date_header(line):
+    match = DATE_HEADER.match(line)
+    if match is None:
+        return None
+    try:
+        return date_to_ordinal(match.group(1)), match.group(2)
+    except ValueError:
+        return None
+
+
+# Задания до первой даты и блоки {дата: [задания]} в порядке появления
+def parse_bulk(text):
+    leading = []
+    blocks = {}
+    current = leading
+    for line in text.splitlines():
+        header = date_header(line)
+        if header is not None:
+            date_ord, rest = header
+            current = blocks.setdefault(date_ord, [])
+            line = rest
+        current.append(line)
+    blocks = {date_ord: split_tasks(lines) for date_ord, lines in blocks.items()}
+    return split_tasks(leading), {date_ord: tasks for date_ord, tasks in blocks.items() if tasks}
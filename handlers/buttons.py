@@ -0,0 +1,48 @@
+import inspect
+
+
+# Таблица точных текстовых команд: текст кнопки или команды -> обработчик.
+# Вместо отдельного фильтра-лямбды на каждую кнопку, которые проверяются
+# по очереди, роутер проверяет одно вхождение в словарь.
+#
+#   buttons = TextCommands()
+#
+#   @buttons("📋 Показать весь список", "/list")
+#   async def show_user_homework(message): ...
+#
+#   @router.message(buttons.filter)
+#   async def dispatch_button(message, state):
+#       return await buttons.dispatch(message, state)
+class TextCommands:
+    def __init__(self):
+        self._table = {}
+
+    def __call__(self, *texts):
+        def register(handler):
+            # Нужен ли обработчику FSMContext, выясняем один раз при импорте
+            wants_state = 'state' in inspect.signature(handler).parameters
+            for text in texts:
+                if text in self._table:
+                    raise ValueError(f"Команда {text!r} уже зарегистрирована")
+                self._table[text] = (handler, wants_state)
+            return handler
+        return register
+
+    def __contains__(self, text):
+        return text in self._table
+
+    def __len__(self):
+        return len(self._table)
+
+    def handler_for(self, text):
+        return self._table[text][0]
+
+    # Фильтр для router.message
+    def filter(self, message):
+        return message.text in self._table
+
+    async def dispatch(self, message, state):
+        handler, wants_state = self._table[message.text]
+        if wants_state:
+            return await handler(message, state=state)
+        return await handler(message)
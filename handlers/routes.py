@@ -1,14 +1,33 @@
-from aiogram import Router, types
+import asyncio
+from datetime import date
+
+from aiogram import F, Router, types
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.types import ReplyKeyboardMarkup, KeyboardButton
-from datetime import datetime
-import json
-import os
+from aiogram.types import (
+    ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
+)
+from config import CLASS_NOTIFY_CONCURRENCY
+from handlers.buttons import TextCommands
+from handlers.bulk import parse_bulk
+from handlers.views import ARCHIVE_HEADER, fit_lines, render_dates, render_list, render_results, views
+from outbox import INTERACTIVE, broadcast, outbox
+from reminders import reminders
+from storage.archive import cold_archive
+from storage.base import date_to_ordinal, ordinal_to_date, render_tasks
+from storage.dates import date_index
+from storage.drafts import drafts
+from storage.search import search_index
+from storage.store import store
 
 router = Router()
 
+# Кнопки меню и команды без аргументов: один поиск в словаре вместо
+# проверки фильтров всех обработчиков по очереди
+buttons = TextCommands()
+
 # Класс состояний
 class HomeworkStates(StatesGroup):
     waiting_for_date = State()
@@ -19,53 +38,36 @@ class HomeworkStates(StatesGroup):
     waiting_for_select_task_to_delete = State()  # Выбор даты для удаления конкретного задания
     waiting_for_task_number = State()  # Номер задания для удаления
 
-# Файл для хранения данных
-DATA_FILE = 'homework_data.json'
-
 # Загрузка данных для конкретного пользователя
-def load_user_data(user_id):
-    try:
-        if os.path.exists(DATA_FILE):
-            with open(DATA_FILE, 'r', encoding='utf-8') as f:
-                content = f.read()
-                if content.strip():  # Проверяем, не пустой ли файл
-                    all_data = json.loads(content)
-                    return all_data.get(str(user_id), {})
-                else:
-                    return {}
-        return {}
-    except json.JSONDecodeError:
-        # Если файл поврежден, создаем новый
-        return {}
-    except Exception as e:
-        print(f"Ошибка при загрузке данных: {e}")
-        return {}
+async def load_user_data(user_id):
+    return await store.get_user(user_id)
 
-# Сохранение данных для конкретного пользователя
-def save_user_data(user_id, user_data):
-    try:
-        # Загружаем все данные
-        if os.path.exists(DATA_FILE):
-            with open(DATA_FILE, 'r', encoding='utf-8') as f:
-                content = f.read()
-                if content.strip():
-                    all_data = json.loads(content)
-                else:
-                    all_data = {}
-        else:
-            all_data = {}
-        
-        # Обновляем данные для пользователя
-        all_data[str(user_id)] = user_data
-        
-        # Сохраняем все данные
-        with open(DATA_FILE, 'w', encoding='utf-8') as f:
-            json.dump(all_data, f, ensure_ascii=False, indent=4)
-        
-        return True
-    except Exception as e:
-        print(f"Ошибка при сохранении данных: {e}")
-        return False
+# Готовые ответы из кэша или построенные заново.
+# Пустой ответ - у пользователя нет заданий.
+# Между чтением заданий и индекса дат данные могут измениться, поэтому
+# показываются только даты, которые есть в прочитанных заданиях.
+async def homework_list(user_id):
+    async def build():
+        user_homework = await load_user_data(user_id)
+        dates = [date_ord for date_ord in await date_index.get(user_id) if date_ord in user_homework]
+        return render_list(user_homework, dates)
+    return await views.get(user_id, 'list', build)
+
+# Архив читается с диска только при промахе кэша; кэш сбрасывается,
+# когда прошедшие даты уходят из хранилища в архив.
+# Общие задания класса лежат в базе классов и идут перед личными.
+async def archive_list(user_id):
+    async def build():
+        archived = await store.archived_for(user_id)
+        for date_ord, tasks in (await cold_archive.get_user(user_id)).items():
+            archived[date_ord] = archived.get(date_ord, []) + tasks
+        return render_list(archived, sorted(archived), ARCHIVE_HEADER)
+    return await views.get(user_id, 'archive', build)
+
+async def date_picker(user_id):
+    async def build():
+        return render_dates(await date_index.get(user_id))
+    return await views.get(user_id, 'dates', build)
 
 # Клавиатура с кнопкой стоп
 def get_stop_keyboard():
@@ -100,7 +102,37 @@ def get_clear_keyboard():
     )
     return keyboard
 
+# Листание страниц списка: ◀️ 2/5 ▶️
+# prefix - какой список листается (list или archive).
+# Строится только следующая страница, чтобы узнать, есть ли она;
+# пока построены не все, вместо общего числа страниц - многоточие.
+def get_page_keyboard(page, pages, prefix="list"):
+    row = []
+    if page > 0:
+        row.append(InlineKeyboardButton(text="◀️", callback_data=f"{prefix}:{page - 1}"))
+    has_next = pages.get(page + 1) is not None
+    count = pages.count()
+    row.append(InlineKeyboardButton(text=f"{page + 1}/{count or '…'}", callback_data=f"{prefix}:current"))
+    if has_next:
+        row.append(InlineKeyboardButton(text="▶️", callback_data=f"{prefix}:{page + 1}"))
+    return InlineKeyboardMarkup(inline_keyboard=[row])
+
+# Переход в другой сценарий или отмена: незаконченный черновик
+# выбрасывается, иначе он ожил бы при следующем '⛔ Стоп'
+async def switch_flow(message: types.Message, state: FSMContext, new_state=None):
+    await drafts.finish(message.from_user.id)
+    if new_state is None:
+        await state.clear()
+    else:
+        await state.set_state(new_state)
+
+# Кнопки и команды обрабатываются раньше обработчиков состояний
+@router.message(buttons.filter)
+async def dispatch_button(message: types.Message, state: FSMContext):
+    return await buttons.dispatch(message, state)
+
 # Команда старт
+@buttons("/start")
 @router.message(Command("start"))
 async def cmd_start(message: types.Message):
     user_id = message.from_user.id
@@ -122,15 +154,20 @@ async def cmd_start(message: types.Message):
     )
 
 # Команда помощь
-@router.message(lambda message: message.text == "❓ Помощь")
+@buttons("❓ Помощь", "/help")
 @router.message(Command("help"))
 async def cmd_help(message: types.Message):
     help_text = (
         "📚 *Как пользоваться ботом:*\n\n"
         "1️⃣ Нажмите '📝 Добавить ДЗ'\n"
         "2️⃣ Введите дату (например: 26.02.2026)\n"
-        "3️⃣ Вводите задания по одному\n"
+        "3️⃣ Вводите задания по одному или списком (каждое с новой строки)\n"
         "4️⃣ Нажмите '⛔ Стоп' для сохранения\n\n"
+        "📋 *Сразу на несколько дат:*\n"
+        "Отправьте дату и задания под ней, например:\n"
+        "26.02.2026:\n"
+        "1. Математика: стр. 45\n"
+        "27.02.2026: История - параграф 5\n\n"
         "➕ *Продолжить ввод:*\n"
         "• Нажмите '➕ Продолжить ввод'\n"
         "• Выберите дату\n"
@@ -142,16 +179,22 @@ async def cmd_help(message: types.Message):
         "• Выберите номер задания для удаления\n\n"
         "📋 *Другие команды:*\n"
         "• /list - показать ваш список\n"
+        "• /find слова - поиск по заданиям (например: /find физика параграф)\n"
+        "• /next - задания на неделю вперёд (/next 14 - на 14 дней)\n"
+        "• /remind - включить или выключить напоминания\n"
+        "• /archive - прошедшие задания из архива\n"
         "• /clear - очистить задания\n"
+        "• /class K122 - создать общий список класса, /join K122 - подключиться, /leave - выйти\n"
+        "• /publish ДД.ММ.ГГГГ: задания - опубликовать задания классу (для владельца)\n"
         "• /help - эта помощь\n\n"
         "🔒 *Важно:* Каждый видит только свои задания!"
     )
     await message.answer(help_text, parse_mode="Markdown", reply_markup=get_main_keyboard())
 
 # Начало добавления ДЗ
-@router.message(lambda message: message.text == "📝 Добавить ДЗ")
+@buttons("📝 Добавить ДЗ")
 async def add_homework_start(message: types.Message, state: FSMContext):
-    await state.set_state(HomeworkStates.waiting_for_date)
+    await switch_flow(message, state, HomeworkStates.waiting_for_date)
     await message.answer(
         "📅 Введите дату в формате ДД.ММ.ГГГГ\n"
         "Например: 26.02.2026\n\n"
@@ -163,23 +206,24 @@ async def add_homework_start(message: types.Message, state: FSMContext):
 @router.message(HomeworkStates.waiting_for_date)
 async def process_date(message: types.Message, state: FSMContext):
     if message.text == "⛔ Стоп":
-        await state.clear()
+        await switch_flow(message, state)
         await message.answer("❌ Добавление отменено", reply_markup=get_main_keyboard())
         return
     
     try:
         # Проверка формата даты
-        datetime.strptime(message.text, "%d.%m.%Y")
+        date_ord = date_to_ordinal(message.text)
         
-        # Сохраняем дату
-        await state.update_data(date=message.text, homework_items=[])
+        # Начинаем черновик на эту дату
+        await drafts.begin(message.from_user.id, 'add', date_ord)
         await state.set_state(HomeworkStates.waiting_for_homework)
         
         await message.answer(
-            f"📝 Вводите задания для {message.text}\n\n"
+            f"📝 Вводите задания для {ordinal_to_date(date_ord)}\n\n"
             "Пример:\n"
             "Математика: стр. 45, №123\n"
             "УПС та ПНШВ: прочитать параграф 5\n\n"
+            "Можно отправить сразу список - каждое задание с новой строки.\n"
             "Когда закончите, нажмите '⛔ Стоп'",
             reply_markup=get_stop_keyboard()
         )
@@ -193,67 +237,103 @@ async def process_date(message: types.Message, state: FSMContext):
 # Обработка заданий
 @router.message(HomeworkStates.waiting_for_homework)
 async def process_homework(message: types.Message, state: FSMContext):
+    user_id = message.from_user.id
+    
     if message.text == "⛔ Стоп":
-        # Получаем данные
-        data = await state.get_data()
-        date = data.get('date')
-        homework_items = data.get('homework_items', [])
+        # Черновик и состояние отпускаем только после записи: при ошибке
+        # введённое не пропадёт, и Стоп можно нажать ещё раз
+        draft = drafts.get(user_id)
+        if draft and draft.items:
+            try:
+                await store.set_tasks(user_id, draft.date, draft.items)
+            except Exception as e:
+                await report_store_error(message, e, SAVE_RETRY, get_stop_keyboard())
+                return
+        # Ввод закончен, даже если ответ не отправится
+        await drafts.finish(user_id)
+        await state.clear()
         
-        if homework_items:
-            # Формируем нумерованный список
-            numbered_list = ""
-            for i, item in enumerate(homework_items, 1):
-                numbered_list += f"{i}. {item}\n"
-            
-            # Загружаем данные пользователя
-            user_id = message.from_user.id
-            user_homework = load_user_data(user_id)
-            
-            # Сохраняем
-            user_homework[date] = numbered_list.strip()
-            
-            if save_user_data(user_id, user_homework):
-                await message.answer(
-                    f"✅ Задания на {date} сохранены!",
-                    reply_markup=get_main_keyboard()
-                )
-            else:
-                await message.answer(
-                    "❌ Ошибка при сохранении",
-                    reply_markup=get_main_keyboard()
-                )
+        if draft and draft.items:
+            # Длинный список показываем не целиком
+            await message.answer(
+                fit_lines(f"✅ Задания на {ordinal_to_date(draft.date)} сохранены!\n\n", draft.lines),
+                reply_markup=get_main_keyboard()
+            )
         else:
             await message.answer(
                 "❌ Нет заданий для сохранения",
                 reply_markup=get_main_keyboard()
             )
-        
+        return
+    
+    # Добавляем задания в черновик и подтверждаем только их
+    await add_to_draft(message, state)
+
+STOP_HINT = "Когда закончите, нажмите '⛔ Стоп'"
+SAVE_RETRY = "❌ Ошибка при сохранении, задания не потеряны. Нажмите '⛔ Стоп' ещё раз"
+
+# Ошибка записи в хранилище: пользователь получает ответ, а не тишину
+async def report_store_error(message: types.Message, error, text="❌ Ошибка при сохранении", reply_markup=None):
+    print(f"Ошибка при сохранении данных: {error}")
+    await message.answer(text, reply_markup=reply_markup or get_main_keyboard())
+
+# Задания из блоков "ДД.ММ.ГГГГ: ..." дописываются сразу в хранилище;
+# записи разных дат уходят одной групповой фиксацией
+async def save_blocks(user_id, blocks):
+    await asyncio.gather(*(store.append_tasks(user_id, date_ord, tasks) for date_ord, tasks in blocks.items()))
+    return [f"📅 {ordinal_to_date(date_ord)}: +{len(tasks)}" for date_ord, tasks in blocks.items()]
+
+# Одно сообщение может содержать несколько заданий (по одному на строку,
+# с нумерацией или без) и блоки заданий на другие даты
+async def add_to_draft(message: types.Message, state: FSMContext):
+    user_id = message.from_user.id
+    draft = drafts.get(user_id)
+    if draft is None:
         await state.clear()
+        await message.answer("❌ Ввод прерван, начните заново", reply_markup=get_main_keyboard())
         return
     
-    # Добавляем задание
-    data = await state.get_data()
-    homework_items = data.get('homework_items', [])
-    homework_items.append(message.text)
-    await state.update_data(homework_items=homework_items)
+    tasks, blocks = parse_bulk(message.text or "")
+    # Блок на дату черновика дописывается в черновик
+    tasks += blocks.pop(draft.date, [])
     
-    # Показываем текущий список
-    current_list = ""
-    for i, item in enumerate(homework_items, 1):
-        current_list += f"{i}. {item}\n"
+    lines = []
+    if tasks:
+        number = await drafts.add(user_id, tasks)
+        lines += [f"{number + i}. {text}" for i, text in enumerate(tasks)]
+    if blocks:
+        lines += await save_blocks(user_id, blocks)
     
-    await message.answer(
-        f"✅ Добавлено!\n\nТекущий список:\n{current_list}",
-        reply_markup=get_stop_keyboard()
+    if not lines:
+        await message.answer("❌ Отправьте текст задания", reply_markup=get_stop_keyboard())
+        return
+    
+    # Подтверждение не ждёт отправки; несколько подтверждений, ждущих
+    # в очереди, уходят одним сообщением. Длинный список показывается
+    # не целиком, чтобы подтверждение поместилось в сообщение.
+    future = outbox.post(
+        message.bot,
+        message.answer(
+            fit_lines("✅ Добавлено: " if len(lines) == 1 else "✅ Добавлено:\n", lines, f"\n\n{STOP_HINT}"),
+            reply_markup=get_stop_keyboard()
+        ),
+        priority=INTERACTIVE,
+        coalesce=STOP_HINT
     )
+    future.add_done_callback(report_failure)
+
+# Ошибку подтверждения, которое никто не ждёт, хотя бы записываем
+def report_failure(future):
+    if not future.cancelled() and future.exception() is not None:
+        print(f"Ошибка при отправке подтверждения: {future.exception()}")
 
 # Продолжить ввод заданий
-@router.message(lambda message: message.text == "➕ Продолжить ввод")
+@buttons("➕ Продолжить ввод")
 async def continue_homework_start(message: types.Message, state: FSMContext):
     user_id = message.from_user.id
-    user_homework = load_user_data(user_id)
+    dates = await date_picker(user_id)
     
-    if not user_homework:
+    if not dates:
         await message.answer(
             "📭 У вас пока нет ни одной даты с заданиями.\n"
             "Сначала добавьте задания через '📝 Добавить ДЗ'",
@@ -262,65 +342,49 @@ async def continue_homework_start(message: types.Message, state: FSMContext):
         return
     
     # Показываем даты для выбора
-    response = "📅 *Выберите дату для продолжения:*\n\n"
-    
-    # Сортируем даты
-    try:
-        sorted_dates = sorted(user_homework.keys(), 
-                            key=lambda x: datetime.strptime(x, "%d.%m.%Y"), 
-                            reverse=True)
-    except:
-        sorted_dates = user_homework.keys()
-    
-    for date in sorted_dates:
-        response += f"• {date}\n"
+    response = f"📅 *Выберите дату для продолжения:*\n\n{dates}"
     
     response += "\n✏️ Введите дату, чтобы добавить ещё задания:"
     
-    await state.set_state(HomeworkStates.waiting_for_continue_date)
+    await switch_flow(message, state, HomeworkStates.waiting_for_continue_date)
     await message.answer(response, parse_mode="Markdown", reply_markup=get_stop_keyboard())
 
 @router.message(HomeworkStates.waiting_for_continue_date)
 async def process_continue_date(message: types.Message, state: FSMContext):
     if message.text == "⛔ Стоп":
-        await state.clear()
+        await switch_flow(message, state)
         await message.answer("❌ Продолжение отменено", reply_markup=get_main_keyboard())
         return
     
     try:
         # Проверка формата даты
-        datetime.strptime(message.text, "%d.%m.%Y")
+        date_ord = date_to_ordinal(message.text)
         date_str = message.text
         
         user_id = message.from_user.id
-        user_homework = load_user_data(user_id)
+        user_homework = await load_user_data(user_id)
         
-        if date_str in user_homework:
+        if date_ord in user_homework:
             # Показываем текущие задания
-            tasks_text = user_homework[date_str]
-            tasks_list = tasks_text.strip().split('\n')
-            
-            response = f"📅 *Текущие задания на {date_str}:*\n\n"
-            for task in tasks_list:
-                response += f"{task}\n"
+            tasks_list = user_homework[date_ord]
             
             # Получаем количество существующих заданий
             existing_count = len(tasks_list)
             
-            # Сохраняем данные в состоянии
-            await state.update_data(
-                date=date_str, 
-                homework_items=[],
-                existing_count=existing_count
-            )
+            # Новые задания нумеруются после существующих
+            await drafts.begin(user_id, 'continue', date_ord, existing_count + 1)
             
             await state.set_state(HomeworkStates.waiting_for_continue_homework)
             
             await message.answer(
-                f"{response}\n\n"
-                f"➕ *Добавьте новые задания*\n"
-                f"Они будут добавлены после существующих (начиная с номера {existing_count + 1})\n\n"
-                f"Вводите задания по одному. Когда закончите, нажмите '⛔ Стоп'",
+                fit_lines(
+                    f"📅 *Текущие задания на {ordinal_to_date(date_ord)}:*\n\n",
+                    render_tasks(tasks_list).split("\n"),
+                    f"\n\n\n"
+                    f"➕ *Добавьте новые задания*\n"
+                    f"Они будут добавлены после существующих (начиная с номера {existing_count + 1})\n\n"
+                    f"Вводите задания по одному или списком. Когда закончите, нажмите '⛔ Стоп'"
+                ),
                 parse_mode="Markdown",
                 reply_markup=get_stop_keyboard()
             )
@@ -341,115 +405,329 @@ async def process_continue_date(message: types.Message, state: FSMContext):
 @router.message(HomeworkStates.waiting_for_continue_homework)
 async def process_continue_homework(message: types.Message, state: FSMContext):
     if message.text == "⛔ Стоп":
-        # Получаем данные
-        data = await state.get_data()
-        date = data.get('date')
-        homework_items = data.get('homework_items', [])
-        existing_count = data.get('existing_count', 0)
+        # Как и при добавлении: черновик отпускаем только после записи
+        user_id = message.from_user.id
+        draft = drafts.get(user_id)
+        if draft and draft.items:
+            try:
+                # Добавляем новые задания в конец, номера появятся при выводе
+                await store.append_tasks(user_id, draft.date, draft.items)
+            except Exception as e:
+                await report_store_error(message, e, SAVE_RETRY, get_stop_keyboard())
+                return
+        await drafts.finish(user_id)
+        await state.clear()
         
-        if homework_items:
-            # Загружаем данные пользователя
-            user_id = message.from_user.id
-            user_homework = load_user_data(user_id)
-            
-            # Получаем существующие задания
-            existing_tasks = user_homework.get(date, "")
-            existing_list = existing_tasks.strip().split('\n') if existing_tasks else []
+        if draft and draft.items:
+            existing_list = (await load_user_data(user_id)).get(draft.date, [])
             
-            # Добавляем новые задания
-            for item in homework_items:
-                # Убираем возможные старые номера из текста
-                clean_item = item.split('. ', 1)[-1] if '. ' in item else item
-                existing_list.append(clean_item)
-            
-            # Переиндексируем все задания
-            new_tasks_text = ""
-            for i, task in enumerate(existing_list, 1):
-                new_tasks_text += f"{i}. {task}\n"
-            
-            # Сохраняем
-            user_homework[date] = new_tasks_text.strip()
-            
-            if save_user_data(user_id, user_homework):
-                # Показываем итоговый список
-                response = f"📅 *Обновленные задания на {date}:*\n\n"
-                for i, task in enumerate(existing_list, 1):
-                    response += f"{i}. {task}\n"
-                
-                await message.answer(
-                    f"✅ Добавлено {len(homework_items)} новых заданий!\n\n{response}",
-                    parse_mode="Markdown",
-                    reply_markup=get_main_keyboard()
-                )
-            else:
-                await message.answer(
-                    "❌ Ошибка при сохранении",
-                    reply_markup=get_main_keyboard()
-                )
+            # Показываем итоговый список, длинный - не целиком
+            await message.answer(
+                fit_lines(
+                    f"✅ Добавлено {len(draft.items)} новых заданий!\n\n"
+                    f"📅 *Обновленные задания на {ordinal_to_date(draft.date)}:*\n\n",
+                    render_tasks(existing_list).split("\n"),
+                    "\n"
+                ),
+                parse_mode="Markdown",
+                reply_markup=get_main_keyboard()
+            )
         else:
             await message.answer(
                 "❌ Нет новых заданий для добавления",
                 reply_markup=get_main_keyboard()
             )
-        
-        await state.clear()
         return
     
-    # Добавляем задание
-    data = await state.get_data()
-    homework_items = data.get('homework_items', [])
-    existing_count = data.get('existing_count', 0)
-    homework_items.append(message.text)
-    await state.update_data(homework_items=homework_items)
-    
-    # Показываем текущий список новых заданий
-    current_list = ""
-    for i, item in enumerate(homework_items, 1):
-        current_list += f"{existing_count + i}. {item}\n"
-    
-    await message.answer(
-        f"✅ Добавлено!\n\nНовые задания (будут добавлены после существующих):\n{current_list}",
-        reply_markup=get_stop_keyboard()
-    )
+    # Добавляем задание в черновик
+    await add_to_draft(message, state)
 
 # Показать список пользователя
-@router.message(lambda message: message.text == "📋 Показать весь список")
+@buttons("📋 Показать весь список", "/list")
 @router.message(Command("list"))
 async def show_user_homework(message: types.Message):
     user_id = message.from_user.id
-    user_homework = load_user_data(user_id)
+    pages = await homework_list(user_id)
     
-    if not user_homework:
+    if not pages:
         await message.answer(
             "📭 Ваш список пуст",
             reply_markup=get_main_keyboard()
         )
         return
     
-    # Формируем ответ
-    response = "📚 *ВАШИ ЗАДАНИЯ*\n\n"
+    # Длинный список уходит страницами не длиннее лимита Telegram
+    if pages.get(1) is None:
+        await message.answer(pages.get(0), parse_mode="Markdown", reply_markup=get_main_keyboard())
+    else:
+        await message.answer(pages.get(0), parse_mode="Markdown", reply_markup=get_page_keyboard(0, pages))
+
+# Показать страницу списка в сообщении с кнопками листания
+async def turn_page(callback: types.CallbackQuery, pages, empty_text):
+    prefix, page = callback.data.split(":", 1)
+    if not page.isdigit():
+        await callback.answer()
+        return
+    
+    if not pages:
+        await callback.answer(empty_text)
+        return
     
-    # Сортируем по дате
+    # Список мог сократиться с момента отправки сообщения
+    page = int(page)
+    text = pages.get(page)
+    if text is None:
+        page = pages.last()
+        text = pages.get(page)
     try:
-        sorted_dates = sorted(user_homework.keys(), 
-                            key=lambda x: datetime.strptime(x, "%d.%m.%Y"), 
-                            reverse=True)
-    except:
-        sorted_dates = user_homework.keys()
+        await callback.message.edit_text(
+            text,
+            parse_mode="Markdown",
+            reply_markup=get_page_keyboard(page, pages, prefix)
+        )
+    except TelegramBadRequest:
+        # Страница не изменилась
+        pass
+    await callback.answer()
+
+# Переход на другую страницу списка
+@router.callback_query(F.data.startswith("list:"))
+async def show_homework_page(callback: types.CallbackQuery):
+    await turn_page(callback, await homework_list(callback.from_user.id), "📭 Ваш список пуст")
+
+# Прошедшие даты, перенесённые в архив
+@buttons("/archive")
+@router.message(Command("archive"))
+async def show_archive(message: types.Message):
+    pages = await archive_list(message.from_user.id)
+    
+    if not pages:
+        await message.answer("🗄 Архив пуст", reply_markup=get_main_keyboard())
+        return
     
-    for date in sorted_dates:
-        response += f"📅 *{date}:*\n{user_homework[date]}\n\n"
+    if pages.get(1) is None:
+        await message.answer(pages.get(0), parse_mode="Markdown", reply_markup=get_main_keyboard())
+    else:
+        await message.answer(pages.get(0), parse_mode="Markdown", reply_markup=get_page_keyboard(0, pages, "archive"))
+
+@router.callback_query(F.data.startswith("archive:"))
+async def show_archive_page(callback: types.CallbackQuery):
+    await turn_page(callback, await archive_list(callback.from_user.id), "🗄 Архив пуст")
+
+# Найденные задания постранично; пустой кортеж - ничего не найдено
+async def search_pages(user_id, query):
+    results, total = await search_index.search(user_id, query)
+    if not results:
+        return ()
+    if total > len(results):
+        return render_results(results, f"🔎 *Найдено: {total}, показаны первые {len(results)}*\n\n")
+    return render_results(results, f"🔎 *Найдено: {total}*\n\n")
+
+# Поиск по заданиям: /find физика параграф
+@buttons("/find")
+@router.message(Command("find"))
+async def find_tasks(message: types.Message, state: FSMContext):
+    parts = message.text.split(maxsplit=1)
+    if len(parts) < 2:
+        await message.answer(
+            "🔎 Напишите, что искать, например:\n/find физика параграф",
+            reply_markup=get_main_keyboard()
+        )
+        return
+    
+    query = parts[1]
+    pages = await search_pages(message.from_user.id, query)
+    if not pages:
+        await message.answer(f"🔎 По запросу «{query}» ничего не найдено", reply_markup=get_main_keyboard())
+        return
+    
+    # Запрос нужен для листания страниц: в кнопку он может не поместиться
+    await state.update_data(find_query=query)
+    if pages.get(1) is None:
+        await message.answer(pages.get(0), parse_mode="Markdown", reply_markup=get_main_keyboard())
+    else:
+        await message.answer(pages.get(0), parse_mode="Markdown", reply_markup=get_page_keyboard(0, pages, "find"))
+
+@router.callback_query(F.data.startswith("find:"))
+async def show_find_page(callback: types.CallbackQuery, state: FSMContext):
+    query = (await state.get_data()).get('find_query')
+    pages = await search_pages(callback.from_user.id, query) if query else ()
+    await turn_page(callback, pages, "🔎 Повторите поиск")
+
+# Задания на ближайшие дни: /next или /next 14
+@buttons("/next")
+@router.message(Command("next"))
+async def show_next_days(message: types.Message):
+    user_id = message.from_user.id
+    
+    parts = message.text.split(maxsplit=1)
+    days = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else 7
+    days = max(1, min(days, 366))
+    
+    # Даты берутся из индекса бисекцией, без перебора всех дат; дата,
+    # удалённая до чтения заданий, пропускается
+    dates = await date_index.upcoming(user_id, date.today().toordinal(), days)
+    user_homework = await load_user_data(user_id) if dates else {}
+    dates = [date_ord for date_ord in dates if date_ord in user_homework]
+    
+    if not dates:
+        await message.answer(
+            f"📭 На ближайшие {days} дн. заданий нет",
+            reply_markup=get_main_keyboard()
+        )
+        return
+    
+    response = f"📆 *Задания на {days} дн. вперёд*\n\n"
+    for date_ord in dates:
+        response += f"📅 *{ordinal_to_date(date_ord)}:*\n{render_tasks(user_homework[date_ord])}\n\n"
     
-    # Отправляем
     await message.answer(response, parse_mode="Markdown", reply_markup=get_main_keyboard())
 
+# Включение и выключение напоминаний
+@buttons("/remind")
+@router.message(Command("remind"))
+async def toggle_reminders(message: types.Message):
+    if not reminders.enabled:
+        await message.answer("🔕 Напоминания не настроены", reply_markup=get_main_keyboard())
+        return
+    
+    user_id = message.from_user.id
+    muted = not reminders.is_muted(user_id)
+    await reminders.mute(user_id, muted)
+    
+    if muted:
+        await message.answer("🔕 Напоминания отключены", reply_markup=get_main_keyboard())
+    else:
+        await message.answer(
+            f"🔔 Напоминания включены: за {reminders.days_before} дн. до даты в {reminders.hour}:00",
+            reply_markup=get_main_keyboard()
+        )
+
+# Рассылки о публикациях идут в фоне; ссылки держим, пока они не закончатся
+notifications = set()
+
+# Общий список класса: /class K122
+@buttons("/class")
+@router.message(Command("class"))
+async def create_class(message: types.Message):
+    parts = message.text.split(maxsplit=1)
+    if len(parts) < 2:
+        shared_class = store.class_of(message.from_user.id)
+        if shared_class is None:
+            text = "👥 Вы не в классе.\nСоздать: /class K122\nПодключиться: /join K122"
+        else:
+            text = f"👥 Класс {shared_class.name}, участников: {len(shared_class.members)}"
+        await message.answer(text, reply_markup=get_main_keyboard())
+        return
+    
+    name = parts[1].strip().upper()
+    try:
+        await store.create_class(name, message.from_user.id)
+    except ValueError as e:
+        await message.answer(f"❌ {e}", reply_markup=get_main_keyboard())
+        return
+    await message.answer(
+        f"✅ Класс {name} создан!\n\n"
+        f"Одноклассники подключаются командой /join {name}\n"
+        "Публикуйте задания так же, как вставляете список:\n"
+        "/publish 26.02.2026: Математика: стр. 45",
+        reply_markup=get_main_keyboard()
+    )
+
+@buttons("/join")
+@router.message(Command("join"))
+async def join_class(message: types.Message):
+    parts = message.text.split(maxsplit=1)
+    if len(parts) < 2:
+        await message.answer("👥 Укажите класс, например: /join K122", reply_markup=get_main_keyboard())
+        return
+    
+    try:
+        shared_class = await store.join(message.from_user.id, parts[1].strip().upper())
+    except ValueError as e:
+        await message.answer(f"❌ {e}", reply_markup=get_main_keyboard())
+        return
+    await message.answer(
+        f"✅ Вы в классе {shared_class.name}! Задания класса появятся в вашем списке.",
+        reply_markup=get_main_keyboard()
+    )
+
+@buttons("/leave")
+@router.message(Command("leave"))
+async def leave_class(message: types.Message):
+    shared_class = await store.leave(message.from_user.id)
+    if shared_class is None:
+        await message.answer("👥 Вы не в классе", reply_markup=get_main_keyboard())
+    elif shared_class.owner == message.from_user.id:
+        await message.answer(f"✅ Класс {shared_class.name} удалён", reply_markup=get_main_keyboard())
+    else:
+        await message.answer(f"✅ Вы вышли из класса {shared_class.name}", reply_markup=get_main_keyboard())
+
+# Публикация классу: те же блоки "ДД.ММ.ГГГГ: задания", что и при вставке
+# списка. Задания сохраняются один раз, участники получают уведомление.
+@buttons("/publish")
+@router.message(Command("publish"))
+async def publish_tasks(message: types.Message):
+    user_id = message.from_user.id
+    parts = message.text.split(maxsplit=1)
+    tasks, blocks = parse_bulk(parts[1] if len(parts) > 1 else "")
+    if tasks or not blocks:
+        await message.answer(
+            "📢 Укажите дату перед заданиями, например:\n"
+            "/publish 26.02.2026:\n"
+            "1. Математика: стр. 45\n"
+            "2. Физика: параграф 5",
+            reply_markup=get_main_keyboard()
+        )
+        return
+    
+    members = set()
+    lines = []
+    try:
+        for date_ord, items in blocks.items():
+            members.update(await store.publish(user_id, date_ord, items))
+            lines.append(f"📅 {ordinal_to_date(date_ord)}: +{len(items)}")
+    except ValueError as e:
+        await message.answer(f"❌ {e}", reply_markup=get_main_keyboard())
+        return
+    
+    added = "\n".join(lines)
+    members.discard(user_id)
+    if members:
+        name = store.class_of(user_id).name
+        task = asyncio.create_task(broadcast(
+            message.bot, sorted(members), f"📢 Новые задания класса {name}:\n{added}", CLASS_NOTIFY_CONCURRENCY
+        ))
+        notifications.add(task)
+        task.add_done_callback(notifications.discard)
+    await message.answer(
+        f"✅ Опубликовано:\n{added}\n\nУчастников: {len(members)}",
+        reply_markup=get_main_keyboard()
+    )
+
+# Снять публикацию за дату: /unpublish 26.02.2026
+@buttons("/unpublish")
+@router.message(Command("unpublish"))
+async def unpublish_tasks(message: types.Message):
+    parts = message.text.split(maxsplit=1)
+    try:
+        date_ord = date_to_ordinal(parts[1].strip() if len(parts) > 1 else "")
+        removed = await store.unpublish(message.from_user.id, date_ord)
+    except ValueError as e:
+        await message.answer(f"❌ {e}", reply_markup=get_main_keyboard())
+        return
+    if removed:
+        await message.answer(f"✅ Задания класса за {ordinal_to_date(date_ord)} сняты", reply_markup=get_main_keyboard())
+    else:
+        await message.answer(f"❌ За {ordinal_to_date(date_ord)} заданий класса нет", reply_markup=get_main_keyboard())
+
 # Удаление конкретного задания
-@router.message(lambda message: message.text == "✏️ Удалить задание")
+@buttons("✏️ Удалить задание")
 async def delete_task_start(message: types.Message, state: FSMContext):
     user_id = message.from_user.id
-    user_homework = load_user_data(user_id)
+    dates = await date_picker(user_id)
     
-    if not user_homework:
+    if not dates:
         await message.answer(
             "📭 Ваш список пуст",
             reply_markup=get_main_keyboard()
@@ -457,51 +735,39 @@ async def delete_task_start(message: types.Message, state: FSMContext):
         return
     
     # Показываем даты для выбора
-    response = "📅 *Выберите дату:*\n\n"
-    
-    # Сортируем даты
-    try:
-        sorted_dates = sorted(user_homework.keys(), 
-                            key=lambda x: datetime.strptime(x, "%d.%m.%Y"), 
-                            reverse=True)
-    except:
-        sorted_dates = user_homework.keys()
-    
-    for date in sorted_dates:
-        response += f"• {date}\n"
+    response = f"📅 *Выберите дату:*\n\n{dates}"
     
     response += "\n✏️ Введите дату, из которой хотите удалить задание:"
     
-    await state.set_state(HomeworkStates.waiting_for_select_task_to_delete)
+    await switch_flow(message, state, HomeworkStates.waiting_for_select_task_to_delete)
     await message.answer(response, parse_mode="Markdown", reply_markup=get_stop_keyboard())
 
 @router.message(HomeworkStates.waiting_for_select_task_to_delete)
 async def process_select_date_for_task_delete(message: types.Message, state: FSMContext):
     if message.text == "⛔ Стоп":
-        await state.clear()
+        await switch_flow(message, state)
         await message.answer("❌ Отменено", reply_markup=get_main_keyboard())
         return
     
     try:
         date_str = message.text
-        datetime.strptime(date_str, "%d.%m.%Y")
+        date_ord = date_to_ordinal(date_str)
         
         user_id = message.from_user.id
-        user_homework = load_user_data(user_id)
+        user_homework = await load_user_data(user_id)
         
-        if date_str in user_homework:
+        if date_ord in user_homework:
             # Сохраняем дату в состоянии
-            await state.update_data(delete_date=date_str)
+            await state.update_data(delete_date=date_ord)
             
             # Показываем задания для этой даты
-            tasks_text = user_homework[date_str]
-            tasks_list = tasks_text.strip().split('\n')
-            
-            response = f"📅 *Задания на {date_str}:*\n\n"
-            for i, task in enumerate(tasks_list, 1):
-                response += f"{task}\n"
+            tasks_list = user_homework[date_ord]
             
-            response += f"\n🔢 Введите *номер* задания для удаления (от 1 до {len(tasks_list)}):"
+            response = fit_lines(
+                f"📅 *Задания на {ordinal_to_date(date_ord)}:*\n\n",
+                render_tasks(tasks_list).split("\n"),
+                f"\n\n🔢 Введите *номер* задания для удаления (от 1 до {len(tasks_list)}):"
+            )
             
             await state.set_state(HomeworkStates.waiting_for_task_number)
             await message.answer(response, parse_mode="Markdown", reply_markup=get_stop_keyboard())
@@ -521,51 +787,34 @@ async def process_select_date_for_task_delete(message: types.Message, state: FSM
 @router.message(HomeworkStates.waiting_for_task_number)
 async def process_task_number_delete(message: types.Message, state: FSMContext):
     if message.text == "⛔ Стоп":
-        await state.clear()
+        await switch_flow(message, state)
         await message.answer("❌ Отменено", reply_markup=get_main_keyboard())
         return
     
     try:
         task_number = int(message.text)
         data = await state.get_data()
-        date_str = data.get('delete_date')
+        date_ord = data.get('delete_date')
         
         user_id = message.from_user.id
-        user_homework = load_user_data(user_id)
+        user_homework = await load_user_data(user_id)
         
-        if date_str in user_homework:
-            tasks_text = user_homework[date_str]
-            tasks_list = tasks_text.strip().split('\n')
+        if date_ord in user_homework:
+            tasks_list = user_homework[date_ord]
             
             if 1 <= task_number <= len(tasks_list):
-                # Удаляем задание
-                deleted_task = tasks_list[task_number - 1]
-                tasks_list.pop(task_number - 1)
-                
-                if tasks_list:
-                    # Переиндексируем оставшиеся задания
-                    new_tasks_text = ""
-                    for i, task in enumerate(tasks_list, 1):
-                        # Убираем старый номер и добавляем новый
-                        task_text = task.split('. ', 1)[-1] if '. ' in task else task
-                        new_tasks_text += f"{i}. {task_text}\n"
-                    user_homework[date_str] = new_tasks_text.strip()
+                # Удаляем задание, оставшиеся перенумеруются при выводе
+                try:
+                    deleted_task = await store.delete_task(user_id, date_ord, task_number)
+                except Exception as e:
+                    await report_store_error(message, e, "❌ Ошибка при удалении")
                 else:
-                    # Если заданий не осталось, удаляем всю дату
-                    del user_homework[date_str]
-                
-                if save_user_data(user_id, user_homework):
                     await message.answer(
                         f"✅ Задание удалено:\n"
-                        f"*{deleted_task}*",
+                        f"*{task_number}. {deleted_task.text}*",
                         parse_mode="Markdown",
                         reply_markup=get_main_keyboard()
                     )
-                else:
-                    await message.answer(
-                        "❌ Ошибка при удалении",
-                        reply_markup=get_main_keyboard()
-                    )
             else:
                 await message.answer(
                     f"❌ Неправильный номер! Введите число от 1 до {len(tasks_list)}"
@@ -585,7 +834,7 @@ async def process_task_number_delete(message: types.Message, state: FSMContext):
         )
 
 # Очистка
-@router.message(lambda message: message.text == "🗑️ Очистить")
+@buttons("🗑️ Очистить", "/clear")
 @router.message(Command("clear"))
 async def clear_menu(message: types.Message, state: FSMContext):
     await message.answer(
@@ -596,26 +845,25 @@ async def clear_menu(message: types.Message, state: FSMContext):
         reply_markup=get_clear_keyboard()
     )
 
-@router.message(lambda message: message.text == "🧹 Очистить всё")
+@buttons("🧹 Очистить всё")
 async def clear_all(message: types.Message):
     user_id = message.from_user.id
-    if save_user_data(user_id, {}):
-        await message.answer(
-            "✅ Все ваши задания удалены!",
-            reply_markup=get_main_keyboard()
-        )
-    else:
-        await message.answer(
-            "❌ Ошибка при удалении",
-            reply_markup=get_main_keyboard()
-        )
+    try:
+        await store.clear_all(user_id)
+    except Exception as e:
+        await report_store_error(message, e, "❌ Ошибка при удалении")
+        return
+    await message.answer(
+        "✅ Все ваши задания удалены!",
+        reply_markup=get_main_keyboard()
+    )
 
-@router.message(lambda message: message.text == "📅 Удалить по дате")
+@buttons("📅 Удалить по дате")
 async def clear_by_date_start(message: types.Message, state: FSMContext):
     user_id = message.from_user.id
-    user_homework = load_user_data(user_id)
+    dates = await date_picker(user_id)
     
-    if not user_homework:
+    if not dates:
         await message.answer(
             "📭 Ваш список пуст",
             reply_markup=get_main_keyboard()
@@ -623,39 +871,35 @@ async def clear_by_date_start(message: types.Message, state: FSMContext):
         return
     
     # Показываем даты
-    response = "📅 *Ваши даты:*\n\n"
-    for date in user_homework.keys():
-        response += f"• {date}\n"
+    response = f"📅 *Ваши даты:*\n\n{dates}"
     
     response += "\n✏️ Введите дату для удаления:"
     
-    await state.set_state(HomeworkStates.waiting_for_delete_date)
+    await switch_flow(message, state, HomeworkStates.waiting_for_delete_date)
     await message.answer(response, parse_mode="Markdown", reply_markup=get_stop_keyboard())
 
 @router.message(HomeworkStates.waiting_for_delete_date)
 async def process_delete_by_date(message: types.Message, state: FSMContext):
     if message.text == "⛔ Стоп":
-        await state.clear()
+        await switch_flow(message, state)
         await message.answer("❌ Отменено", reply_markup=get_main_keyboard())
         return
     
     try:
         date_str = message.text
-        datetime.strptime(date_str, "%d.%m.%Y")
+        date_ord = date_to_ordinal(date_str)
         
         user_id = message.from_user.id
-        user_homework = load_user_data(user_id)
+        user_homework = await load_user_data(user_id)
         
-        if date_str in user_homework:
-            del user_homework[date_str]
-            if save_user_data(user_id, user_homework):
-                await message.answer(
-                    f"✅ Задания за {date_str} удалены!",
-                    reply_markup=get_main_keyboard()
-                )
+        if date_ord in user_homework:
+            try:
+                await store.clear_date(user_id, date_ord)
+            except Exception as e:
+                await report_store_error(message, e, "❌ Ошибка при удалении")
             else:
                 await message.answer(
-                    "❌ Ошибка при удалении",
+                    f"✅ Задания за {date_str} удалены!",
                     reply_markup=get_main_keyboard()
                 )
         else:
@@ -672,15 +916,45 @@ async def process_delete_by_date(message: types.Message, state: FSMContext):
             "Используйте ДД.ММ.ГГГГ"
         )
 
+# Черновик, состояние которого потерялось (например, истекло раньше
+# черновика): возвращаем пользователя в режим ввода заданий
+async def resume_draft(message: types.Message, state: FSMContext):
+    draft = drafts.get(message.from_user.id)
+    if draft is None or await state.get_state() is not None:
+        return False
+    
+    if draft.kind == 'add':
+        await state.set_state(HomeworkStates.waiting_for_homework)
+        await process_homework(message, state)
+    else:
+        await state.set_state(HomeworkStates.waiting_for_continue_homework)
+        await process_continue_homework(message, state)
+    return True
+
 # Кнопка стоп
 @router.message(lambda message: message.text == "⛔ Стоп")
 async def stop_action(message: types.Message, state: FSMContext):
-    await state.clear()
+    if await resume_draft(message, state):
+        return
+    await switch_flow(message, state)
     await message.answer("⏹️ Действие отменено", reply_markup=get_main_keyboard())
 
 # Все остальное
 @router.message()
-async def unknown_message(message: types.Message):
+async def unknown_message(message: types.Message, state: FSMContext):
+    if await resume_draft(message, state):
+        return
+    
+    # Вставленный список вида "ДД.ММ.ГГГГ: задания" сохраняется сразу
+    tasks, blocks = parse_bulk(message.text or "")
+    if blocks and not tasks:
+        lines = await save_blocks(message.from_user.id, blocks)
+        await message.answer(
+            fit_lines("✅ Добавлено:\n", lines),
+            reply_markup=get_main_keyboard()
+        )
+        return
+    
     await message.answer(
         "Используйте кнопки меню",
         reply_markup=get_main_keyboard()
@@ -0,0 +1,209 @@
+import sys
+from collections import OrderedDict
+
+from config import VIEW_CACHE_BYTES
+from storage.base import ordinal_to_date, render_tasks
+from storage.store import store
+
+
+# Ограничение Telegram на длину сообщения
+MESSAGE_LIMIT = 4096
+
+LIST_HEADER = "📚 *ВАШИ ЗАДАНИЯ*\n\n"
+ARCHIVE_HEADER = "🗄 *АРХИВ ЗАДАНИЙ*\n\n"
+
+
+# Длина текста так, как её считает Telegram (в единицах UTF-16)
+def message_length(text):
+    return len(text.encode('utf-16-le')) // 2
+
+
+# Блоки "дата + задания" от поздних дат к ранним, по одному за шаг.
+# dates - отсортированные даты из индекса.
+def list_blocks(user_homework, dates):
+    for date in reversed(dates):
+        yield f"📅 *{ordinal_to_date(date)}:*\n{render_tasks(user_homework[date])}\n\n"
+
+# Раскладка блоков по страницам не длиннее limit за один проход.
+# Блок, который не помещается даже на пустую страницу, режется по строкам.
+def paginate(blocks, limit, header=""):
+    limit -= message_length(header)
+    page, size = [], 0
+    for block in blocks:
+        length = message_length(block)
+        if length > limit:
+            pieces = split_block(block, limit)
+        else:
+            pieces = [(block, length)]
+        for piece, length in pieces:
+            if size + length > limit and page:
+                yield header + "".join(page)
+                page, size = [], 0
+            page.append(piece)
+            size += length
+    if page:
+        yield header + "".join(page)
+
+def split_block(block, limit):
+    for line in block.splitlines(keepends=True):
+        # Строка длиннее страницы (очень длинное задание) режется как есть
+        while message_length(line) > limit:
+            yield line[:limit // 2], message_length(line[:limit // 2])
+            line = line[limit // 2:]
+        yield line, message_length(line)
+
+# Сообщение из строк lines между header и footer не длиннее limit.
+# Не поместившиеся строки заменяются одной "… и ещё N"; длина
+# считается только по выведенным строкам.
+def fit_lines(header, lines, footer="", limit=MESSAGE_LIMIT):
+    limit -= message_length(header) + message_length(footer) + len("\n… и ещё 000000")
+    shown, size = [], 0
+    for line in lines:
+        size += message_length(line) + 1
+        if size > limit:
+            break
+        shown.append(line)
+    text = "\n".join(shown)
+    if len(shown) < len(lines):
+        text += f"\n… и ещё {len(lines) - len(shown)}"
+    return header + text.lstrip("\n") + footer
+
+# Страницы, которые форматируются по мере листания: запрос страницы
+# дочитывает генератор paginate только до неё, готовые страницы
+# остаются и повторно не строятся. Поэтому показ первой страницы стоит
+# одну страницу, а не всю историю.
+# on_grow(байт) - кто хранит страницы, узнаёт о новой.
+class Pages:
+    __slots__ = ('_pages', '_source', 'on_grow')
+
+    def __init__(self, source):
+        self._pages = []
+        self._source = source  # None, когда страниц больше нет
+        self.on_grow = None
+
+    # Текст страницы или None, если столько страниц нет
+    def get(self, page):
+        while len(self._pages) <= page and self._source is not None:
+            text = next(self._source, None)
+            if text is None:
+                self._source = None
+                break
+            self._pages.append(text)
+            if self.on_grow is not None:
+                self.on_grow(sys.getsizeof(text))
+        return self._pages[page] if page < len(self._pages) else None
+
+    # Число страниц, если все уже построены, иначе None
+    def count(self):
+        return len(self._pages) if self._source is None else None
+
+    # Номер последней страницы (строит все)
+    def last(self):
+        self.get(sys.maxsize)
+        return len(self._pages) - 1
+
+    def __bool__(self):
+        return self.get(0) is not None
+
+    def size(self):
+        return sys.getsizeof(self) + sum(sys.getsizeof(page) for page in self._pages)
+
+# Весь список заданий постранично; нет страниц - нет заданий
+def render_list(user_homework, dates, header=LIST_HEADER):
+    # Индекс дат меняется на месте, страницы дочитываются позже
+    return Pages(paginate(list_blocks(user_homework, tuple(dates)), MESSAGE_LIMIT, header))
+
+# Результаты поиска [(дата, номер, текст), ...] постранично
+def render_results(results, header):
+    blocks = (f"📅 *{ordinal_to_date(date)}*, {number}. {text}\n" for date, number, text in results)
+    return Pages(paginate(blocks, MESSAGE_LIMIT, header))
+
+def render_dates(dates):
+    return "".join(f"• {ordinal_to_date(date)}\n" for date in reversed(dates))
+
+
+# Размер ответа в памяти: строка или построенные страницы
+def view_size(view):
+    if isinstance(view, str):
+        return sys.getsizeof(view)
+    return view.size()
+
+
+# Кэш отрисованных ответов по пользователям.
+# Пользователи вытесняются в порядке давности обращения (LRU), когда
+# суммарный размер текстов превышает max_bytes. Любое изменение данных
+# пользователя в хранилище сбрасывает все его ответы. Страницы,
+# достроенные при листании, добавляются к размеру.
+class ViewCache:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._users = OrderedDict()  # user_id -> {имя: текст}
+        self._bytes = 0
+        # Растёт при каждом сбросе: ответ, собранный во время изменения
+        # данных, в кэш не попадает
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # Ответ name; при промахе он строится через build(), который
+    # загружает данные пользователя и возвращает строку или Pages
+    async def get(self, user_id, name, build):
+        views = self._users.get(user_id)
+        if views is not None and name in views:
+            self._users.move_to_end(user_id)
+            self.hits += 1
+            return views[name]
+
+        self.misses += 1
+        generation = self._generation
+        text = await build()
+        if generation == self._generation:
+            self._put(user_id, name, text)
+        return text
+
+    def _put(self, user_id, name, text):
+        size = view_size(text)
+        if size > self.max_bytes:
+            return
+        views = self._users.setdefault(user_id, {})
+        if name in views:
+            self._bytes -= view_size(views[name])
+        views[name] = text
+        self._bytes += size
+        self._users.move_to_end(user_id)
+        if isinstance(text, Pages):
+            text.on_grow = lambda grown: self._grow(user_id, name, text, grown)
+        self._evict()
+
+    def _grow(self, user_id, name, pages, size):
+        # Ответ мог уже уйти из кэша
+        if self._users.get(user_id, {}).get(name) is pages:
+            self._bytes += size
+            self._evict()
+
+    def _evict(self):
+        while self._bytes > self.max_bytes:
+            _, evicted = self._users.popitem(last=False)
+            self._bytes -= sum(view_size(text) for text in evicted.values())
+            self.evictions += 1
+
+    # Подписчик хранилища: дата не важна, все ответы зависят от всех дат
+    def invalidate(self, user_id, date_ord=None, count=0):
+        self._generation += 1
+        views = self._users.pop(user_id, None)
+        if views is not None:
+            self._bytes -= sum(view_size(text) for text in views.values())
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'users': len(self._users),
+            'bytes': self._bytes,
+        }
+
+
+views = ViewCache(VIEW_CACHE_BYTES)
+store.add_listener(views.invalidate)
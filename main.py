@@ -1,20 +1,116 @@
-from os import getenv
 import asyncio
 from aiogram import Bot, Dispatcher
-from dotenv import load_dotenv
-from handlers.routes import router
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+from config import (
+    TOKEN, API_URL, MAX_CONCURRENT_UPDATES, BOT_MODE,
+    WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_URL, WEBHOOK_SECRET,
+    METRICS_HOST, METRICS_PORT, LOOP_LAG_INTERVAL, SLOW_UPDATE_MS, SLOW_UPDATE_LOG,
+    ARCHIVE_AFTER_DAYS, ARCHIVE_INTERVAL, ARCHIVE_BATCH
+)
+from handlers.routes import buttons, router
+from handlers.views import views
+from metrics import Counter, Gauge, MetricsServer
+from middlewares.metrics import HandlerMetricsMiddleware
+from middlewares.user_lock import UserLockMiddleware
+from outbox import OutboxMiddleware, outbox
+from reminders import reminders
+from storage.archive import Archiver, cold_archive
+from storage.drafts import drafts
+from storage.fsm import fsm_storage
+from storage.store import store
 
-load_dotenv()
-TOKEN = getenv('BOT_TOKEN')
-
-dp = Dispatcher()
+# Состояния диалогов переживают перезапуск бота
+dp = Dispatcher(storage=fsm_storage)
+# Обновления разных пользователей обрабатываются параллельно,
+# одного пользователя - по очереди
+user_lock = UserLockMiddleware(MAX_CONCURRENT_UPDATES)
+dp.update.outer_middleware(user_lock)
 dp.include_router(router)
 
+# Время обработчиков по имени и состоянию FSM
+handler_metrics = HandlerMetricsMiddleware(buttons, SLOW_UPDATE_MS, SLOW_UPDATE_LOG)
+router.message.middleware(handler_metrics)
+router.callback_query.middleware(handler_metrics)
+
+# Перенос прошедших дат в архив под теми же блокировками пользователей,
+# что и обработка обновлений
+archiver = Archiver(store, cold_archive, user_lock.locks, ARCHIVE_AFTER_DAYS, ARCHIVE_INTERVAL, ARCHIVE_BATCH)
+
+metrics_server = MetricsServer(METRICS_HOST, METRICS_PORT, LOOP_LAG_INTERVAL)
+Gauge('bot_drafts', 'Незавершённые черновики', lambda: len(drafts))
+Gauge('bot_view_cache_bytes', 'Размер кэша готовых ответов', lambda: views.stats()['bytes'])
+Counter('bot_view_cache_hits_total', 'Ответов, взятых из кэша', lambda: views.hits)
+Counter('bot_view_cache_misses_total', 'Ответов, построенных заново', lambda: views.misses)
+Counter('bot_view_cache_evictions_total', 'Пользователей, вытесненных из кэша ответов', lambda: views.evictions)
+
+# Данные загружаются один раз при старте
+async def on_startup(bot: Bot):
+    await store.start()
+    await cold_archive.start()
+    await drafts.start()
+    await fsm_storage.start()
+    await metrics_server.start()
+    await outbox.start()
+    await reminders.start(bot)
+    await archiver.start()
+
+# Последний сброс несохранённых изменений на диск
+async def on_shutdown():
+    await archiver.close()
+    await reminders.close()
+    await outbox.close()
+    await metrics_server.close()
+    await fsm_storage.close()
+    await drafts.close()
+    await cold_archive.close()
+    await store.close()
+
+dp.startup.register(on_startup)
+dp.shutdown.register(on_shutdown)
+
+# Бот, обращающийся к Bot API по адресу API_URL.
+# Все сообщения в чаты проходят через очередь отправки.
+def create_bot(session=None):
+    if session is None:
+        session = AiohttpSession(api=TelegramAPIServer.from_base(API_URL))
+    session.middleware(OutboxMiddleware(outbox))
+    return Bot(token=TOKEN, session=session)
+
+# Регистрация webhook в Telegram
+async def on_webhook_startup(bot: Bot):
+    if WEBHOOK_URL:
+        await bot.set_webhook(f"{WEBHOOK_URL}{WEBHOOK_PATH}", secret_token=WEBHOOK_SECRET)
+
 async def main():
-    bot = Bot(token=TOKEN)
+    bot = create_bot()
 
     print("Bot is starting...")
-    await dp.start_polling(bot)
+    await dp.start_polling(bot, handle_as_tasks=True)
+
+# Режим webhook: Telegram сам присылает обновления POST-запросами.
+# Ответ 200 отправляется сразу, обновление обрабатывается в фоне.
+def main_webhook():
+    bot = create_bot()
+    dp.startup.register(on_webhook_startup)
+
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=WEBHOOK_SECRET,
+        handle_in_background=True
+    ).register(app, path=WEBHOOK_PATH)
+    # Запуск и остановка приложения вызывают on_startup/on_shutdown диспетчера
+    setup_application(app, dp, bot=bot)
+
+    print(f"Bot is starting (webhook on {WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH})...")
+    web.run_app(app, host=WEBHOOK_HOST, port=WEBHOOK_PORT)
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    if BOT_MODE == 'webhook':
+        main_webhook()
+    else:
+        asyncio.run(main())
@@ -0,0 +1,205 @@
+import asyncio
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from aiohttp import web
+
+
+# Метрики бота в текстовом формате Prometheus.
+# Счётчики и гистограммы можно обновлять и из потоков хранилища,
+# поэтому изменения защищены блокировкой.
+#
+#   HANDLER_SECONDS.observe(0.004, handler='cmd_start', state='')
+#   STORAGE_BYTES.inc(512, file='journal', direction='write')
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for value in labels.values())
+    return '{' + ','.join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + '}'
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.append(self)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_value(dict(key), value))
+        return lines
+
+    def _render_value(self, labels, value):
+        return [f"{self.name}{format_labels(labels)} {value}"]
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    # func() - счётчик, который ведётся в другом месте, читается
+    # в момент выгрузки метрик
+    def __init__(self, name, help_text, func=None):
+        super().__init__(name, help_text)
+        self.func = func
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.items())
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        if self.func is not None:
+            value = self.func()
+            with self._lock:
+                self._values[()] = value
+        return super().render()
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    # func() вычисляет значение в момент выгрузки метрик
+    def __init__(self, name, help_text, func=None):
+        super().__init__(name, help_text)
+        self.func = func
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[tuple(labels.items())] = value
+
+    def render(self):
+        if self.func is not None:
+            self.set(self.func())
+        return super().render()
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text)
+        self.buckets = tuple(buckets)
+
+    # Значение: [счётчики по корзинам..., +Inf], сумма
+    def observe(self, value, **labels):
+        key = tuple(labels.items())
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def _render_value(self, labels, value):
+        counts, total = value
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + ('+Inf',), counts):
+            cumulative += count
+            lines.append(f"{self.name}_bucket{format_labels({**labels, 'le': bound})} {cumulative}")
+        lines.append(f"{self.name}_sum{format_labels(labels)} {total}")
+        lines.append(f"{self.name}_count{format_labels(labels)} {cumulative}")
+        return lines
+
+
+registry = []
+
+def render():
+    lines = []
+    for metric in registry:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+HANDLER_SECONDS = Histogram('bot_handler_seconds', 'Время обработчика')
+HANDLER_ERRORS = Counter('bot_handler_errors_total', 'Исключения в обработчиках')
+SLOW_UPDATES = Counter('bot_slow_updates_total', 'Обновления дольше SLOW_UPDATE_MS')
+STORAGE_SECONDS = Histogram('bot_storage_seconds', 'Время операций хранилища')
+STORAGE_ERRORS = Counter('bot_storage_errors_total', 'Ошибки записи хранилища')
+STORAGE_BYTES = Counter('bot_storage_bytes_total', 'Байт прочитано и записано хранилищем')
+LOOP_LAG = Histogram('bot_event_loop_lag_seconds', 'Опоздание цикла событий',
+                     (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5))
+
+
+# Операции хранилища, выполненные в рамках текущего обновления:
+# [(операция, секунды), ...] или None, если обновление не отслеживается
+storage_spans = ContextVar('storage_spans', default=None)
+
+def time_storage(storage, names):
+    for name in names:
+        setattr(storage, name, _timed(getattr(storage, name), name))
+
+def _timed(method, name):
+    async def timed(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await method(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            STORAGE_SECONDS.observe(elapsed, op=name)
+            spans = storage_spans.get()
+            if spans is not None:
+                spans.append((name, round(elapsed * 1000, 3)))
+    timed.__name__ = name
+    return timed
+
+
+# Фоновая задача: раз в interval секунд замеряет, насколько позже
+# запланированного проснулся цикл событий
+async def sample_loop_lag(interval):
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        LOOP_LAG.observe(max(0.0, loop.time() - started - interval))
+
+
+# Локальный HTTP-сервер с /metrics
+class MetricsServer:
+    def __init__(self, host, port, lag_interval):
+        self.host = host
+        self.port = port
+        self.lag_interval = lag_interval
+        self._runner = None
+        self._lag_task = None
+
+    async def handle(self, request):
+        return web.Response(text=render(), content_type='text/plain', charset='utf-8',
+                            headers={'X-Prometheus-Format': '0.0.4'})
+
+    async def start(self):
+        self._lag_task = asyncio.create_task(sample_loop_lag(self.lag_interval))
+        if not self.port:
+            return
+        app = web.Application()
+        app.router.add_get('/metrics', self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+
+    async def close(self):
+        if self._lag_task is not None:
+            self._lag_task.cancel()
+            try:
+                await self._lag_task
+            except asyncio.CancelledError:
+                pass
+            self._lag_task = None
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
@@ -0,0 +1,66 @@
+import json
+import time
+
+from aiogram import BaseMiddleware
+
+from metrics import HANDLER_ERRORS, HANDLER_SECONDS, SLOW_UPDATES, storage_spans
+from storage.io import run_io
+
+
+# Время каждого обработчика с меткой имени обработчика и состояния FSM,
+# в котором пришло обновление. Подключается как внутренний middleware
+# роутера, когда обработчик уже выбран.
+#
+# Обновления дольше slow_ms (если задано) записываются в slow_log одной
+# строкой JSON: само обновление, обработчик, состояние и операции
+# хранилища, выполненные за время обработки, с их длительностью.
+class HandlerMetricsMiddleware(BaseMiddleware):
+    def __init__(self, buttons, slow_ms=0, slow_log=None):
+        self.buttons = buttons
+        self.slow_ms = slow_ms
+        self.slow_log = slow_log
+
+    # Имя настоящего обработчика: нажатия кнопок проходят через
+    # общий dispatch_button, поэтому смотрим в таблицу кнопок
+    def handler_name(self, event, data):
+        text = getattr(event, 'text', None)
+        if text is not None and text in self.buttons:
+            return self.buttons.handler_for(text).__name__
+        return data['handler'].callback.__name__
+
+    async def __call__(self, handler, event, data):
+        name = self.handler_name(event, data)
+        state = data.get('raw_state') or ''
+        spans = []
+        token = storage_spans.set(spans)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.inc(handler=name, state=state)
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            storage_spans.reset(token)
+            HANDLER_SECONDS.observe(elapsed, handler=name, state=state)
+            if self.slow_ms and elapsed * 1000 >= self.slow_ms:
+                SLOW_UPDATES.inc(handler=name)
+                await self.log_slow(event, name, state, elapsed, spans)
+
+    async def log_slow(self, event, name, state, elapsed, spans):
+        record = {
+            'time': int(time.time()),
+            'handler': name,
+            'state': state,
+            'ms': round(elapsed * 1000, 3),
+            'storage': spans,
+            'event': event.model_dump(mode='json', exclude_none=True),
+        }
+        print(f"Медленное обновление: {name} ({state or 'без состояния'}) {record['ms']} мс")
+        if self.slow_log:
+            await run_io(self._append, json.dumps(record, ensure_ascii=False) + '\n')
+
+    # Выполняется в потоке ввода-вывода
+    def _append(self, line):
+        with open(self.slow_log, 'a', encoding='utf-8') as f:
+            f.write(line)
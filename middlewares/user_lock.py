@@ -0,0 +1,53 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+from aiogram import BaseMiddleware
+
+
+# Блокировки по пользователям. Запись удаляется, как только
+# её никто не держит и не ждёт, поэтому память не растёт.
+class UserLocks:
+    def __init__(self):
+        self._locks = {}
+
+    @asynccontextmanager
+    async def hold(self, user_id):
+        entry = self._locks.get(user_id)
+        if entry is None:
+            entry = self._locks[user_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[user_id]
+
+    def __len__(self):
+        return len(self._locks)
+
+
+# Обновления одного пользователя обрабатываются строго по очереди
+# (состояние FSM и чтение-изменение-запись его данных не пересекаются),
+# а обновления разных пользователей - параллельно, но не больше max_concurrent.
+class UserLockMiddleware(BaseMiddleware):
+    def __init__(self, max_concurrent):
+        self.locks = UserLocks()
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+
+    async def __call__(self, handler, event, data):
+        user = data.get('event_from_user')
+        if user is None:
+            async with self._semaphore:
+                return await handler(event, data)
+
+        async with self.locks.hold(user.id):
+            # FSMContextMiddleware читает состояние раньше, чем взята
+            # блокировка; перечитываем его, чтобы фильтры состояний видели
+            # результат предыдущего обновления этого пользователя
+            state = data.get('state')
+            if state is not None:
+                data['raw_state'] = await state.get_state()
+            async with self._semaphore:
+                return await handler(event, data)
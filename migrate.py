@@ -0,0 +1,71 @@
+import argparse
+import asyncio
+import itertools
+import json
+import os
+
+from config import DATA_FILE, SQLITE_FILE, SNAPSHOT_FILE
+from storage.base import decode_user, max_task_id
+
+
+# Однократный перенос homework_data.json в базу SQLite или в двоичный
+# снимок режима snapshot:
+#   python migrate.py [файл.json]
+#   python migrate.py --to snapshot [файл.json]
+async def to_sqlite(all_data):
+    from storage.sqlite import SqliteStorage
+
+    # Старый и новый форматы читаются одинаково, id назначит база
+    ids = itertools.count(1)
+    all_data = {user_id: decode_user(raw_user, ids) for user_id, raw_user in all_data.items()}
+
+    storage = SqliteStorage(SQLITE_FILE)
+    await storage.start()
+    try:
+        await storage.import_users(all_data)
+    finally:
+        await storage.close()
+
+    print(f"Перенесено пользователей: {len(all_data)} -> {SQLITE_FILE}")
+
+def to_snapshot(all_data):
+    from storage.compact import UserTasks
+    from storage.snapshot import convert
+
+    # Журнал относится к прежнему снимку и поверх нового не проигрывается
+    journal_path = SNAPSHOT_FILE + '.journal'
+    if os.path.exists(journal_path):
+        print(f"Снимок {SNAPSHOT_FILE} уже используется ботом (есть {journal_path})")
+        return
+
+    # Заданиям старого формата выдаём id после уже существующих
+    max_id = max_task_id(all_data)
+    ids = itertools.count(max_id + 1)
+    users = {user_id: UserTasks(decode_user(raw_user, ids)) for user_id, raw_user in all_data.items()}
+    users = {user_id: user for user_id, user in users.items() if len(user.dates)}
+    count = convert(users, SNAPSHOT_FILE, max(max_id, max((user.max_id() for user in users.values()), default=0)))
+    print(f"Перенесено пользователей: {count} -> {SNAPSHOT_FILE}")
+
+async def main(path, target):
+    if not os.path.exists(path):
+        print(f"Файл {path} не найден")
+        return
+
+    with open(path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    all_data = json.loads(content) if content.strip() else {}
+    # Снимок режима journal
+    if 'users' in all_data and 'seq' in all_data:
+        all_data = all_data['users']
+
+    if target == 'snapshot':
+        to_snapshot(all_data)
+    else:
+        await to_sqlite(all_data)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('path', nargs='?', default=DATA_FILE)
+    parser.add_argument('--to', choices=['sqlite', 'snapshot'], default='sqlite')
+    args = parser.parse_args()
+    asyncio.run(main(args.path, args.to))
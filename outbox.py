@@ -0,0 +1,314 @@
+import asyncio
+import heapq
+import itertools
+from collections import deque
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendMessage
+
+from config import SEND_RATE, SEND_CHAT_RATE, SEND_CHAT_BURST, SEND_CONCURRENCY
+from handlers.views import MESSAGE_LIMIT, message_length
+from metrics import Counter, Gauge, Histogram
+
+
+# Приоритеты: ответы на действия пользователя обгоняют массовые рассылки
+INTERACTIVE = 0
+BULK = 1
+
+OUTBOX_WAIT = Histogram('bot_outbox_wait_seconds', 'Ожидание сообщения в очереди отправки',
+                        (0.001, 0.01, 0.05, 0.1, 0.5, 1, 2, 5, 10, 30, 60))
+OUTBOX_SENT = Counter('bot_outbox_sent_total', 'Отправлено запросов из очереди')
+OUTBOX_COALESCED = Counter('bot_outbox_coalesced_total', 'Сообщений, склеенных с предыдущими')
+OUTBOX_RETRY_AFTER = Counter('bot_outbox_retry_after_total', 'Ответов 429 с retry_after')
+
+
+# Ведро токенов: rate токенов в секунду, не больше burst про запас.
+# rate=0 - без ограничения.
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = 0.0
+        self.paused_until = 0.0
+
+    def _refill(self, now):
+        if self.rate:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    # Через сколько секунд появится токен
+    def delay(self, now):
+        if now < self.paused_until:
+            return self.paused_until - now
+        if not self.rate:
+            return 0.0
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now):
+        if self.rate:
+            self._refill(now)
+            self.tokens -= 1
+
+    # Telegram попросил подождать retry_after секунд
+    def pause(self, now, seconds):
+        self.paused_until = max(self.paused_until, now + seconds)
+
+
+class Outgoing:
+    __slots__ = ('request', 'bot', 'method', 'priority', 'coalesce', 'future', 'queued')
+
+    def __init__(self, request, bot, method, priority, coalesce, future, queued):
+        self.request = request
+        self.bot = bot
+        self.method = method
+        self.priority = priority
+        self.coalesce = coalesce
+        self.future = future
+        self.queued = queued
+
+
+class ChatQueue:
+    __slots__ = ('items', 'bucket', 'entry', 'entry_priority', 'busy')
+
+    def __init__(self, bucket):
+        self.items = deque()
+        self.bucket = bucket
+        self.entry = None  # номер актуальной записи в очереди планировщика
+        self.entry_priority = None
+        self.busy = False  # запрос в этот чат уже выполняется
+
+    def priority(self):
+        return min(item.priority for item in self.items)
+
+
+# Склеить текст сообщений с общим хвостом coalesce
+def merge_texts(texts, tail):
+    bodies = [text.removesuffix(tail).rstrip('\n') for text in texts]
+    return '\n'.join(bodies) + '\n\n' + tail
+
+def can_merge(first, item):
+    return (item.coalesce == first.coalesce
+            and isinstance(item.method, SendMessage)
+            and item.method.parse_mode == first.method.parse_mode)
+
+
+# Очередь исходящих запросов к Bot API.
+# Сообщения в один чат уходят строго по порядку и не чаще SEND_CHAT_RATE
+# в секунду (с запасом SEND_CHAT_BURST), все вместе - не чаще SEND_RATE.
+# Ответ 429 приостанавливает чат на retry_after, запрос повторяется.
+# Среди чатов, готовых к отправке, первым обслуживается чат с более
+# срочным сообщением. Подтверждения, ждущие в очереди одного чата
+# (post(..., coalesce=хвост)), уходят одним сообщением.
+class Outbox:
+    def __init__(self, rate, chat_rate, chat_burst, concurrency):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self._global = TokenBucket(rate, max(1, rate))
+        self._slots = asyncio.Semaphore(concurrency)
+        self._chats = {}
+        self._ready = []    # (приоритет, номер, chat_id)
+        self._waiting = []  # (время, номер, chat_id)
+        self._seq = itertools.count()
+        self._depth = 0
+        self._inflight = set()
+        self._wakeup = None
+        self._task = None
+
+    def __len__(self):
+        return self._depth
+
+    # Поставить запрос в очередь. Ждать результата не обязательно:
+    # ошибка доставки будет записана в будущий результат.
+    def post(self, bot, method, priority=BULK, coalesce=None):
+        return self.submit(bot.session.make_request, bot, method, priority, coalesce)
+
+    def submit(self, request, bot, method, priority=INTERACTIVE, coalesce=None):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        # Ошибку может никто не забрать, не засоряем журнал
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+
+        chat_id = method.chat_id
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            chat = self._chats[chat_id] = ChatQueue(TokenBucket(self.chat_rate, self.chat_burst))
+        chat.items.append(Outgoing(request, bot, method, priority, coalesce, future, loop.time()))
+        self._depth += 1
+
+        # Более срочное сообщение поднимает чат в очереди планировщика
+        if not chat.busy and (chat.entry is None or priority < chat.entry_priority):
+            self._schedule(chat_id, chat, loop.time())
+        return future
+
+    # Записать чат в очередь планировщика; старые записи чата
+    # становятся недействительными
+    def _schedule(self, chat_id, chat, now):
+        chat.entry = next(self._seq)
+        chat.entry_priority = chat.priority()
+        delay = chat.bucket.delay(now)
+        if delay:
+            heapq.heappush(self._waiting, (now + delay, chat.entry, chat_id))
+        else:
+            heapq.heappush(self._ready, (chat.entry_priority, chat.entry, chat_id))
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            now = loop.time()
+            while self._waiting and self._waiting[0][0] <= now:
+                _, entry, chat_id = heapq.heappop(self._waiting)
+                chat = self._chats.get(chat_id)
+                if chat is not None and chat.entry == entry:
+                    chat.entry_priority = chat.priority()
+                    heapq.heappush(self._ready, (chat.entry_priority, entry, chat_id))
+
+            if not self._ready:
+                timeout = self._waiting[0][0] - now if self._waiting else None
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            delay = self._global.delay(now)
+            if delay:
+                await asyncio.sleep(delay)
+                continue
+
+            priority, entry, chat_id = heapq.heappop(self._ready)
+            chat = self._chats.get(chat_id)
+            if chat is None or chat.entry != entry:
+                continue
+            # Чат мог дождаться своей очереди, но его ведро уже пусто
+            if chat.bucket.delay(now):
+                self._schedule(chat_id, chat, now)
+                continue
+
+            await self._slots.acquire()
+            now = loop.time()
+            self._global.take(now)
+            chat.bucket.take(now)
+            chat.entry = None
+            chat.busy = True
+            task = asyncio.create_task(self._deliver(chat_id, chat, self._take(chat)))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    # Первый запрос чата и подтверждения, которые можно к нему приклеить
+    def _take(self, chat):
+        first = chat.items.popleft()
+        items = [first]
+        if first.coalesce is not None and isinstance(first.method, SendMessage):
+            length = message_length(first.method.text)
+            while chat.items and can_merge(first, chat.items[0]):
+                length += message_length(chat.items[0].method.text)
+                if length > MESSAGE_LIMIT:
+                    break
+                items.append(chat.items.popleft())
+        self._depth -= len(items)
+        return items
+
+    async def _deliver(self, chat_id, chat, items):
+        loop = asyncio.get_running_loop()
+        first = items[0]
+        method = first.method
+        if len(items) > 1:
+            method = method.model_copy(update={
+                'text': merge_texts([item.method.text for item in items], first.coalesce),
+                'reply_markup': items[-1].method.reply_markup,
+            })
+
+        try:
+            result = await first.request(first.bot, method)
+        except TelegramRetryAfter as e:
+            OUTBOX_RETRY_AFTER.inc()
+            # Повторим те же запросы первыми, когда Telegram разрешит
+            chat.bucket.pause(loop.time(), e.retry_after)
+            chat.items.extendleft(reversed(items))
+            self._depth += len(items)
+        except Exception as e:
+            for item in items:
+                if not item.future.done():
+                    item.future.set_exception(e)
+        else:
+            OUTBOX_SENT.inc()
+            OUTBOX_COALESCED.inc(len(items) - 1)
+            for item in items:
+                OUTBOX_WAIT.observe(loop.time() - item.queued, priority=item.priority)
+                if not item.future.done():
+                    item.future.set_result(result)
+        finally:
+            self._slots.release()
+            chat.busy = False
+            if chat.items:
+                self._schedule(chat_id, chat, loop.time())
+            else:
+                del self._chats[chat_id]
+
+    @property
+    def running(self):
+        return self._task is not None
+
+    def stats(self):
+        return {'depth': self._depth, 'chats': len(self._chats), 'inflight': len(self._inflight)}
+
+    async def start(self):
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    # Дождаться отправки всего, что уже в очереди (не дольше timeout секунд)
+    async def close(self, timeout=10):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while self._chats and loop.time() < deadline:
+            await asyncio.sleep(0.05)
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            self._wakeup = None
+
+
+# Одно сообщение многим чатам (рассылка классу). В очереди отправки
+# одновременно не больше concurrency сообщений рассылки, поэтому
+# большая рассылка не вытесняет остальные массовые сообщения.
+# Возвращает, скольким чатам сообщение доставлено.
+async def broadcast(bot, chat_ids, text, concurrency):
+    slots = asyncio.Semaphore(concurrency)
+
+    async def send(chat_id):
+        async with slots:
+            try:
+                await outbox.post(bot, SendMessage(chat_id=chat_id, text=text), priority=BULK)
+                return True
+            except Exception as e:
+                print(f"Ошибка при рассылке {chat_id}: {e}")
+                return False
+
+    return sum(await asyncio.gather(*(send(chat_id) for chat_id in chat_ids)))
+
+
+# Все запросы бота, адресованные чату, идут через очередь отправки
+# с приоритетом INTERACTIVE; остальные (getUpdates, answerCallbackQuery)
+# выполняются сразу. Пока очередь не запущена, запросы идут напрямую.
+class OutboxMiddleware(BaseRequestMiddleware):
+    def __init__(self, outbox):
+        self.outbox = outbox
+
+    async def __call__(self, make_request, bot, method):
+        if getattr(method, 'chat_id', None) is None or not self.outbox.running:
+            return await make_request(bot, method)
+        return await self.outbox.submit(make_request, bot, method)
+
+
+outbox = Outbox(SEND_RATE, SEND_CHAT_RATE, SEND_CHAT_BURST, SEND_CONCURRENCY)
+Gauge('bot_outbox_depth', 'Запросов в очереди отправки', lambda: len(outbox))
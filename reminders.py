@@ -0,0 +1,206 @@
+import asyncio
+import heapq
+import json
+import os
+import time
+from datetime import date, datetime, time as day_time
+
+from aiogram.methods import SendMessage
+
+from config import REMINDER_HOUR, REMINDER_DAYS_BEFORE, REMINDER_CONCURRENCY, REMINDERS_FILE
+from metrics import Counter, Gauge
+from outbox import BULK, outbox
+from storage.base import ordinal_to_date, render_tasks
+from storage.io import run_io
+from storage.store import store
+
+REMINDERS_SENT = Counter('bot_reminders_sent_total', 'Отправлено напоминаний')
+
+
+# Напоминания о заданиях: за REMINDER_DAYS_BEFORE дней до даты в
+# REMINDER_HOUR часов (по времени сервера) пользователю приходит список.
+#
+# Ближайшие напоминания лежат в куче (время, user_id, дата). Куча
+# обновляется по уведомлениям хранилища: новая дата добавляет событие,
+# опустевшая - снимает его (запись в куче остаётся и пропускается при
+# извлечении). Планировщик спит до ближайшего события, поэтому работа
+# на каждом шаге зависит от числа наступивших событий, а не от числа
+# пользователей. При запуске куча строится из будущих дат хранилища.
+class Reminders:
+    def __init__(self, storage, hour, days_before, concurrency, path):
+        self.storage = storage
+        self.hour = hour
+        self.days_before = days_before
+        self.path = path
+        self._heap = []
+        self._events = {}  # user_id -> {дата: время напоминания}
+        self._count = 0
+        self._muted = set()  # пользователи, отключившие напоминания
+        self._slots = asyncio.Semaphore(concurrency)
+        self._wakeup = None
+        self._task = None
+        self._bot = None
+        self._sending = set()
+        storage.add_listener(self.on_change)
+
+    @property
+    def enabled(self):
+        return self.hour >= 0
+
+    def __len__(self):
+        return self._count
+
+    # Время напоминания о дате (unix time)
+    def due(self, date_ord):
+        day = date.fromordinal(date_ord - self.days_before)
+        return datetime.combine(day, day_time(self.hour)).timestamp()
+
+    def _add(self, user_id, date_ord, now):
+        due = self.due(date_ord)
+        # Время напоминания уже прошло
+        if due < now:
+            return
+        user_events = self._events.setdefault(user_id, {})
+        if date_ord not in user_events:
+            self._count += 1
+        user_events[date_ord] = due
+        heapq.heappush(self._heap, (due, user_id, date_ord))
+        if self._wakeup is not None and self._heap[0][0] == due:
+            self._wakeup.set()
+
+    def _remove(self, user_id, date_ord):
+        user_events = self._events.get(user_id)
+        if user_events is None:
+            return
+        if date_ord is None:
+            self._count -= len(user_events)
+            del self._events[user_id]
+            return
+        if user_events.pop(date_ord, None) is not None:
+            self._count -= 1
+            if not user_events:
+                del self._events[user_id]
+
+    # Подписчик хранилища
+    def on_change(self, user_id, date_ord, count):
+        if not self.enabled or self._task is None:
+            return
+        if count:
+            if date_ord not in self._events.get(user_id, ()):
+                self._add(user_id, date_ord, time.time())
+        else:
+            self._remove(user_id, date_ord)
+
+    async def rebuild(self):
+        now = time.time()
+        # Даты, напоминание о которых ещё впереди
+        first = date.fromtimestamp(now).toordinal() + self.days_before
+        self._heap = []
+        self._events = {}
+        self._count = 0
+        for user_id, date_ord in await self.storage.dates_from(first):
+            due = self.due(date_ord)
+            if due >= now:
+                self._events.setdefault(user_id, {})[date_ord] = due
+                self._heap.append((due, user_id, date_ord))
+        self._count = len(self._heap)
+        heapq.heapify(self._heap)
+
+    # Извлечь наступившие события; устаревшие записи пропускаются
+    def _pop_due(self, now):
+        due_events = []
+        while self._heap and self._heap[0][0] <= now:
+            due, user_id, date_ord = heapq.heappop(self._heap)
+            if self._events.get(user_id, {}).get(date_ord) != due:
+                continue
+            self._remove(user_id, date_ord)
+            due_events.append((user_id, date_ord))
+        # Слишком много устаревших записей - пересобираем кучу
+        if len(self._heap) > 2 * self._count + 1024:
+            self._heap = [(due, user_id, date_ord) for user_id, user_events in self._events.items()
+                          for date_ord, due in user_events.items()]
+            heapq.heapify(self._heap)
+        return due_events
+
+    async def _run(self):
+        while True:
+            now = time.time()
+            for user_id, date_ord in self._pop_due(now):
+                if user_id in self._muted:
+                    continue
+                # Не больше REMINDER_CONCURRENCY напоминаний одновременно
+                await self._slots.acquire()
+                task = asyncio.create_task(self._send(user_id, date_ord))
+                self._sending.add(task)
+                task.add_done_callback(self._sending.discard)
+
+            timeout = self._heap[0][0] - time.time() if self._heap else None
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _send(self, user_id, date_ord):
+        try:
+            tasks = (await self.storage.get_user(user_id)).get(date_ord)
+            if not tasks:
+                return
+            when = "Завтра" if self.days_before == 1 else f"Через {self.days_before} дн."
+            await outbox.post(
+                self._bot,
+                SendMessage(chat_id=user_id, text=f"🔔 {when} ({ordinal_to_date(date_ord)}):\n\n{render_tasks(tasks)}"),
+                priority=BULK
+            )
+            REMINDERS_SENT.inc()
+        except Exception as e:
+            print(f"Ошибка при отправке напоминания {user_id}: {e}")
+        finally:
+            self._slots.release()
+
+    # Отключение напоминаний хранится отдельным маленьким файлом
+    async def mute(self, user_id, muted):
+        if muted:
+            self._muted.add(user_id)
+        else:
+            self._muted.discard(user_id)
+        await run_io(self._save_muted, sorted(self._muted))
+
+    def is_muted(self, user_id):
+        return user_id in self._muted
+
+    def _save_muted(self, muted):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(muted, f)
+        os.replace(tmp_path, self.path)
+
+    def _load_muted(self):
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return set(json.load(f))
+        return set()
+
+    async def start(self, bot):
+        if not self.enabled:
+            return
+        self._bot = bot
+        self._muted = await run_io(self._load_muted)
+        await self.rebuild()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._sending:
+            await asyncio.wait(self._sending)
+
+
+reminders = Reminders(store, REMINDER_HOUR, REMINDER_DAYS_BEFORE, REMINDER_CONCURRENCY, REMINDERS_FILE)
+Gauge('bot_reminders_scheduled', 'Запланированных напоминаний', lambda: len(reminders))
@@ -0,0 +1,145 @@
+import asyncio
+import multiprocessing
+import os
+import signal
+
+import aiohttp
+from aiohttp import web
+
+from config import (
+    TOKEN, API_URL, BOT_MODE, SHARDS,
+    WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_URL, WEBHOOK_SECRET
+)
+
+
+# Запуск бота в нескольких процессах.
+#
+# Главный процесс только принимает обновления (long polling или webhook)
+# и раскладывает их по очередям процессов-шардов: пользователь всегда
+# попадает в шард user_id % SHARDS. Поэтому обновления одного пользователя
+# обрабатываются по порядку одним процессом, и его состояние FSM и данные
+# живут только там. Каждый шард - обычный диспетчер из main.py со своим
+# файлом данных; общая у шардов только база классов.
+#
+#   SHARDS=4 python sharding.py
+
+
+# Пользователь, от которого пришло обновление
+def update_user_id(update):
+    for key, event in update.items():
+        if key != 'update_id' and isinstance(event, dict):
+            user = event.get('from') or event.get('user') or event.get('chat') or {}
+            return user.get('id', 0)
+    return 0
+
+
+# Процесс-шард
+def run_shard(index, queue):
+    # Остановку шарда инициирует главный процесс через очередь
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(shard_main(index, queue))
+
+async def shard_main(index, queue):
+    from main import create_bot, dp
+
+    bot = create_bot()
+    loop = asyncio.get_running_loop()
+    tasks = set()
+
+    await dp.emit_startup(bot=bot)
+    print(f"Shard {index} is ready")
+    try:
+        while True:
+            update = await loop.run_in_executor(None, queue.get)
+            if update is None:
+                break
+            task = asyncio.create_task(dp.feed_raw_update(bot, update))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.wait(tasks)
+    finally:
+        await dp.emit_shutdown(bot=bot)
+        await bot.session.close()
+
+
+# Главный процесс
+class Front:
+    def __init__(self, shards):
+        context = multiprocessing.get_context('spawn')
+        self.queues = [context.Queue() for _ in range(shards)]
+        self.processes = []
+        for index, queue in enumerate(self.queues):
+            # Номер шарда передаётся через окружение: по нему config
+            # выбирает файлы данных шарда
+            os.environ['SHARD_INDEX'] = str(index)
+            process = context.Process(target=run_shard, args=(index, queue), name=f'shard-{index}')
+            process.start()
+            self.processes.append(process)
+        os.environ.pop('SHARD_INDEX', None)
+
+    def route(self, update):
+        self.queues[update_user_id(update) % len(self.queues)].put(update)
+
+    def stop(self):
+        for queue in self.queues:
+            queue.put(None)
+        for process in self.processes:
+            process.join()
+
+    async def api(self, session, method, **params):
+        async with session.post(f"{API_URL}/bot{TOKEN}/{method}", json=params) as response:
+            return await response.json()
+
+    async def poll(self):
+        offset = None
+        timeout = aiohttp.ClientTimeout(total=60)
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            while True:
+                try:
+                    result = await self.api(session, 'getUpdates', offset=offset, timeout=30)
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    print(f"Ошибка при получении обновлений: {e}")
+                    await asyncio.sleep(1)
+                    continue
+                if not result.get('ok'):
+                    print(f"Ошибка при получении обновлений: {result.get('description')}")
+                    await asyncio.sleep(1)
+                    continue
+                for update in result['result']:
+                    self.route(update)
+                    offset = update['update_id'] + 1
+
+    async def handle_webhook(self, request):
+        if WEBHOOK_SECRET and request.headers.get('X-Telegram-Bot-Api-Secret-Token') != WEBHOOK_SECRET:
+            return web.Response(status=401)
+        self.route(await request.json())
+        return web.Response()
+
+    async def set_webhook(self, app):
+        if WEBHOOK_URL:
+            async with aiohttp.ClientSession() as session:
+                params = {'url': f"{WEBHOOK_URL}{WEBHOOK_PATH}"}
+                if WEBHOOK_SECRET:
+                    params['secret_token'] = WEBHOOK_SECRET
+                await self.api(session, 'setWebhook', **params)
+
+
+def main():
+    front = Front(SHARDS)
+    print(f"Bot is starting ({SHARDS} shards, {BOT_MODE})...")
+    try:
+        if BOT_MODE == 'webhook':
+            app = web.Application()
+            app.router.add_post(WEBHOOK_PATH, front.handle_webhook)
+            app.on_startup.append(front.set_webhook)
+            web.run_app(app, host=WEBHOOK_HOST, port=WEBHOOK_PORT)
+        else:
+            asyncio.run(front.poll())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        front.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+import asyncio
+import json
+import sqlite3
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+from config import ARCHIVE_FILE
+from metrics import STORAGE_BYTES, STORAGE_ERRORS, STORAGE_SECONDS, Counter
+from storage.base import Task
+
+ARCHIVED_DATES = Counter('bot_archived_dates_total', 'Дат перенесено в архив')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS archive (
+    user_id  INTEGER NOT NULL,
+    date_ord INTEGER NOT NULL,
+    tasks    BLOB    NOT NULL,
+    PRIMARY KEY (user_id, date_ord)
+) WITHOUT ROWID;
+"""
+
+
+def pack_tasks(tasks):
+    return zlib.compress(json.dumps([[task.id, task.text, task.created] for task in tasks],
+                                    ensure_ascii=False).encode('utf-8'))
+
+def unpack_tasks(blob):
+    return [Task(*item) for item in json.loads(zlib.decompress(blob))]
+
+
+# Холодный архив прошедших дат: отдельная база SQLite, одна сжатая
+# запись на (пользователь, дата). Читается только по запросу /archive,
+# поэтому в памяти бота прошлые даты не лежат.
+class ColdArchive:
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='archive')
+
+    def _run(self, func, *args):
+        return asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def open(self):
+        self._conn = sqlite3.connect(self.path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        with self._conn:
+            self._conn.executescript(SCHEMA)
+
+    def shutdown(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    async def start(self):
+        await self._run(self.open)
+
+    async def close(self):
+        await self._run(self.shutdown)
+        self._executor.shutdown()
+
+    # Дата могла попасть в архив раньше (её снова заполнили после
+    # переноса) - задания дописываются к уже сохранённым
+    def _put(self, user_id, user_data):
+        written = 0
+        with self._conn:
+            for date_ord, tasks in user_data.items():
+                row = self._conn.execute(
+                    "SELECT tasks FROM archive WHERE user_id = ? AND date_ord = ?", (user_id, date_ord)
+                ).fetchone()
+                if row is not None:
+                    archived = unpack_tasks(row[0])
+                    ids = {task.id for task in archived}
+                    tasks = archived + [task for task in tasks if task.id not in ids]
+                blob = pack_tasks(tasks)
+                written += len(blob)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO archive (user_id, date_ord, tasks) VALUES (?, ?, ?)",
+                    (user_id, date_ord, blob)
+                )
+        STORAGE_BYTES.inc(written, file='archive', direction='write')
+
+    def _get_user(self, user_id):
+        user_data = {}
+        read = 0
+        for date_ord, blob in self._conn.execute(
+            "SELECT date_ord, tasks FROM archive WHERE user_id = ?", (user_id,)
+        ):
+            read += len(blob)
+            user_data[date_ord] = unpack_tasks(blob)
+        STORAGE_BYTES.inc(read, file='archive', direction='read')
+        return user_data
+
+    async def put(self, user_id, user_data):
+        return await self._run(self._put, int(user_id), user_data)
+
+    # Все архивные задания пользователя: {дата: [Task, ...]}
+    async def get_user(self, user_id):
+        return await self._run(self._get_user, int(user_id))
+
+
+# Перенос дат старше days дней из хранилища (SharedStorage) в архив.
+# Раз в interval секунд пользователи проверяются пачками по batch,
+# между пачками цикл событий обслуживает обновления. Данные
+# пользователя переносятся под его блокировкой, чтобы не потерять
+# задание, добавленное в ту же дату во время переноса.
+class Archiver:
+    def __init__(self, storage, archive, locks, days, interval, batch):
+        self.storage = storage
+        self.archive = archive
+        self.locks = locks
+        self.days = days
+        self.interval = interval
+        self.batch = batch
+        self._task = None
+
+    async def archive_user(self, user_id, cutoff):
+        async with self.locks.hold(user_id):
+            user_data = await self.storage.get_user(user_id)
+            # Дату с заданиями класса (их могли опубликовать задним числом
+            # после переноса классов) сначала перенесёт archive_classes,
+            # иначе общие задания попали бы в архив каждого участника
+            shared = self.storage.class_dates(user_id)
+            old = {date_ord: user_data[date_ord] for date_ord in user_data
+                   if date_ord < cutoff and date_ord not in shared}
+            if not old:
+                return 0
+            # Сначала запись в архив, потом удаление: при сбое между ними
+            # дата останется в обоих местах, а не пропадёт
+            await self.archive.put(user_id, old)
+            await asyncio.gather(*(self.storage.clear_date(user_id, date_ord) for date_ord in old))
+        ARCHIVED_DATES.inc(len(old))
+        return len(old)
+
+    async def run_once(self):
+        started = time.perf_counter()
+        cutoff = date.today().toordinal() - self.days
+        # Общие задания классов переносятся один раз на класс, а не
+        # копией каждому участнику; после этого у участников остаются
+        # только личные задания за прошедшие даты
+        moved = await self.storage.archive_classes(cutoff)
+        ARCHIVED_DATES.inc(moved)
+        user_ids = await self.storage.users_before(cutoff)
+        for start in range(0, len(user_ids), self.batch):
+            for user_id in user_ids[start:start + self.batch]:
+                moved += await self.archive_user(user_id, cutoff)
+            await asyncio.sleep(0)
+        STORAGE_SECONDS.observe(time.perf_counter() - started, op='archive')
+        return moved
+
+    async def _loop(self):
+        while True:
+            try:
+                moved = await self.run_once()
+                if moved:
+                    print(f"В архив перенесено дат: {moved}")
+            except Exception as e:
+                STORAGE_ERRORS.inc(op='archive')
+                print(f"Ошибка при переносе в архив: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def start(self):
+        if self.days > 0:
+            self._task = asyncio.create_task(self._loop())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+cold_archive = ColdArchive(ARCHIVE_FILE)
@@ -0,0 +1,148 @@
+import asyncio
+from dataclasses import dataclass
+from datetime import date
+from functools import lru_cache
+import itertools
+import re
+
+
+# Одно задание. Номер задания не хранится - он вычисляется при выводе
+# по положению в списке за дату.
+@dataclass(frozen=True)
+class Task:
+    __slots__ = ('id', 'text', 'created')
+
+    id: int
+    text: str
+    created: int  # время создания, unix time (0 - неизвестно)
+
+
+# Перебор всех пользователей (dates_from, users_before) идёт пачками
+# по SCAN_BATCH: между пачками цикл событий обрабатывает обновления
+SCAN_BATCH = 1000
+
+async def in_batches(items, batch=SCAN_BATCH):
+    items = iter(items)
+    while chunk := list(itertools.islice(items, batch)):
+        yield chunk
+        await asyncio.sleep(0)
+
+
+# Дата "ДД.ММ.ГГГГ" <-> порядковый номер дня.
+# Принимает то же, что strptime("%d.%m.%Y"), но без его накладных
+# расходов; результаты запоминаются - пользователи вводят одни и те же даты.
+DATE_FORMAT = re.compile(r'(\d{1,2})\.(\d{1,2})\.(\d{4})')
+
+@lru_cache(maxsize=4096)
+def date_to_ordinal(date_str):
+    match = DATE_FORMAT.fullmatch(date_str)
+    if match is None:
+        raise ValueError(f"Неправильный формат даты: {date_str!r}")
+    day, month, year = map(int, match.groups())
+    return date(year, month, day).toordinal()
+
+@lru_cache(maxsize=4096)
+def ordinal_to_date(ordinal):
+    return date.fromordinal(ordinal).strftime("%d.%m.%Y")
+
+# Нумерованный список заданий для вывода
+def render_tasks(tasks):
+    return "\n".join(f"{i}. {task.text}" for i, task in enumerate(tasks, 1))
+
+
+# Старый формат: задания за дату хранились строкой "1. foo\n2. bar"
+LEGACY_NUMBER = re.compile(r'^\d+\. ')
+
+def split_legacy_tasks(tasks_text):
+    return [LEGACY_NUMBER.sub('', line, count=1) for line in tasks_text.strip().split('\n') if line]
+
+# Чтение данных пользователя из JSON (новый и старый форматы).
+# ids - счётчик для заданий старого формата, у которых нет id.
+def decode_user(raw_user, ids):
+    user = {}
+    for date_key, tasks in raw_user.items():
+        date_ord = date_to_ordinal(date_key) if '.' in date_key else int(date_key)
+        if isinstance(tasks, str):
+            user[date_ord] = [Task(next(ids), text, 0) for text in split_legacy_tasks(tasks)]
+        else:
+            user[date_ord] = [Task(*item) for item in tasks]
+    return user
+
+def encode_user(user):
+    return {str(date_ord): [[task.id, task.text, task.created] for task in tasks]
+            for date_ord, tasks in user.items()}
+
+# Наибольший id среди заданий нового формата
+def max_task_id(raw_users):
+    max_id = 0
+    for raw_user in raw_users.values():
+        for tasks in raw_user.values():
+            if not isinstance(tasks, str):
+                for item in tasks:
+                    max_id = max(max_id, item[0])
+    return max_id
+
+
+# Общий интерфейс хранилища заданий.
+# Все методы асинхронные: реализации сами решают, где выполнять
+# блокирующую работу, чтобы не останавливать цикл событий.
+# Даты передаются порядковыми номерами дня (date.toordinal()).
+class Storage:
+    _listeners = ()
+
+    # Подписка на изменения: func(user_id, date_ord, count) вызывается после
+    # каждого изменения данных пользователя; count - сколько заданий осталось
+    # за дату (0 - даты больше нет). date_ord=None - удалены все даты.
+    # Так кэши и индексы поверх хранилища узнают, что им пора обновиться.
+    def add_listener(self, func):
+        self._listeners = self._listeners + (func,)
+
+    def _changed(self, user_id, date_ord=None, count=0):
+        for func in self._listeners:
+            func(int(user_id), date_ord, count)
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    # Дождаться, пока уже сделанные изменения окажутся на диске
+    async def flush(self):
+        pass
+
+    # Все задания пользователя: {дата: [Task, ...]}
+    async def get_user(self, user_id):
+        raise NotImplementedError
+
+    # Заменить задания за дату
+    async def set_tasks(self, user_id, date_ord, items):
+        raise NotImplementedError
+
+    # Заменить задания за дату готовыми Task, сохранив их id и время
+    # создания (там, где хранилище само не назначает id)
+    async def put_tasks(self, user_id, date_ord, tasks):
+        raise NotImplementedError
+
+    # Добавить задания в конец списка за дату
+    async def append_tasks(self, user_id, date_ord, items):
+        raise NotImplementedError
+
+    # Удалить задание с номером number, вернуть удалённый Task
+    async def delete_task(self, user_id, date_ord, number):
+        raise NotImplementedError
+
+    async def clear_date(self, user_id, date_ord):
+        raise NotImplementedError
+
+    async def clear_all(self, user_id):
+        raise NotImplementedError
+
+    # Все пары (user_id, дата) с датой не раньше start
+    async def dates_from(self, start):
+        raise NotImplementedError
+
+    # Пользователи, у которых могут быть даты раньше end
+    # (реализация может вернуть и лишних)
+    async def users_before(self, end):
+        raise NotImplementedError
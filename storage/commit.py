@@ -0,0 +1,42 @@
+import asyncio
+
+
+# Групповая фиксация: операции разных пользователей накапливаются,
+# пока идёт предыдущая запись, и затем фиксируются одной записью.
+# write_batch(items) - корутина, возвращающая результат для каждого
+# элемента (исключение в списке результатов передаётся только его владельцу).
+class GroupCommit:
+    def __init__(self, write_batch):
+        self._write_batch = write_batch
+        self._pending = []
+        self._task = None
+
+    def submit(self, item):
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((item, future))
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        return future
+
+    async def _run(self):
+        try:
+            while self._pending:
+                batch, self._pending = self._pending, []
+                try:
+                    results = await self._write_batch([item for item, _ in batch])
+                except Exception as e:
+                    results = [e] * len(batch)
+                for (_, future), result in zip(batch, results):
+                    if future.done():
+                        continue
+                    if isinstance(result, Exception):
+                        future.set_exception(result)
+                    else:
+                        future.set_result(result)
+        finally:
+            self._task = None
+
+    # Дождаться фиксации всего, что уже поставлено в очередь
+    async def drain(self):
+        while self._task is not None:
+            await asyncio.shield(self._task)
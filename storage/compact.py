@@ -0,0 +1,190 @@
+import re
+from array import array
+from collections.abc import MutableMapping
+
+from storage.base import Task
+
+
+# Название предмета в начале задания ("Математика: ", "Англ. яз.: ").
+# Одни и те же предметы повторяются в тысячах заданий, поэтому вместо
+# префикса хранится его номер в общей таблице. Цифры в префиксе не
+# допускаются, чтобы "стр. 45: ..." и подобное не засоряли таблицу.
+SUBJECT = re.compile(r'[^\W\d_]+\.?(?: [^\W\d_]+\.?){0,3}: ?')
+
+# Номер 0 - задание без предмета
+_subjects = ['']
+_subject_codes = {}
+
+
+# Номер предмета в таблице; None - таблица заполнена
+def subject_code(prefix):
+    code = _subject_codes.get(prefix)
+    if code is None:
+        if len(_subjects) > 0xFFFF:
+            return None
+        code = _subject_codes[prefix] = len(_subjects)
+        _subjects.append(prefix)
+    return code
+
+# Копия таблицы предметов (номер -> префикс)
+def subject_table():
+    return list(_subjects)
+
+def split_subject(text):
+    match = SUBJECT.match(text)
+    if match is None:
+        return 0, text
+    code = subject_code(match.group())
+    if code is None:
+        # Таблица заполнена - префикс остаётся в тексте
+        return 0, text
+    return code, text[match.end():]
+
+
+# Все задания пользователя в компактном виде: вместо словаря дат со
+# списками объектов - столбцы чисел в массивах (дата, id, время создания,
+# номер предмета, конец текста) и одна строка со всеми текстами подряд.
+# Задания одной даты лежат подряд в порядке номеров.
+#
+# Объекты Task создаются только при чтении и только для нужной даты.
+# Пользователь не меняется на месте (его может записывать поток сброса):
+# изменение даты даёт нового пользователя, в котором заново разобраны
+# только задания этой даты, а столбцы остальных копируются срезами.
+class UserTasks:
+    __slots__ = ('dates', 'ids', 'created', 'subjects', 'ends', 'text')
+
+    # user_data - {дата: [Task, ...]}
+    def __init__(self, user_data):
+        dates, ids, created, subjects, ends, bodies = [], [], [], [], [], []
+        length = 0
+        for date_ord, tasks in user_data.items():
+            for task in tasks:
+                code, body = split_subject(task.text)
+                length += len(body)
+                dates.append(date_ord)
+                ids.append(task.id)
+                created.append(task.created)
+                subjects.append(code)
+                ends.append(length)
+                bodies.append(body)
+        # Массивы создаются сразу нужного размера, без запаса на рост
+        self.dates = array('i', dates)
+        self.ids = array('q', ids)
+        self.created = array('I', created)
+        self.subjects = array('H', subjects)
+        self.ends = array('I', ends)
+        self.text = ''.join(bodies)
+
+    # Пользователь из готовых столбцов (чтение снимка storage/snapshot.py)
+    @classmethod
+    def from_columns(cls, dates, ids, created, subjects, ends, text):
+        user = cls.__new__(cls)
+        user.dates = dates
+        user.ids = ids
+        user.created = created
+        user.subjects = subjects
+        user.ends = ends
+        user.text = text
+        return user
+
+    def to_dict(self):
+        user_data = {}
+        start = 0
+        for date_ord, task_id, created, code, end in zip(self.dates, self.ids, self.created, self.subjects, self.ends):
+            tasks = user_data.get(date_ord)
+            if tasks is None:
+                tasks = user_data[date_ord] = []
+            tasks.append(Task(task_id, _subjects[code] + self.text[start:end], created))
+            start = end
+        return user_data
+
+    def items(self):
+        return self.to_dict().items()
+
+    # Строки заданий за дату [start, stop); новой дате место в конце
+    def _span(self, date_ord):
+        try:
+            start = self.dates.index(date_ord)
+        except ValueError:
+            return len(self.dates), len(self.dates)
+        return start, start + self.dates.count(date_ord)
+
+    # Начало текста строки row
+    def _offset(self, row):
+        return self.ends[row - 1] if row else 0
+
+    # Задания за дату: [Task, ...] ([] - даты нет)
+    def tasks(self, date_ord):
+        start, stop = self._span(date_ord)
+        tasks = []
+        offset = self._offset(start)
+        for row in range(start, stop):
+            end = self.ends[row]
+            tasks.append(Task(self.ids[row], _subjects[self.subjects[row]] + self.text[offset:end], self.created[row]))
+            offset = end
+        return tasks
+
+    # Новый пользователь с заданиями tasks за дату ([] - дата удаляется)
+    def replace(self, date_ord, tasks):
+        start, stop = self._span(date_ord)
+        codes, bodies, ends = [], [], []
+        text_start, text_stop = self._offset(start), self._offset(stop)
+        length = text_start
+        for task in tasks:
+            code, body = split_subject(task.text)
+            length += len(body)
+            codes.append(code)
+            bodies.append(body)
+            ends.append(length)
+        shift = length - text_stop
+        return self.from_columns(
+            self.dates[:start] + array('i', [date_ord]) * len(tasks) + self.dates[stop:],
+            self.ids[:start] + array('q', [task.id for task in tasks]) + self.ids[stop:],
+            self.created[:start] + array('I', [task.created for task in tasks]) + self.created[stop:],
+            self.subjects[:start] + array('H', codes) + self.subjects[stop:],
+            self.ends[:start] + array('I', ends) + array('I', [end + shift for end in self.ends[stop:]]),
+            self.text[:text_start] + ''.join(bodies) + self.text[text_stop:],
+        )
+
+    # Даты пользователя
+    def __iter__(self):
+        return iter(dict.fromkeys(self.dates))
+
+    def count(self, date_ord):
+        return self.dates.count(date_ord)
+
+    def max_id(self):
+        return max(self.ids, default=0)
+
+
+# Задания пользователя для чтения: {дата: [Task, ...]}, но списки Task
+# строятся при первом обращении к дате. Словарь можно дополнять
+# (SharedStorage добавляет общие задания) - хранилища это не меняет.
+class UserView(MutableMapping):
+    __slots__ = ('_user', '_dates')
+
+    def __init__(self, user):
+        self._user = user
+        # дата -> [Task, ...] или None, пока список не построен
+        self._dates = dict.fromkeys(user.dates) if user is not None else {}
+
+    def __getitem__(self, date_ord):
+        tasks = self._dates[date_ord]
+        if tasks is None:
+            tasks = self._dates[date_ord] = self._user.tasks(date_ord)
+        return tasks
+
+    def __setitem__(self, date_ord, tasks):
+        self._dates[date_ord] = tasks
+
+    def __delitem__(self, date_ord):
+        del self._dates[date_ord]
+
+    def __contains__(self, date_ord):
+        return date_ord in self._dates
+
+    def __iter__(self):
+        return iter(self._dates)
+
+    def __len__(self):
+        return len(self._dates)
@@ -0,0 +1,57 @@
+from bisect import bisect_left, bisect_right
+
+from storage.store import store
+
+
+# Отсортированные даты каждого пользователя.
+# Список строится один раз при первом обращении, а дальше поддерживается
+# по уведомлениям хранилища: новая дата вставляется бисекцией, опустевшая
+# удаляется. Списки отдаются только для чтения.
+class DateIndex:
+    def __init__(self, storage):
+        self.storage = storage
+        self._dates = {}
+        # Растёт при каждом изменении: список, прочитанный во время
+        # изменения данных, в индекс не попадает
+        self._generation = 0
+        storage.add_listener(self.on_change)
+
+    async def get(self, user_id):
+        dates = self._dates.get(user_id)
+        if dates is None:
+            generation = self._generation
+            dates = sorted(await self.storage.get_user(user_id))
+            if generation == self._generation:
+                self._dates[user_id] = dates
+        return dates
+
+    # Даты с start по end включительно
+    async def between(self, user_id, start, end):
+        dates = await self.get(user_id)
+        return dates[bisect_left(dates, start):bisect_right(dates, end)]
+
+    # Даты на days дней вперёд, начиная с дня today
+    async def upcoming(self, user_id, today, days):
+        return await self.between(user_id, today, today + days - 1)
+
+    def on_change(self, user_id, date_ord, count):
+        self._generation += 1
+        dates = self._dates.get(user_id)
+        if dates is None:
+            return
+        if date_ord is None:
+            dates.clear()
+            return
+
+        index = bisect_left(dates, date_ord)
+        present = index < len(dates) and dates[index] == date_ord
+        if count and not present:
+            dates.insert(index, date_ord)
+        elif not count and present:
+            del dates[index]
+
+    def __len__(self):
+        return len(self._dates)
+
+
+date_index = DateIndex(store)
@@ -0,0 +1,213 @@
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict
+
+from config import DRAFTS_FILE, FSM_TTL, JOURNAL_COMPACT_BYTES, JOURNAL_COMPACT_INTERVAL
+from metrics import STORAGE_BYTES
+from storage.commit import GroupCommit
+from storage.io import run_io
+
+
+# Черновик вводимого списка заданий.
+# kind - 'add' (новая дата) или 'continue' (дописывание в существующую),
+# first_number - номер, с которого нумеруются новые задания,
+# touched - время последнего изменения.
+class Draft:
+    __slots__ = ('kind', 'date', 'first_number', 'items', 'lines', 'touched')
+
+    def __init__(self, kind, date, first_number, touched):
+        self.kind = kind
+        self.date = date
+        self.first_number = first_number
+        self.touched = touched
+        self.items = []
+        # Уже отрисованные строки предпросмотра, дописываются по одной
+        self.lines = []
+
+    def add(self, text):
+        number = self.first_number + len(self.items)
+        self.items.append(text)
+        self.lines.append(f"{number}. {text}")
+        return number
+
+
+# Черновики всех пользователей в памяти + журнал на диске, чтобы
+# наполовину введённый список пережил перезапуск бота.
+# Добавление заданий из одного сообщения - одна строка в журнале.
+#
+# Каждая строка журнала задаёт состояние, а не приращение (задания
+# пишутся вместе с позицией 'i'), поэтому повторное проигрывание строки
+# ничего не меняет. Благодаря этому журнал можно переписать из памяти
+# прямо во время работы, не останавливая запись: строки, дописанные
+# после перезаписи, уже учтены в ней и просто повторяются. Перезапись
+# идёт, когда с прошлой дописано compact_bytes байт. Черновик, который
+# не менялся дольше ttl секунд (как и состояние FSM), удаляется.
+class DraftBuffer:
+    def __init__(self, path, ttl, compact_interval, compact_bytes):
+        self.path = path
+        self.ttl = ttl
+        self.compact_interval = compact_interval
+        self.compact_bytes = compact_bytes
+        self._drafts = OrderedDict()  # user_id -> Draft, от давних изменений к недавним
+        self._file = None
+        self._written = 0
+        self._commit = GroupCommit(self._write_batch)
+        self._task = None
+
+    def get(self, user_id):
+        return self._drafts.get(user_id)
+
+    async def begin(self, user_id, kind, date, first_number=1):
+        now = time.time()
+        self._drafts.pop(user_id, None)
+        self._drafts[user_id] = Draft(kind, date, first_number, now)
+        await self._log({'u': user_id, 'k': kind, 'd': date, 'n': first_number, 'at': int(now)})
+
+    # Возвращает номер первого добавленного задания или None, если черновика нет
+    async def add(self, user_id, texts):
+        draft = self._drafts.get(user_id)
+        if draft is None:
+            return None
+        position = len(draft.items)
+        for text in texts:
+            draft.add(text)
+        draft.touched = time.time()
+        self._drafts.move_to_end(user_id)
+        await self._log({'u': user_id, 'i': position, 'ts': texts, 'at': int(draft.touched)})
+        return draft.first_number + position
+
+    # Забрать черновик (после сохранения или отмены)
+    async def finish(self, user_id):
+        draft = self._drafts.pop(user_id, None)
+        if draft is not None:
+            await self._log({'u': user_id})
+        return draft
+
+    def _log(self, record):
+        return self._commit.submit(json.dumps(record, ensure_ascii=False) + '\n')
+
+    async def _write_batch(self, lines):
+        await run_io(self._append, ''.join(lines))
+        return [None] * len(lines)
+
+    # Выполняется в потоке ввода-вывода
+    def _append(self, data):
+        self._file.write(data)
+        self._file.flush()
+        size = len(data.encode('utf-8'))
+        self._written += size
+        STORAGE_BYTES.inc(size, file='drafts', direction='write')
+
+    # Живые черновики строками журнала
+    def _dump(self):
+        lines = []
+        for user_id, draft in self._drafts.items():
+            at = int(draft.touched)
+            lines.append(json.dumps({'u': user_id, 'k': draft.kind, 'd': draft.date,
+                                     'n': draft.first_number, 'at': at}, ensure_ascii=False) + '\n')
+            if draft.items:
+                lines.append(json.dumps({'u': user_id, 'i': 0, 'ts': draft.items, 'at': at},
+                                        ensure_ascii=False) + '\n')
+        return ''.join(lines)
+
+    # Выполняется в потоке ввода-вывода, в очереди с дописыванием
+    def _rewrite(self, data):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(data)
+        os.replace(tmp_path, self.path)
+        if self._file is not None:
+            self._file.close()
+        self._file = open(self.path, 'a', encoding='utf-8')
+        self._written = 0
+        STORAGE_BYTES.inc(len(data.encode('utf-8')), file='drafts', direction='write')
+
+    def load(self):
+        self._drafts = OrderedDict()
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # Оборванная последняя строка
+                        break
+                    self._replay(record)
+        self._drafts = OrderedDict(sorted(self._drafts.items(), key=lambda item: item[1].touched))
+        self.expire()
+
+        # Переписываем файл, оставляя только незавершённые черновики
+        self._rewrite(self._dump())
+
+    def _replay(self, record):
+        user_id = record['u']
+        # Строки прежних версий без времени считаем свежими
+        touched = record.get('at', time.time())
+        if 'k' in record:
+            self._drafts[user_id] = Draft(record['k'], record['d'], record['n'], touched)
+        elif 'ts' in record or 't' in record:
+            draft = self._drafts.get(user_id)
+            if draft is None:
+                return
+            # 't' - одно задание, а 'ts' без 'i' - дописывание, как писали прежние версии
+            texts = record.get('ts') or [record['t']]
+            position = record.get('i', len(draft.items))
+            del draft.items[position:], draft.lines[position:]
+            for text in texts:
+                draft.add(text)
+            draft.touched = touched
+        else:
+            self._drafts.pop(user_id, None)
+
+    def __len__(self):
+        return len(self._drafts)
+
+    # Удалить черновики, которые не менялись дольше ttl; на диск
+    # уходят те же строки, что и при завершении
+    def expire(self):
+        if not self.ttl:
+            return []
+        deadline = time.time() - self.ttl
+        expired = []
+        while self._drafts:
+            user_id, draft = next(iter(self._drafts.items()))
+            if draft.touched >= deadline:
+                break
+            del self._drafts[user_id]
+            expired.append(user_id)
+        return expired
+
+    async def compact(self):
+        await run_io(self._rewrite, self._dump())
+
+    async def _compact_loop(self):
+        while True:
+            await asyncio.sleep(self.compact_interval)
+            try:
+                await asyncio.gather(*(self._log({'u': user_id}) for user_id in self.expire()))
+                if self._written >= self.compact_bytes:
+                    await self.compact()
+            except Exception as e:
+                print(f"Ошибка при сжатии журнала черновиков: {e}")
+
+    async def start(self):
+        await run_io(self.load)
+        self._task = asyncio.create_task(self._compact_loop())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self._commit.drain()
+        if self._file is not None:
+            await run_io(self._file.close)
+            self._file = None
+
+
+drafts = DraftBuffer(DRAFTS_FILE, FSM_TTL, JOURNAL_COMPACT_INTERVAL, JOURNAL_COMPACT_BYTES)
@@ -0,0 +1,213 @@
+import asyncio
+import json
+import sqlite3
+import sys
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder
+
+from config import FSM_FILE, FSM_TTL, FLUSH_INTERVAL
+from metrics import STORAGE_BYTES, STORAGE_ERRORS, STORAGE_SECONDS, Counter, Gauge
+
+FSM_EXPIRED = Counter('bot_fsm_expired_total', 'Сессий FSM удалено по FSM_TTL')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS fsm (
+    key     TEXT    PRIMARY KEY,
+    state   TEXT,
+    data    TEXT,
+    touched INTEGER NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+# Состояние одного пользователя: имя состояния (одна строка на все
+# сессии с тем же состоянием), данные - JSON или None и время
+# последнего обращения
+class Session:
+    __slots__ = ('state', 'data', 'touched')
+
+    def __init__(self, state, data, touched):
+        self.state = state
+        self.data = data
+        self.touched = touched
+
+
+# Хранилище FSM aiogram, переживающее перезапуск бота: положение
+# пользователя в диалоге (ввод даты, выбор задания для удаления) и его
+# данные (delete_date, find_query).
+#
+# Все чтения идут из памяти. Изменённые сессии помечаются и раз в
+# flush_interval записываются в базу SQLite одной транзакцией; при
+# запуске база читается целиком одним запросом. Сессия без состояния
+# и данных удаляется сразу, а сессия, к которой не обращались дольше
+# ttl секунд, - при очередном сбросе (0 - не удаляются). Сессии лежат
+# в порядке последнего обращения, поэтому поиск устаревших не
+# просматривает остальные.
+class FsmStorage(BaseStorage):
+    def __init__(self, path, ttl, flush_interval):
+        self.path = path
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self._sessions = OrderedDict()  # ключ -> Session, от давних обращений к недавним
+        self._dirty = set()
+        self._keys = DefaultKeyBuilder(with_bot_id=True, with_business_connection_id=True, with_destiny=True)
+        self._conn = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='fsm')
+        self._flush_task = None
+
+    def _run(self, func, *args):
+        return asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    # Не __len__: диспетчер проверяет хранилище на истинность
+    # (storage or MemoryStorage()), и пустое подменилось бы
+    def stats(self):
+        return {'sessions': len(self._sessions)}
+
+    # Сессия для чтения; обращение продлевает её жизнь
+    def _session(self, key):
+        name = self._keys.build(key)
+        session = self._sessions.get(name)
+        if session is not None:
+            session.touched = time.time()
+            self._sessions.move_to_end(name)
+        return session
+
+    def _update(self, key, state, data):
+        name = self._keys.build(key)
+        session = self._sessions.get(name)
+        if session is None:
+            if state is None and data is None:
+                return
+            session = self._sessions[name] = Session(None, None, 0)
+        session.state = state
+        session.data = data
+        session.touched = time.time()
+        self._sessions.move_to_end(name)
+        if state is None and data is None:
+            del self._sessions[name]
+        self._dirty.add(name)
+
+    async def set_state(self, key, state=None):
+        if isinstance(state, State):
+            state = state.state
+        session = self._sessions.get(self._keys.build(key))
+        self._update(key, sys.intern(state) if state is not None else None,
+                     session.data if session is not None else None)
+
+    async def get_state(self, key):
+        session = self._session(key)
+        return session.state if session is not None else None
+
+    async def set_data(self, key, data):
+        session = self._sessions.get(self._keys.build(key))
+        self._update(key, session.state if session is not None else None,
+                     json.dumps(dict(data), ensure_ascii=False) if data else None)
+
+    async def get_data(self, key):
+        session = self._session(key)
+        if session is None or session.data is None:
+            return {}
+        return json.loads(session.data)
+
+    # Удалить сессии, к которым не обращались дольше ttl
+    def expire(self):
+        if not self.ttl:
+            return 0
+        deadline = time.time() - self.ttl
+        expired = 0
+        while self._sessions:
+            name, session = next(iter(self._sessions.items()))
+            if session.touched >= deadline:
+                break
+            del self._sessions[name]
+            self._dirty.add(name)
+            expired += 1
+        FSM_EXPIRED.inc(expired)
+        return expired
+
+    # Выполняется в потоке хранилища FSM
+    def open(self):
+        self._conn = sqlite3.connect(self.path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        with self._conn:
+            self._conn.executescript(SCHEMA)
+            if self.ttl:
+                deadline = time.time() - self.ttl
+                expired = self._conn.execute("DELETE FROM fsm WHERE touched < ?", (deadline,)).rowcount
+                FSM_EXPIRED.inc(expired)
+        return self._conn.execute("SELECT key, state, data, touched FROM fsm ORDER BY touched").fetchall()
+
+    def _write(self, rows, removed):
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO fsm (key, state, data, touched) VALUES (?, ?, ?, ?)", rows
+            )
+            self._conn.executemany("DELETE FROM fsm WHERE key = ?", removed)
+        STORAGE_BYTES.inc(sum(len(row[0]) + len(row[1] or '') + len(row[2] or '') for row in rows),
+                          file='fsm', direction='write')
+
+    def _shutdown(self):
+        self._conn.close()
+        self._conn = None
+
+    # Записать изменённые сессии одной транзакцией
+    async def flush(self):
+        if not self._dirty or self._conn is None:
+            return
+        dirty, self._dirty = self._dirty, set()
+        rows, removed = [], []
+        for name in dirty:
+            session = self._sessions.get(name)
+            if session is None:
+                removed.append((name,))
+            else:
+                rows.append((name, session.state, session.data, int(session.touched)))
+        started = time.perf_counter()
+        try:
+            await self._run(self._write, rows, removed)
+        except Exception as e:
+            # Попробуем снова при следующем сбросе
+            self._dirty |= dirty
+            STORAGE_ERRORS.inc(op='fsm_flush')
+            print(f"Ошибка при сохранении состояний FSM: {e}")
+        STORAGE_SECONDS.observe(time.perf_counter() - started, op='fsm_flush')
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            self.expire()
+            await self.flush()
+
+    async def start(self):
+        started = time.perf_counter()
+        rows = await self._run(self.open)
+        self._sessions = OrderedDict(
+            (name, Session(sys.intern(state) if state is not None else None, data, touched))
+            for name, state, data, touched in rows
+        )
+        STORAGE_BYTES.inc(sum(len(data or '') for _, _, data, _ in rows), file='fsm', direction='read')
+        STORAGE_SECONDS.observe(time.perf_counter() - started, op='fsm_load')
+        self._flush_task = asyncio.create_task(self._flush_loop())
+
+    # Вызывается и из on_shutdown, и самим диспетчером при остановке
+    async def close(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        if self._conn is None:
+            return
+        await self.flush()
+        await self._run(self._shutdown)
+        self._executor.shutdown()
+
+
+fsm_storage = FsmStorage(FSM_FILE, FSM_TTL, FLUSH_INTERVAL)
+Gauge('bot_fsm_sessions', 'Сохранённых сессий FSM', lambda: fsm_storage.stats()['sessions'])
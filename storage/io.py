@@ -0,0 +1,11 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Один выделенный поток для файловых операций хранилища.
+# Все записи выполняются в нём строго по очереди, поэтому порядок
+# дозаписи в журнал сохраняется, а цикл событий никогда не ждёт диск.
+io_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='storage-io')
+
+def run_io(func, *args):
+    return asyncio.get_running_loop().run_in_executor(io_executor, func, *args)
@@ -0,0 +1,196 @@
+import asyncio
+import json
+import os
+import time
+import zlib
+
+from config import JOURNAL_COMPACT_INTERVAL, JOURNAL_COMPACT_BYTES
+from metrics import STORAGE_BYTES, STORAGE_ERRORS, STORAGE_SECONDS
+from storage.base import date_to_ordinal
+from storage.commit import GroupCommit
+from storage.io import run_io
+from storage.json_store import JsonStorage, apply_op
+
+
+# Хранилище с журналом: каждое изменение дописывается в конец файла
+# одной короткой записью, а состояние восстанавливается как
+# снимок + хвост журнала. Стоимость записи не зависит от объёма данных.
+#
+# Формат строки журнала: "<crc32 в hex> <json операции>\n".
+# Оборванная или повреждённая строка (и всё после неё) при восстановлении
+# отбрасывается.
+#
+# Запись в файл, fsync и смена сегментов выполняются в потоке
+# ввода-вывода строго в порядке поступления. Строки, накопившиеся за время
+# предыдущей записи, дописываются одной пачкой (групповая фиксация).
+class JournalStorage(JsonStorage):
+    def __init__(self, path, flush_interval, max_dirty):
+        super().__init__(path, flush_interval, max_dirty)
+        self.journal_path = path + '.journal'
+        self.old_journal_path = path + '.journal.old'
+        self._seq = 0
+        self._journal = None
+        self._journal_bytes = 0
+        self._unsynced = False
+        self._compact_task = None
+        self._commit = GroupCommit(self._write_batch)
+
+    # Снимок + журнал
+    def load(self):
+        snapshot = self._read_json(self.path)
+        if 'users' in snapshot and 'seq' in snapshot:
+            self._data = self._decode_users(snapshot['users'])
+            self._seq = snapshot['seq']
+        else:
+            # Обычный файл данных без журнала
+            self._data = self._decode_users(snapshot)
+            self._seq = 0
+        self._reset_ids()
+
+        snapshot_seq = self._seq
+        # Старый сегмент остаётся, если сжатие прервалось
+        self._replay(self.old_journal_path, snapshot_seq, truncate=False)
+        self._replay(self.journal_path, snapshot_seq, truncate=True)
+        self._reset_ids()
+        self._fragments = self._encode_fragments(self._data)
+        self._journal = open(self.journal_path, 'ab')
+        self._journal_bytes = self._journal.tell()
+
+        if os.path.exists(self.old_journal_path):
+            self._write_snapshot(dict(self._fragments), self._seq)
+            os.remove(self.old_journal_path)
+
+    def _replay(self, path, snapshot_seq, truncate):
+        if not os.path.exists(path):
+            return
+        with open(path, 'rb') as f:
+            content = f.read()
+        STORAGE_BYTES.inc(len(content), file='journal', direction='read')
+
+        offset = 0
+        while offset < len(content):
+            end = content.find(b'\n', offset)
+            op = self._decode(content[offset:end]) if end != -1 else None
+            if op is None:
+                print(f"Журнал {path} оборван на позиции {offset}, хвост отброшен")
+                if truncate:
+                    with open(path, 'r+b') as f:
+                        f.truncate(offset)
+                break
+            if op['s'] > snapshot_seq:
+                apply_op(self._data, self._upgrade(op))
+                self._seq = op['s']
+            offset = end + 1
+
+    # Записи старого формата: дата строкой и задания без id
+    def _upgrade(self, op):
+        if isinstance(op.get('d'), str):
+            op['d'] = date_to_ordinal(op['d'])
+            if 'items' in op:
+                op['items'] = [[next(self._ids), text, 0] for text in op['items']]
+        return op
+
+    def _decode(self, line):
+        try:
+            checksum, payload = line.split(b' ', 1)
+            if int(checksum, 16) != zlib.crc32(payload):
+                return None
+            return json.loads(payload)
+        except ValueError:
+            return None
+
+    def _record(self, op):
+        self._seq += 1
+        op['s'] = self._seq
+        payload = json.dumps(op, ensure_ascii=False).encode('utf-8')
+        line = b'%08x %s\n' % (zlib.crc32(payload), payload)
+        self._journal_bytes += len(line)
+        # Фрагмент пользователя понадобится обновить к следующему снимку
+        self._dirty.add(op['u'])
+        self._unsynced = True
+        return self._commit.submit(line)
+
+    async def _write_batch(self, lines):
+        await run_io(self._append, b''.join(lines))
+        return [None] * len(lines)
+
+    # Выполняется в потоке ввода-вывода.
+    # Запись уходит в ОС сразу, fsync - раз в FLUSH_INTERVAL
+    def _append(self, data):
+        self._journal.write(data)
+        self._journal.flush()
+        STORAGE_BYTES.inc(len(data), file='journal', direction='write')
+
+    def _fsync(self):
+        os.fsync(self._journal.fileno())
+
+    async def flush(self):
+        if not self._unsynced or self._journal is None:
+            return
+        self._unsynced = False
+        started = time.perf_counter()
+        try:
+            await run_io(self._fsync)
+        except Exception as e:
+            self._unsynced = True
+            STORAGE_ERRORS.inc(op='flush')
+            print(f"Ошибка при сохранении данных: {e}")
+        STORAGE_SECONDS.observe(time.perf_counter() - started, op='flush')
+
+    def _write_snapshot(self, fragments, seq):
+        self._write_text(self.path, '{"seq": %d, "users": %s}' % (seq, self._join_fragments(fragments)))
+
+    def _rotate(self):
+        self._fsync()
+        self._journal.close()
+        os.replace(self.journal_path, self.old_journal_path)
+        self._journal = open(self.journal_path, 'ab')
+
+    def _finish_compact(self, fragments, seq):
+        self._write_snapshot(fragments, seq)
+        os.remove(self.old_journal_path)
+
+    # Сжатие журнала в новый снимок
+    async def compact(self):
+        if os.path.exists(self.old_journal_path):
+            return
+        # Состояние фиксируется в тот же момент, когда смена сегмента
+        # ставится в очередь: все записи до неё попадут в старый сегмент
+        started = time.perf_counter()
+        fragments = self._take_fragments()
+        seq = self._seq
+        rotated = run_io(self._rotate)
+        self._journal_bytes = 0
+        await rotated
+
+        # Снимок пишется в фоне и атомарно подменяет старый
+        await run_io(self._finish_compact, fragments, seq)
+        STORAGE_SECONDS.observe(time.perf_counter() - started, op='compact')
+
+    async def _compact_loop(self):
+        while True:
+            await asyncio.sleep(JOURNAL_COMPACT_INTERVAL)
+            try:
+                if self._journal_bytes >= JOURNAL_COMPACT_BYTES:
+                    await self.compact()
+            except Exception as e:
+                STORAGE_ERRORS.inc(op='compact')
+                print(f"Ошибка при сжатии журнала: {e}")
+
+    async def start(self):
+        await super().start()
+        self._compact_task = asyncio.create_task(self._compact_loop())
+
+    async def close(self):
+        if self._compact_task is not None:
+            self._compact_task.cancel()
+            try:
+                await self._compact_task
+            except asyncio.CancelledError:
+                pass
+            self._compact_task = None
+        await self._commit.drain()
+        await super().close()
+        if self._journal is not None:
+            await run_io(self._journal.close)
+            self._journal = None
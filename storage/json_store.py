@@ -0,0 +1,242 @@
+import asyncio
+import itertools
+import json
+import os
+import time
+
+from metrics import STORAGE_BYTES, STORAGE_ERRORS, STORAGE_SECONDS
+from storage.base import Storage, Task, decode_user, encode_user, in_batches, max_task_id
+from storage.compact import UserTasks, UserView
+from storage.io import run_io
+
+
+# Применение одной операции к словарю всех пользователей
+# {user_id: UserTasks}.
+# Одна и та же функция используется и для живых изменений,
+# и для восстановления состояния из журнала, поэтому операции
+# содержат уже готовые id и время создания заданий.
+def apply_op(all_data, op):
+    kind = op['op']
+    key = op['u']
+
+    if kind == 'clear_all':
+        all_data.pop(key, None)
+        return None
+
+    # Пересобираются только задания затронутой даты
+    user = all_data.get(key) or UserTasks({})
+    date = op['d']
+    result = None
+
+    if kind == 'set':
+        user = user.replace(date, [Task(*item) for item in op['items']])
+    elif kind == 'append':
+        user = user.replace(date, user.tasks(date) + [Task(*item) for item in op['items']])
+    elif kind == 'delete':
+        tasks = user.tasks(date)
+        index = op['n'] - 1
+        if 0 <= index < len(tasks):
+            result = tasks.pop(index)
+            # Если заданий не осталось, удаляется вся дата
+            user = user.replace(date, tasks)
+    elif kind == 'clear_date':
+        result = user.tasks(date) or None
+        if result is not None:
+            user = user.replace(date, [])
+
+    if len(user.dates):
+        all_data[key] = user
+    else:
+        all_data.pop(key, None)
+    return result
+
+
+# Хранилище заданий в памяти с отложенной записью на диск.
+# Файл читается один раз при старте, дальше все чтения идут из памяти,
+# а изменения помечаются как "грязные" и сбрасываются пачкой.
+# В памяти задания пользователя лежат в компактном виде (UserTasks).
+#
+# Для каждого пользователя хранится готовый JSON-фрагмент: при сбросе
+# в цикле событий перекодируются только изменённые пользователи,
+# а склейка и запись файла выполняются в потоке ввода-вывода.
+class JsonStorage(Storage):
+    def __init__(self, path, flush_interval, max_dirty):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_dirty = max_dirty
+        self._data = {}
+        self._ids = itertools.count(1)
+        self._dirty = set()
+        self._fragments = {}
+        self._wakeup = None
+        self._flush_task = None
+
+    # Однократная загрузка файла
+    def load(self):
+        self._data = self._decode_users(self._read_json(self.path))
+        self._reset_ids()
+        self._fragments = self._encode_fragments(self._data)
+
+    def _decode_users(self, raw_users):
+        # Заданиям старого формата выдаём id после уже существующих
+        ids = itertools.count(max_task_id(raw_users) + 1)
+        return {user_id: UserTasks(decode_user(raw_user, ids)) for user_id, raw_user in raw_users.items()}
+
+    def _encode_fragments(self, users):
+        return {user_id: json.dumps(encode_user(user_data), ensure_ascii=False)
+                for user_id, user_data in users.items()}
+
+    # Обновить фрагменты изменённых пользователей и вернуть копию всех фрагментов
+    def _take_fragments(self):
+        for user_id in self._dirty:
+            if user_id in self._data:
+                self._fragments[user_id] = json.dumps(encode_user(self._data[user_id]), ensure_ascii=False)
+            else:
+                self._fragments.pop(user_id, None)
+        self._dirty = set()
+        return dict(self._fragments)
+
+    def _join_fragments(self, fragments):
+        return '{' + ', '.join(f'{json.dumps(user_id)}: {fragment}'
+                               for user_id, fragment in fragments.items()) + '}'
+
+    def _reset_ids(self):
+        max_id = max((user.max_id() for user in self._data.values()), default=0)
+        self._ids = itertools.count(max_id + 1)
+
+    def _read_json(self, path):
+        if not os.path.exists(path):
+            return {}
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                content = f.read()
+                STORAGE_BYTES.inc(f.tell(), file='data', direction='read')
+            if content.strip():
+                return json.loads(content)
+        except json.JSONDecodeError as e:
+            # Не затираем повреждённый файл при следующем сбросе
+            backup = path + '.corrupt'
+            os.replace(path, backup)
+            print(f"Файл данных поврежден ({e}), копия сохранена в {backup}")
+        return {}
+
+    def _write_text(self, path, content):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+            STORAGE_BYTES.inc(f.tell(), file='data', direction='write')
+        os.replace(tmp_path, path)
+
+    def _write_fragments(self, fragments):
+        self._write_text(self.path, self._join_fragments(fragments))
+
+    async def get_user(self, user_id):
+        return UserView(self._data.get(str(user_id)))
+
+    # Пользователи перебираются по списку ключей, снятому в начале:
+    # пока цикл событий занят другими обновлениями, кто-то из них
+    # может измениться или исчезнуть
+    async def dates_from(self, start):
+        pairs = []
+        async for chunk in in_batches(list(self._data)):
+            for user_id in chunk:
+                user_data = self._data.get(user_id)
+                if user_data is not None:
+                    pairs += [(int(user_id), date_ord) for date_ord in user_data if date_ord >= start]
+        return pairs
+
+    async def users_before(self, end):
+        user_ids = []
+        async for chunk in in_batches(list(self._data)):
+            for user_id in chunk:
+                user_data = self._data.get(user_id)
+                if user_data is not None and min(user_data.dates, default=end) < end:
+                    user_ids.append(int(user_id))
+        return user_ids
+
+    def _new_items(self, items):
+        now = int(time.time())
+        return [[next(self._ids), text, now] for text in items]
+
+    # Изменения данных
+    async def set_tasks(self, user_id, date_ord, items):
+        return await self._apply({'op': 'set', 'u': str(user_id), 'd': date_ord, 'items': self._new_items(items)})
+
+    async def put_tasks(self, user_id, date_ord, tasks):
+        items = [[task.id, task.text, task.created] for task in tasks]
+        return await self._apply({'op': 'set', 'u': str(user_id), 'd': date_ord, 'items': items})
+
+    async def append_tasks(self, user_id, date_ord, items):
+        return await self._apply({'op': 'append', 'u': str(user_id), 'd': date_ord, 'items': self._new_items(items)})
+
+    async def delete_task(self, user_id, date_ord, number):
+        return await self._apply({'op': 'delete', 'u': str(user_id), 'd': date_ord, 'n': number})
+
+    async def clear_date(self, user_id, date_ord):
+        return await self._apply({'op': 'clear_date', 'u': str(user_id), 'd': date_ord})
+
+    async def clear_all(self, user_id):
+        return await self._apply({'op': 'clear_all', 'u': str(user_id)})
+
+    # Память меняется сразу и без переключений, поэтому операция атомарна.
+    # _record может вернуть future записи, если хранилище фиксирует
+    # изменения сразу (журнал), а не отложенным сбросом.
+    async def _apply(self, op):
+        result = apply_op(self._data, op)
+        date_ord = op.get('d')
+        user = self._data.get(op['u'])
+        self._changed(op['u'], date_ord, user.count(date_ord) if user is not None and date_ord is not None else 0)
+        committed = self._record(op)
+        if committed is not None:
+            await committed
+        return result
+
+    def _record(self, op):
+        self._dirty.add(op['u'])
+        if len(self._dirty) >= self.max_dirty and self._wakeup is not None:
+            self._wakeup.set()
+
+    # Запись всего состояния на диск через временный файл
+    async def flush(self):
+        if not self._dirty:
+            return
+        dirty = set(self._dirty)
+        started = time.perf_counter()
+        fragments = self._take_fragments()
+        try:
+            await run_io(self._write_fragments, fragments)
+        except Exception as e:
+            # Попробуем снова при следующем сбросе
+            self._dirty |= dirty
+            STORAGE_ERRORS.inc(op='flush')
+            print(f"Ошибка при сохранении данных: {e}")
+        STORAGE_SECONDS.observe(time.perf_counter() - started, op='flush')
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def start(self):
+        started = time.perf_counter()
+        await run_io(self.load)
+        STORAGE_SECONDS.observe(time.perf_counter() - started, op='load')
+        self._wakeup = asyncio.Event()
+        self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def close(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        await self.flush()
+
@@ -0,0 +1,193 @@
+import math
+import re
+import sys
+import unicodedata
+from bisect import bisect_left, insort
+
+from metrics import Gauge
+from storage.store import store
+
+
+# Слова: буквы и цифры любого алфавита ("№123" -> "123")
+WORD = re.compile(r'[^\W_]+')
+
+# Частые окончания русских и украинских слов, от длинных к коротким.
+# Отрезаются и в тексте заданий, и в запросе, поэтому "физике" находит
+# "Физика", а "параграфа" - "параграф".
+ENDINGS = sorted((
+    'ами', 'ями', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими', 'ах', 'ях', 'ов', 'ев',
+    'ам', 'ям', 'ой', 'ей', 'ом', 'ем', 'ую', 'юю', 'ая', 'яя', 'ое', 'ее', 'ые',
+    'ие', 'ый', 'ий', 'ів', 'а', 'я', 'о', 'е', 'ы', 'и', 'і', 'у', 'ю', 'ь',
+), key=len, reverse=True)
+MIN_STEM = 3
+
+
+# Приведение текста к виду для индекса: регистр, ё -> е, без знаков ударения
+def normalize(text):
+    text = unicodedata.normalize('NFC', text.replace('\u0301', ''))
+    return text.casefold().replace('ё', 'е')
+
+def stem(word):
+    for ending in ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM:
+            return word[:-len(ending)]
+    return word
+
+def tokenize(text):
+    return [stem(word) for word in WORD.findall(normalize(text))]
+
+
+# Индекс одного пользователя: слово -> {(дата, id задания): сколько раз
+# встречается}. Задание определяется парой (дата, id): id удалённого
+# задания может достаться новому за другую дату (общие задания класса
+# и их копии тоже делят id). words - отсортированный словарь для поиска
+# по началу слова.
+class UserIndex:
+    __slots__ = ('postings', 'words', 'tasks', 'dates', 'dirty', 'size')
+
+    def __init__(self):
+        self.postings = {}
+        self.words = []
+        self.tasks = {}  # (дата, id задания) -> текст
+        self.dates = {}  # дата -> [(дата, id задания) по порядку]
+        self.dirty = set()  # даты, изменившиеся после последнего обновления
+        self.size = 0
+
+    def remove_date(self, date_ord):
+        for key in self.dates.pop(date_ord, ()):
+            text = self.tasks.pop(key)
+            for token in set(tokenize(text)):
+                posting = self.postings[token]
+                del posting[key]
+                if not posting:
+                    del self.postings[token]
+                    del self.words[bisect_left(self.words, token)]
+
+    def add_date(self, date_ord, tasks):
+        if not tasks:
+            return
+        keys = self.dates[date_ord] = [(date_ord, task.id) for task in tasks]
+        for key, task in zip(keys, tasks):
+            self.tasks[key] = task.text
+            for token in tokenize(task.text):
+                posting = self.postings.get(token)
+                if posting is None:
+                    posting = self.postings[token] = {}
+                    insort(self.words, token)
+                posting[key] = posting.get(key, 0) + 1
+
+    # Примерный объём индекса в памяти
+    def memory(self):
+        size = sys.getsizeof(self.postings) + sys.getsizeof(self.words) + sys.getsizeof(self.tasks)
+        size += sum(sys.getsizeof(token) + sys.getsizeof(posting) for token, posting in self.postings.items())
+        size += sum(sys.getsizeof(entry) for entry in self.tasks.values())
+        size += sum(sys.getsizeof(ids) for ids in self.dates.values())
+        return size
+
+    # Слова индекса, начинающиеся с prefix
+    def expand(self, prefix):
+        start = bisect_left(self.words, prefix)
+        end = start
+        while end < len(self.words) and self.words[end].startswith(prefix):
+            end += 1
+        return self.words[start:end]
+
+
+# Поиск по текстам заданий: /find <слова>.
+#
+# Индекс пользователя строится при первом поиске, а дальше обновляется
+# по уведомлениям хранилища: изменившаяся дата помечается и
+# переиндексируется при следующем запросе, остальные даты не трогаются.
+# Поэтому и добавление, и продолжение ввода, и удаление задания (а также
+# перенос в архив) обновляют индекс, не перестраивая его целиком.
+#
+# Находятся задания, в которых есть все слова запроса (слово запроса
+# может быть началом слова в задании). Выше - задания с более редкими
+# и точнее совпавшими словами, при равенстве - с более поздней датой.
+class SearchIndex:
+    def __init__(self, storage):
+        self.storage = storage
+        self._users = {}
+        self._bytes = 0
+        storage.add_listener(self.on_change)
+
+    def on_change(self, user_id, date_ord, count):
+        index = self._users.get(user_id)
+        if index is None:
+            return
+        if date_ord is None:
+            # Удалено всё - проще построить индекс заново
+            self._bytes -= index.size
+            del self._users[user_id]
+            return
+        index.dirty.add(date_ord)
+
+    async def get(self, user_id):
+        index = self._users.get(user_id)
+        if index is None:
+            # Индекс регистрируется до чтения данных: изменения во время
+            # чтения пометят даты и будут учтены при следующем запросе
+            index = self._users[user_id] = UserIndex()
+            user_data = await self.storage.get_user(user_id)
+            for date_ord, tasks in user_data.items():
+                index.add_date(date_ord, tasks)
+        elif index.dirty:
+            dirty, index.dirty = index.dirty, set()
+            user_data = await self.storage.get_user(user_id)
+            # Сначала убираются все изменившиеся даты, потом добавляются
+            for date_ord in dirty:
+                index.remove_date(date_ord)
+            for date_ord in dirty:
+                index.add_date(date_ord, user_data.get(date_ord))
+        else:
+            return index
+
+        # Пока читались данные, все задания могли удалить
+        if self._users.get(user_id) is index:
+            size = index.memory()
+            self._bytes += size - index.size
+            index.size = size
+        return index
+
+    # Первые limit совпадений [(дата, номер задания, текст), ...] от
+    # лучшего к худшему и сколько заданий совпало всего
+    async def search(self, user_id, query, limit=100):
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return [], 0
+        index = await self.get(user_id)
+        total = len(index.tasks)
+
+        scores = None
+        for term in terms:
+            term_scores = {}
+            for word in index.expand(term):
+                posting = index.postings[word]
+                # Редкие слова весят больше; совпадение по началу слова - вдвое меньше
+                weight = math.log(1 + total / len(posting)) * (1 if word == term else 0.5)
+                for key, count in posting.items():
+                    term_scores[key] = term_scores.get(key, 0) + weight * count
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {key: score + term_scores[key]
+                          for key, score in scores.items() if key in term_scores}
+            if not scores:
+                return [], 0
+
+        ranked = sorted(scores, key=lambda key: (-scores[key], -key[0]))
+        results = []
+        for key in ranked[:limit]:
+            date_ord = key[0]
+            results.append((date_ord, index.dates[date_ord].index(key) + 1, index.tasks[key]))
+        return results, len(ranked)
+
+    def __len__(self):
+        return len(self._users)
+
+    def stats(self):
+        return {'users': len(self._users), 'bytes': self._bytes}
+
+
+search_index = SearchIndex(store)
+Gauge('bot_search_index_bytes', 'Примерный объём поискового индекса', lambda: search_index.stats()['bytes'])
@@ -0,0 +1,555 @@
+import asyncio
+import json
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import STORAGE_BYTES
+from storage.archive import pack_tasks, unpack_tasks
+from storage.base import Storage, Task
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS classes (
+    name  TEXT    PRIMARY KEY,
+    owner INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS members (
+    user_id INTEGER PRIMARY KEY,
+    name    TEXT    NOT NULL
+);
+CREATE INDEX IF NOT EXISTS members_by_class ON members (name);
+CREATE TABLE IF NOT EXISTS forks (
+    user_id  INTEGER NOT NULL,
+    date_ord INTEGER NOT NULL,
+    PRIMARY KEY (user_id, date_ord)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS tasks (
+    id       INTEGER PRIMARY KEY AUTOINCREMENT,
+    name     TEXT    NOT NULL,
+    date_ord INTEGER NOT NULL,
+    text     TEXT    NOT NULL,
+    created  INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tasks_by_class ON tasks (name, date_ord);
+CREATE TABLE IF NOT EXISTS archived (
+    id       INTEGER PRIMARY KEY,
+    date_ord INTEGER NOT NULL,
+    tasks    BLOB    NOT NULL
+);
+CREATE TABLE IF NOT EXISTS archived_members (
+    user_id INTEGER NOT NULL,
+    id      INTEGER NOT NULL,
+    PRIMARY KEY (user_id, id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS changes (
+    seq  INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT    NOT NULL,
+    at   REAL    NOT NULL
+);
+"""
+
+# Сколько секунд хранятся записи об изменённых классах: за это время
+# их прочитают все процессы
+CHANGES_TTL = 3600
+
+
+# Общий список класса: задания, которые владелец публикует один раз
+# для всех участников. members - участник -> даты, которые он изменил
+# у себя и для которых общий список ему больше не показывается.
+class SharedClass:
+    __slots__ = ('name', 'owner', 'members', 'dates')
+
+    def __init__(self, name, owner):
+        self.name = name
+        self.owner = owner
+        self.members = {owner: set()}
+        self.dates = {}  # дата -> [Task, ...]
+
+
+# Хранилище с общими списками классов поверх личного хранилища.
+#
+# Участник класса видит задания класса вместе со своими: общие задания
+# идут первыми, личные за ту же дату - после них. Общие задания хранятся
+# один раз на класс (с отрицательными id, чтобы не пересекаться с
+# личными), а не копируются каждому участнику.
+#
+# Копирование при записи: пока участник только дописывает свои задания,
+# общий список не копируется. Когда он удаляет общее задание, заменяет
+# или очищает дату, общие задания этой даты копируются в его личный
+# список (или просто скрываются), и дальнейшие публикации на эту дату
+# его уже не касаются. Дата, которую изменили у себя все участники,
+# никому не видна и удаляется из класса, как при снятии владельцем.
+#
+# Прошедшие даты класса уходят в архив тоже один раз на класс: запись
+# с заданиями в archived и ссылки на неё у участников, которые их видели.
+#
+# Классы лежат в базе SQLite, одной на все шарды: участники класса
+# могут попадать в разные шарды. Каждое изменение - транзакция на
+# несколько строк плюс запись в changes; все процессы держат классы
+# в памяти и раз в sync_interval перечитывают классы, изменённые
+# с прошлого раза (свои изменения - сразу). local(user_id) - пользователь
+# этого шарда: подписчики узнают об изменениях только своих пользователей.
+class SharedStorage(Storage):
+    def __init__(self, inner, path, sync_interval, local=None):
+        self.inner = inner
+        self.path = path
+        self.sync_interval = sync_interval
+        self.local = local or (lambda user_id: True)
+        self._classes = {}    # имя -> SharedClass
+        self._member_of = {}  # user_id -> SharedClass
+        self._seq = 0         # последняя прочитанная запись changes
+        self._conn = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='classes')
+        self._sync_lock = asyncio.Lock()
+        self._task = None
+        inner.add_listener(self._inner_changed)
+
+    def _run(self, func, *args):
+        return asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    # Общие задания, которые участник видит за дату
+    def _shared(self, user_id, date_ord):
+        shared_class = self._member_of.get(user_id)
+        if shared_class is None or date_ord in shared_class.members[user_id]:
+            return ()
+        return shared_class.dates.get(date_ord, ())
+
+    # Общие задания участника по датам (только id - для сравнения)
+    def _visible(self, user_id):
+        shared_class = self._member_of.get(user_id)
+        if shared_class is None:
+            return {}
+        forked = shared_class.members[user_id]
+        return {date_ord: [task.id for task in tasks]
+                for date_ord, tasks in shared_class.dates.items() if date_ord not in forked}
+
+    # Уведомления личного хранилища дополняются числом общих заданий
+    def _inner_changed(self, user_id, date_ord, count):
+        if date_ord is not None:
+            count += len(self._shared(user_id, date_ord))
+        self._changed(user_id, date_ord, count)
+
+    # Уведомить подписчиков об изменении дат участника
+    async def _notify(self, user_id, dates):
+        user_data = await self.get_user(user_id)
+        for date_ord in dates:
+            self._changed(user_id, date_ord, len(user_data.get(date_ord, ())))
+
+    # Участник больше не видит общих заданий за дату
+    async def _fork(self, user_id, *dates):
+        shared_class = self._member_of.get(user_id)
+        if shared_class is None:
+            return
+        forked = shared_class.members[user_id]
+        dates = [date_ord for date_ord in dates if date_ord in shared_class.dates and date_ord not in forked]
+        if dates:
+            await self._change(self._do_fork, user_id, dates)
+
+    # Все задания пользователя вместе с заданиями его класса
+    async def get_user(self, user_id):
+        user_data = await self.inner.get_user(user_id)
+        shared_class = self._member_of.get(int(user_id))
+        if shared_class is not None:
+            forked = shared_class.members[int(user_id)]
+            for date_ord, tasks in shared_class.dates.items():
+                if date_ord not in forked:
+                    user_data[date_ord] = tasks + user_data.get(date_ord, [])
+        return user_data
+
+    async def set_tasks(self, user_id, date_ord, items):
+        await self._fork(int(user_id), date_ord)
+        return await self.inner.set_tasks(user_id, date_ord, items)
+
+    async def put_tasks(self, user_id, date_ord, tasks):
+        await self._fork(int(user_id), date_ord)
+        return await self.inner.put_tasks(user_id, date_ord, tasks)
+
+    # Дописанные задания идут после общих, копировать общие не нужно
+    async def append_tasks(self, user_id, date_ord, items):
+        return await self.inner.append_tasks(user_id, date_ord, items)
+
+    async def delete_task(self, user_id, date_ord, number):
+        shared = self._shared(int(user_id), date_ord)
+        if number > len(shared):
+            # Удаляется личное задание: общий список остаётся общим
+            return await self.inner.delete_task(user_id, date_ord, number - len(shared))
+        # Удаляется общее задание. Сначала общий список копируется в личный
+        # (с теми же id и временем создания) и копия записывается на диск,
+        # и только потом дата отмечается как отделённая от класса: сбой
+        # между шагами покажет общие задания дважды, но не потеряет их
+        personal = (await self.inner.get_user(user_id)).get(date_ord, [])
+        await self.inner.put_tasks(user_id, date_ord, [*shared, *personal])
+        await self.inner.flush()
+        await self._fork(int(user_id), date_ord)
+        return await self.inner.delete_task(user_id, date_ord, number)
+
+    # Очистка скрывает и общие задания за дату
+    async def clear_date(self, user_id, date_ord):
+        await self._fork(int(user_id), date_ord)
+        return await self.inner.clear_date(user_id, date_ord)
+
+    async def clear_all(self, user_id):
+        shared_class = self._member_of.get(int(user_id))
+        if shared_class is not None:
+            await self._fork(int(user_id), *shared_class.dates)
+        return await self.inner.clear_all(user_id)
+
+    # Участники других шардов сюда не попадают
+    async def dates_from(self, start):
+        pairs = set(await self.inner.dates_from(start))
+        for shared_class in self._classes.values():
+            for user_id, forked in shared_class.members.items():
+                if self.local(user_id):
+                    pairs.update((user_id, date_ord) for date_ord in shared_class.dates
+                                 if date_ord >= start and date_ord not in forked)
+        return list(pairs)
+
+    async def users_before(self, end):
+        user_ids = set(await self.inner.users_before(end))
+        for shared_class in self._classes.values():
+            for user_id, forked in shared_class.members.items():
+                if self.local(user_id) and any(date_ord < end and date_ord not in forked
+                                               for date_ord in shared_class.dates):
+                    user_ids.add(user_id)
+        return list(user_ids)
+
+    # Классы
+
+    def class_of(self, user_id):
+        return self._member_of.get(user_id)
+
+    # Даты, за которые участник сейчас видит общие задания класса
+    def class_dates(self, user_id):
+        return self._visible(int(user_id)).keys()
+
+    # Создать класс; создатель становится его владельцем и участником
+    async def create_class(self, name, owner):
+        await self._change(self._do_create, name, owner)
+        return self._classes[name]
+
+    async def join(self, user_id, name):
+        await self._change(self._do_join, user_id, name)
+        return self._classes[name]
+
+    # Выйти из класса; владелец, выходя, удаляет класс у всех
+    async def leave(self, user_id):
+        return await self._change(self._do_leave, user_id)
+
+    # Опубликовать задания за дату; вернуть участников, которые их увидят
+    # (всех, в том числе из других шардов)
+    async def publish(self, owner, date_ord, items):
+        return await self._change(self._do_publish, owner, date_ord, items)
+
+    # Снять общие задания за дату
+    async def unpublish(self, owner, date_ord):
+        return await self._change(self._do_unpublish, owner, date_ord)
+
+    # Перенести в архив общие задания за даты раньше cutoff;
+    # вернуть число перенесённых дат
+    async def archive_classes(self, cutoff):
+        return await self._change(self._do_archive, cutoff)
+
+    # Архивные общие задания участника: {дата: [Task, ...]}
+    async def archived_for(self, user_id):
+        return await self._run(self._archived_for, int(user_id))
+
+    # Изменение в базе, затем перечитывание изменённых классов
+    async def _change(self, func, *args):
+        result = await self._run(self._write, func, *args)
+        await self.sync()
+        return result
+
+    # Перечитать классы, изменённые с прошлого раза (в том числе
+    # другими процессами), и уведомить подписчиков о датах, общие
+    # задания которых у участников изменились
+    async def sync(self):
+        async with self._sync_lock:
+            self._seq, classes, full = await self._run(self._read, self._read_changes, self._seq)
+            await self._apply(classes, full)
+
+    async def _apply(self, classes, full, notify=True):
+        names = set(classes) | set(self._classes) if full else set(classes)
+        old = {name: self._classes.get(name) for name in names}
+        users = {user_id for shared_class in [*old.values(), *classes.values()] if shared_class is not None
+                 for user_id in shared_class.members if self.local(user_id)}
+        before = {user_id: self._visible(user_id) for user_id in users} if notify else {}
+
+        for name in names:
+            old_class, new_class = old[name], classes.get(name)
+            if old_class is not None:
+                for user_id in old_class.members:
+                    if self._member_of.get(user_id) is old_class:
+                        del self._member_of[user_id]
+            if new_class is None:
+                self._classes.pop(name, None)
+                continue
+            self._classes[name] = new_class
+            for user_id in new_class.members:
+                self._member_of[user_id] = new_class
+
+        for user_id, visible in before.items():
+            after = self._visible(user_id)
+            dates = [date_ord for date_ord in visible.keys() | after.keys() if visible.get(date_ord) != after.get(date_ord)]
+            if dates:
+                await self._notify(user_id, dates)
+
+    async def _sync_loop(self):
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            try:
+                await self.sync()
+            except Exception as e:
+                print(f"Ошибка при чтении классов: {e}")
+
+    # База классов. Всё ниже выполняется в потоке базы классов.
+
+    def open(self):
+        self._conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        # Файл классов прежних версий переносится один раз
+        legacy_path = os.path.splitext(self.path)[0] + '.json'
+        if os.path.exists(legacy_path) and self._conn.execute("SELECT 1 FROM classes").fetchone() is None:
+            self._write(self._import, legacy_path)
+        return self._read(self._read_all)
+
+    def _shutdown(self):
+        self._conn.close()
+        self._conn = None
+
+    # func(*args) в транзакции, которая сразу берёт блокировку записи:
+    # проверка и запись не разделяются записью другого процесса
+    def _write(self, func, *args):
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = func(*args)
+            self._conn.execute("DELETE FROM changes WHERE at < ?", (time.time() - CHANGES_TTL,))
+            self._conn.execute("COMMIT")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        return result
+
+    def _touch(self, name):
+        self._conn.execute("INSERT INTO changes (name, at) VALUES (?, ?)", (name, time.time()))
+
+    def _member_class(self, user_id):
+        row = self._conn.execute("SELECT name FROM members WHERE user_id = ?", (user_id,)).fetchone()
+        return row[0] if row is not None else None
+
+    def _owned(self, owner):
+        row = self._conn.execute("SELECT name FROM classes WHERE owner = ?", (owner,)).fetchone()
+        if row is None:
+            raise ValueError("Публиковать задания может только владелец класса")
+        return row[0]
+
+    def _check_free(self, user_id):
+        current = self._member_class(user_id)
+        if current is not None:
+            raise ValueError(f"Вы уже в классе {current}, сначала /leave")
+
+    def _do_create(self, name, owner):
+        if self._conn.execute("SELECT 1 FROM classes WHERE name = ?", (name,)).fetchone() is not None:
+            raise ValueError(f"Класс {name} уже существует")
+        self._check_free(owner)
+        self._conn.execute("INSERT INTO classes (name, owner) VALUES (?, ?)", (name, owner))
+        self._conn.execute("INSERT INTO members (user_id, name) VALUES (?, ?)", (owner, name))
+        self._touch(name)
+
+    def _do_join(self, user_id, name):
+        if self._conn.execute("SELECT 1 FROM classes WHERE name = ?", (name,)).fetchone() is None:
+            raise ValueError(f"Класса {name} нет")
+        self._check_free(user_id)
+        self._conn.execute("INSERT INTO members (user_id, name) VALUES (?, ?)", (user_id, name))
+        self._touch(name)
+
+    # Участники, которым видны задания класса за дату
+    def _viewers(self, name, date_ord):
+        return [user_id for user_id, in self._conn.execute(
+            "SELECT user_id FROM members WHERE name = ? "
+            "AND user_id NOT IN (SELECT user_id FROM forks WHERE date_ord = ?)", (name, date_ord)
+        )]
+
+    # Удалить задания класса за дату вместе с отметками участников
+    def _drop_date(self, name, date_ord):
+        self._conn.execute("DELETE FROM tasks WHERE name = ? AND date_ord = ?", (name, date_ord))
+        self._conn.execute("DELETE FROM forks WHERE date_ord = ? AND user_id IN "
+                           "(SELECT user_id FROM members WHERE name = ?)", (date_ord, name))
+
+    # Даты, которые уже никому не видны, удаляются
+    def _prune(self, name, dates):
+        for date_ord in dates:
+            if not self._viewers(name, date_ord):
+                self._drop_date(name, date_ord)
+
+    def _do_leave(self, user_id):
+        name = self._member_class(user_id)
+        if name is None:
+            return None
+        owner, = self._conn.execute("SELECT owner FROM classes WHERE name = ?", (name,)).fetchone()
+        if owner == user_id:
+            self._conn.execute("DELETE FROM forks WHERE user_id IN (SELECT user_id FROM members WHERE name = ?)", (name,))
+            self._conn.execute("DELETE FROM members WHERE name = ?", (name,))
+            self._conn.execute("DELETE FROM tasks WHERE name = ?", (name,))
+            self._conn.execute("DELETE FROM classes WHERE name = ?", (name,))
+        else:
+            self._conn.execute("DELETE FROM forks WHERE user_id = ?", (user_id,))
+            self._conn.execute("DELETE FROM members WHERE user_id = ?", (user_id,))
+            self._prune(name, [date_ord for date_ord, in self._conn.execute(
+                "SELECT DISTINCT date_ord FROM tasks WHERE name = ?", (name,)
+            ).fetchall()])
+        self._touch(name)
+        return SharedClass(name, owner)
+
+    def _do_publish(self, owner, date_ord, items):
+        name = self._owned(owner)
+        now = int(time.time())
+        self._conn.executemany("INSERT INTO tasks (name, date_ord, text, created) VALUES (?, ?, ?, ?)",
+                               [(name, date_ord, text, now) for text in items])
+        self._touch(name)
+        STORAGE_BYTES.inc(sum(len(text.encode('utf-8')) for text in items), file='classes', direction='write')
+        return self._viewers(name, date_ord)
+
+    def _do_unpublish(self, owner, date_ord):
+        name = self._owned(owner)
+        if self._conn.execute("SELECT 1 FROM tasks WHERE name = ? AND date_ord = ?", (name, date_ord)).fetchone() is None:
+            return False
+        self._drop_date(name, date_ord)
+        self._touch(name)
+        return True
+
+    # Отметка ставится, только если у класса ещё есть задания за дату
+    def _do_fork(self, user_id, dates):
+        name = self._member_class(user_id)
+        if name is None:
+            return
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO forks (user_id, date_ord) SELECT ?, ? "
+            "WHERE EXISTS (SELECT 1 FROM tasks WHERE name = ? AND date_ord = ?)",
+            [(user_id, date_ord, name, date_ord) for date_ord in dates]
+        )
+        self._prune(name, dates)
+        self._touch(name)
+
+    # Каждая прошедшая дата класса - одна запись архива; тем, кто её
+    # видел, достаётся ссылка. Дату, которую не видит никто, просто удаляем.
+    def _do_archive(self, cutoff):
+        old = self._conn.execute(
+            "SELECT DISTINCT name, date_ord FROM tasks WHERE date_ord < ?", (cutoff,)
+        ).fetchall()
+        written = 0
+        for name, date_ord in old:
+            viewers = self._viewers(name, date_ord)
+            if viewers:
+                blob = pack_tasks([Task(-task_id, text, created) for task_id, text, created in self._conn.execute(
+                    "SELECT id, text, created FROM tasks WHERE name = ? AND date_ord = ? ORDER BY id", (name, date_ord)
+                )])
+                written += len(blob)
+                archive_id = self._conn.execute(
+                    "INSERT INTO archived (date_ord, tasks) VALUES (?, ?)", (date_ord, blob)
+                ).lastrowid
+                self._conn.executemany("INSERT INTO archived_members (user_id, id) VALUES (?, ?)",
+                                       [(user_id, archive_id) for user_id in viewers])
+            self._drop_date(name, date_ord)
+        for name in {name for name, _ in old}:
+            self._touch(name)
+        STORAGE_BYTES.inc(written, file='classes', direction='write')
+        return len(old)
+
+    def _archived_for(self, user_id):
+        user_data = {}
+        read = 0
+        for date_ord, blob in self._conn.execute(
+            "SELECT archived.date_ord, archived.tasks FROM archived_members "
+            "JOIN archived ON archived.id = archived_members.id "
+            "WHERE archived_members.user_id = ? ORDER BY archived.id", (user_id,)
+        ):
+            read += len(blob)
+            user_data.setdefault(date_ord, []).extend(unpack_tasks(blob))
+        STORAGE_BYTES.inc(read, file='classes', direction='read')
+        return user_data
+
+    def _read_class(self, name):
+        row = self._conn.execute("SELECT owner FROM classes WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            return None
+        shared_class = SharedClass(name, row[0])
+        shared_class.members = {user_id: set() for user_id, in self._conn.execute(
+            "SELECT user_id FROM members WHERE name = ?", (name,)
+        )}
+        for user_id, date_ord in self._conn.execute(
+            "SELECT forks.user_id, forks.date_ord FROM forks JOIN members ON members.user_id = forks.user_id "
+            "WHERE members.name = ?", (name,)
+        ):
+            shared_class.members[user_id].add(date_ord)
+        read = 0
+        for task_id, date_ord, text, created in self._conn.execute(
+            "SELECT id, date_ord, text, created FROM tasks WHERE name = ? ORDER BY id", (name,)
+        ):
+            shared_class.dates.setdefault(date_ord, []).append(Task(-task_id, text, created))
+            read += len(text)
+        STORAGE_BYTES.inc(read, file='classes', direction='read')
+        return shared_class
+
+    # Чтение одной транзакцией: классы и номер последнего изменения
+    # согласованы между собой
+    def _read(self, func, *args):
+        self._conn.execute("BEGIN")
+        try:
+            return func(*args)
+        finally:
+            self._conn.execute("COMMIT")
+
+    def _read_all(self):
+        seq, = self._conn.execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()
+        names = [name for name, in self._conn.execute("SELECT name FROM classes")]
+        return seq, {name: self._read_class(name) for name in names}, True
+
+    # Классы, изменённые после записи seq. Если записи успели удалить
+    # по CHANGES_TTL (процесс долго не читал), перечитываются все классы.
+    def _read_changes(self, seq):
+        first, = self._conn.execute("SELECT MIN(seq) FROM changes").fetchone()
+        if first is not None and first > seq + 1:
+            return self._read_all()
+        rows = self._conn.execute("SELECT seq, name FROM changes WHERE seq > ? ORDER BY seq", (seq,)).fetchall()
+        if rows:
+            seq = rows[-1][0]
+        return seq, {name: self._read_class(name) for name in {name for _, name in rows}}, False
+
+    def _import(self, legacy_path):
+        with open(legacy_path, 'r', encoding='utf-8') as f:
+            raw = json.load(f)
+            STORAGE_BYTES.inc(f.tell(), file='classes', direction='read')
+        for name, raw_class in raw.items():
+            self._conn.execute("INSERT INTO classes (name, owner) VALUES (?, ?)", (name, raw_class['owner']))
+            for user_id, forked in raw_class['members'].items():
+                self._conn.execute("INSERT INTO members (user_id, name) VALUES (?, ?)", (int(user_id), name))
+                self._conn.executemany("INSERT INTO forks (user_id, date_ord) VALUES (?, ?)",
+                                       [(int(user_id), date_ord) for date_ord in forked])
+            for date_ord, items in raw_class['dates'].items():
+                self._conn.executemany("INSERT INTO tasks (id, name, date_ord, text, created) VALUES (?, ?, ?, ?, ?)",
+                                       [(-task_id, name, int(date_ord), text, created) for task_id, text, created in items])
+        os.replace(legacy_path, legacy_path + '.imported')
+
+    async def start(self):
+        await self.inner.start()
+        self._seq, classes, _ = await self._run(self.open)
+        await self._apply(classes, True, notify=False)
+        self._task = asyncio.create_task(self._sync_loop())
+
+    async def flush(self):
+        await self.inner.flush()
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.inner.close()
+        if self._conn is not None:
+            await self._run(self._shutdown)
+        self._executor.shutdown()
@@ -0,0 +1,363 @@
+import itertools
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+from operator import itemgetter
+
+from metrics import STORAGE_BYTES, STORAGE_SECONDS
+from storage.base import Task, in_batches
+from storage.compact import UserTasks, subject_code, subject_table
+from storage.io import run_io
+from storage.journal import JournalStorage
+
+
+# Двоичный снимок заданий всех пользователей.
+#
+#   заголовок   MAGIC, seq журнала, наибольший id задания, число
+#               пользователей, длина таблицы предметов
+#   предметы    таблица предметов UserTasks (префиксы через "\0")
+#   индекс      по записи на пользователя, отсортирован по user_id:
+#               user_id, смещение и длина записи, первая и последняя дата
+#   записи      столбцы UserTasks как есть (число заданий, даты, id,
+#               время создания, номера предметов, концы текстов) и тексты
+#
+# Все числа - little-endian. Файл отображается в память (mmap): при
+# открытии читаются только заголовок и таблица предметов, запись
+# пользователя находится бинарным поиском по индексу и разбирается,
+# когда она впервые понадобилась.
+MAGIC = b'HWSNAP01'
+HEADER = struct.Struct('<8sQqII')
+ENTRY = struct.Struct('<qQIii')
+RECORD = struct.Struct('<I')
+
+COLUMNS = ('i', 'q', 'I', 'H', 'I')
+BIG_ENDIAN = sys.byteorder == 'big'
+
+_missing = object()
+
+
+def _column(typecode, data, position, count):
+    column = array(typecode)
+    end = position + count * column.itemsize
+    column.frombytes(data[position:end])
+    if BIG_ENDIAN:
+        column.byteswap()
+    return column, end
+
+def encode_record(user):
+    columns = (user.dates, user.ids, user.created, user.subjects, user.ends)
+    if BIG_ENDIAN:
+        columns = [array(column.typecode, column) for column in columns]
+        for column in columns:
+            column.byteswap()
+    return b''.join([RECORD.pack(len(user.dates)), *(column.tobytes() for column in columns),
+                     user.text.encode('utf-8')])
+
+# Строка индекса для пользователя из памяти
+def user_entry(user_id, user):
+    return user_id, min(user.dates), max(user.dates), encode_record(user)
+
+
+class Snapshot:
+    def __init__(self, path):
+        self.path = path
+        self.seq = 0
+        self.max_id = 0
+        self.users = 0
+        self.subjects = ['']
+        self._map = None
+        self._index = 0
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path, 'rb') as f:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                magic, self.seq, self.max_id, self.users, size = HEADER.unpack_from(self._map)
+                if magic != MAGIC:
+                    raise ValueError("неизвестный формат")
+                self.subjects = self._map[HEADER.size:HEADER.size + size].decode('utf-8').split('\0')
+            except (ValueError, struct.error) as e:
+                # Не затираем повреждённый файл при следующем обновлении снимка
+                self.close()
+                self.seq = self.max_id = self.users = 0
+                backup = path + '.corrupt'
+                os.replace(path, backup)
+                print(f"Файл снимка поврежден ({e}), копия сохранена в {backup}")
+            else:
+                self._index = HEADER.size + size
+                STORAGE_BYTES.inc(self._index, file='snapshot', direction='read')
+
+        # Номера предметов снимка -> номера в таблице процесса.
+        # Обычно совпадают: снимок открывается при запуске, когда таблица
+        # пуста, или был записан этим же процессом.
+        self._remap = [subject_code(prefix) for prefix in self.subjects]
+        self.identity = all(code == i for i, code in enumerate(self._remap))
+
+    # (user_id, смещение, длина, первая дата, последняя дата) по порядку user_id
+    def entries(self):
+        if not self.users:
+            return ()
+        return ENTRY.iter_unpack(self._map[self._index:self._index + self.users * ENTRY.size])
+
+    def find(self, user_id):
+        low, high = 0, self.users
+        while low < high:
+            middle = (low + high) // 2
+            entry = ENTRY.unpack_from(self._map, self._index + middle * ENTRY.size)
+            if entry[0] < user_id:
+                low = middle + 1
+            elif entry[0] > user_id:
+                high = middle
+            else:
+                return entry
+        return None
+
+    def get(self, user_id):
+        entry = self.find(user_id)
+        return self.decode(entry[1], entry[2]) if entry is not None else None
+
+    def raw(self, offset, length):
+        return self._map[offset:offset + length]
+
+    def decode(self, offset, length):
+        data = self.raw(offset, length)
+        STORAGE_BYTES.inc(length, file='snapshot', direction='read')
+        count, = RECORD.unpack_from(data)
+        position = RECORD.size
+        columns = []
+        for typecode in COLUMNS:
+            column, position = _column(typecode, data, position, count)
+            columns.append(column)
+        text = data[position:].decode('utf-8')
+        dates, ids, created, subjects, ends = columns
+        if self.identity:
+            return UserTasks.from_columns(dates, ids, created, subjects, ends, text)
+
+        if None not in self._remap:
+            subjects = array('H', (self._remap[code] for code in subjects))
+            return UserTasks.from_columns(dates, ids, created, subjects, ends, text)
+        # Таблица процесса заполнена: предметы возвращаются в тексты
+        user_data = {}
+        start = 0
+        for date_ord, task_id, task_created, code, end in zip(*columns):
+            user_data.setdefault(date_ord, []).append(Task(task_id, self.subjects[code] + text[start:end], task_created))
+            start = end
+        return UserTasks(user_data)
+
+    # Только даты пользователя, без текстов
+    def dates(self, offset):
+        count, = RECORD.unpack_from(self._map, offset)
+        return _column('i', self._map, offset + RECORD.size, count)[0]
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+
+# entries - [(user_id, первая дата, последняя дата, данные)] по порядку
+# user_id; данные - запись (bytes) или (смещение, длина) записи в source
+def write_snapshot(path, entries, seq, max_id, subjects, source=None):
+    subjects_block = '\0'.join(subjects).encode('utf-8')
+    offset = HEADER.size + len(subjects_block) + len(entries) * ENTRY.size
+    index = []
+    for user_id, first, last, data in entries:
+        length = len(data) if isinstance(data, bytes) else data[1]
+        index.append(ENTRY.pack(user_id, offset, length, first, last))
+        offset += length
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, seq, max_id, len(entries), len(subjects_block)))
+        f.write(subjects_block)
+        f.write(b''.join(index))
+        for _, _, _, data in entries:
+            f.write(data if isinstance(data, bytes) else source.raw(*data))
+        f.flush()
+        os.fsync(f.fileno())
+        STORAGE_BYTES.inc(f.tell(), file='snapshot', direction='write')
+    os.replace(tmp_path, path)
+
+# Новый снимок: записи старого снимка копируются без разбора,
+# изменённые пользователи (changes: user_id -> UserTasks или None,
+# если удалён) кодируются заново
+def write_merged(path, old, changes, seq, max_id, subjects):
+    entries = []
+    for user_id, offset, length, first, last in old.entries():
+        if str(user_id) in changes:
+            continue
+        if old.identity:
+            entries.append((user_id, first, last, (offset, length)))
+        else:
+            entries.append(user_entry(user_id, old.decode(offset, length)))
+    for key, user in changes.items():
+        if user is not None:
+            entries.append(user_entry(int(key), user))
+    entries.sort(key=itemgetter(0))
+    write_snapshot(path, entries, seq, max_id, subjects, source=old)
+
+
+# Пользователи хранилища {user_id: UserTasks} поверх снимка.
+# Пользователь разбирается из снимка при первом обращении и остаётся
+# в памяти; изменённые после снимка пользователи (None - удалён)
+# попадут в следующий снимок.
+class LazyUsers:
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self._users = {}
+        self.modified = set()
+
+    def get(self, key, default=None):
+        user = self._users.get(key, _missing)
+        if user is _missing:
+            user = self.snapshot.get(int(key))
+            if user is None:
+                return default
+            self._users[key] = user
+        return default if user is None else user
+
+    def __setitem__(self, key, user):
+        self._users[key] = user
+        self.modified.add(key)
+
+    def pop(self, key, default=None):
+        user = self.get(key)
+        self[key] = None
+        return default if user is None else user
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def decoded(self):
+        return [user for user in self._users.values() if user is not None]
+
+    def changes(self):
+        return {key: self._users[key] for key in self.modified}
+
+    # (user_id, даты) всех пользователей. keep(первая, последняя дата)
+    # отбирает записи снимка по индексу, не читая их
+    # Перебор идёт по состоянию на момент вызова: между шагами
+    # пользователи меняются, а снимок может смениться новым
+    def dates(self, keep):
+        users = list(self._users.items())
+        snapshot = self.snapshot
+        for key, user in users:
+            if user is not None:
+                yield key, user
+        for user_id, offset, _, first, last in snapshot.entries():
+            key = str(user_id)
+            if key not in self._users and keep(first, last):
+                yield key, dict.fromkeys(snapshot.dates(offset))
+
+    # Снимок обновлён: изменения, которые в него попали, больше не изменения
+    def rebase(self, snapshot, changes):
+        self.snapshot = snapshot
+        for key, user in changes.items():
+            if self._users.get(key, _missing) is user:
+                self.modified.discard(key)
+                if user is None:
+                    del self._users[key]
+
+
+# Хранилище с быстрым холодным стартом: двоичный снимок + журнал.
+#
+# Устроено как режим journal, но снимок - не JSON, который надо
+# разобрать целиком, а файл с индексом по user_id (Snapshot). При
+# запуске снимок только отображается в память и проигрывается хвост
+# журнала, поэтому время запуска не зависит от числа пользователей.
+# Задания пользователя разбираются, когда он впервые пишет боту.
+#
+# В фоне (JOURNAL_COMPACT_INTERVAL, JOURNAL_COMPACT_BYTES) снимок
+# обновляется из памяти: записи неизменённых пользователей копируются
+# из старого снимка как есть, изменённые кодируются заново. Новый
+# снимок атомарно подменяет старый.
+class SnapshotStorage(JournalStorage):
+    def __init__(self, path, flush_interval, max_dirty):
+        super().__init__(path, flush_interval, max_dirty)
+        self._snapshot = None
+
+    def load(self):
+        self._snapshot = Snapshot(self.path)
+        self._data = LazyUsers(self._snapshot)
+        self._seq = self._snapshot.seq
+        self._reset_ids()
+
+        snapshot_seq = self._seq
+        # Старый сегмент остаётся, если обновление снимка прервалось
+        self._replay(self.old_journal_path, snapshot_seq, truncate=False)
+        self._replay(self.journal_path, snapshot_seq, truncate=True)
+        self._reset_ids()
+        self._journal = open(self.journal_path, 'ab')
+        self._journal_bytes = self._journal.tell()
+
+        if os.path.exists(self.old_journal_path):
+            changes = self._data.changes()
+            snapshot = self._finish_refresh(self._snapshot, changes, self._seq, self._max_id(changes), subject_table())
+            self._swap(snapshot, changes)
+
+    def _max_id(self, changes):
+        return max([self._snapshot.max_id, *(user.max_id() for user in changes.values() if user is not None)])
+
+    def _reset_ids(self):
+        max_id = max((user.max_id() for user in self._data.decoded()), default=0)
+        self._ids = itertools.count(max(max_id, self._snapshot.max_id) + 1)
+
+    async def dates_from(self, start):
+        pairs = []
+        async for chunk in in_batches(self._data.dates(lambda first, last: last >= start)):
+            pairs += [(int(key), date_ord) for key, dates in chunk for date_ord in dates if date_ord >= start]
+        return pairs
+
+    async def users_before(self, end):
+        user_ids = []
+        async for chunk in in_batches(self._data.dates(lambda first, last: first < end)):
+            user_ids += [int(key) for key, dates in chunk if any(date_ord < end for date_ord in dates)]
+        return user_ids
+
+    # Выполняется в потоке ввода-вывода
+    def _finish_refresh(self, old, changes, seq, max_id, subjects):
+        write_merged(self.path, old, changes, seq, max_id, subjects)
+        os.remove(self.old_journal_path)
+        return Snapshot(self.path)
+
+    def _swap(self, snapshot, changes):
+        self._snapshot = snapshot
+        self._data.rebase(snapshot, changes)
+        # Прежний снимок не закрываем явно: его может ещё дочитывать
+        # перебор пользователей, отображение закроется вместе с объектом
+
+    # Обновление снимка из памяти
+    async def compact(self):
+        if os.path.exists(self.old_journal_path):
+            return
+        # Изменения фиксируются в тот же момент, когда смена сегмента
+        # ставится в очередь: все записи до неё попадут в старый сегмент
+        started = time.perf_counter()
+        changes = self._data.changes()
+        seq = self._seq
+        max_id = self._max_id(changes)
+        subjects = subject_table()
+        rotated = run_io(self._rotate)
+        self._journal_bytes = 0
+        # Фрагменты JSON этому режиму не нужны
+        self._dirty = set()
+        await rotated
+
+        snapshot = await run_io(self._finish_refresh, self._snapshot, changes, seq, max_id, subjects)
+        self._swap(snapshot, changes)
+        STORAGE_SECONDS.observe(time.perf_counter() - started, op='compact')
+
+    async def close(self):
+        await super().close()
+        if self._snapshot is not None:
+            self._snapshot.close()
+
+
+# Перевод данных режимов json и journal (снимок без хвоста журнала)
+# в двоичный снимок. users - {user_id: UserTasks}
+def convert(users, path, max_id):
+    entries = sorted((user_entry(int(user_id), user) for user_id, user in users.items()), key=itemgetter(0))
+    write_snapshot(path, entries, 0, max_id, subject_table())
+    return len(entries)
@@ -0,0 +1,240 @@
+import asyncio
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import STORAGE_SECONDS
+from storage.base import Storage, Task
+from storage.commit import GroupCommit
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id       INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id  INTEGER NOT NULL,
+    date_ord INTEGER NOT NULL,
+    text     TEXT    NOT NULL,
+    created  INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tasks_user_date ON tasks (user_id, date_ord, id);
+"""
+
+# Переход со старой схемы, где порядок задавался столбцом position
+UPGRADE_FROM_POSITION = """
+ALTER TABLE tasks RENAME TO tasks_old;
+""" + SCHEMA + """
+INSERT INTO tasks (user_id, date_ord, text, created)
+    SELECT user_id, date_ord, text, 0 FROM tasks_old ORDER BY user_id, date_ord, position;
+DROP TABLE tasks_old;
+"""
+
+# Переход со схемы без AUTOINCREMENT, где id удалённого последним
+# задания доставался следующему; id сохраняются
+UPGRADE_TO_AUTOINCREMENT = """
+ALTER TABLE tasks RENAME TO tasks_old;
+DROP INDEX tasks_user_date;
+""" + SCHEMA + """
+INSERT INTO tasks (id, user_id, date_ord, text, created)
+    SELECT id, user_id, date_ord, text, created FROM tasks_old;
+DROP TABLE tasks_old;
+"""
+
+
+# Хранилище в SQLite: одна строка на задание.
+# Индекс (user_id, date_ord, id) позволяет "удалить задание N за дату" или
+# "добавить в дату" затрагивая несколько строк, а не весь словарь пользователя.
+# Порядок заданий внутри даты задаётся id, номер вычисляется при чтении.
+#
+# Все обращения к базе выполняются в отдельном потоке, которому
+# принадлежит соединение, поэтому цикл событий не блокируется.
+# Изменения, накопившиеся за время предыдущей транзакции, фиксируются
+# одной общей транзакцией (групповая фиксация).
+class SqliteStorage(Storage):
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='sqlite')
+        self._commit = GroupCommit(self._write_batch)
+
+    def _run(self, func, *args):
+        return asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def open(self):
+        self._conn = sqlite3.connect(self.path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(tasks)")]
+        row = self._conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'tasks'").fetchone()
+        with self._conn:
+            if 'position' in columns:
+                self._conn.executescript(UPGRADE_FROM_POSITION)
+            elif row is not None and 'AUTOINCREMENT' not in row[0]:
+                self._conn.executescript(UPGRADE_TO_AUTOINCREMENT)
+            else:
+                self._conn.executescript(SCHEMA)
+
+    def shutdown(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    async def start(self):
+        await self._run(self.open)
+
+    async def close(self):
+        await self._commit.drain()
+        await self._run(self.shutdown)
+        self._executor.shutdown()
+
+    # Синхронные операции (выполняются в потоке базы)
+    def _get_user(self, user_id):
+        rows = self._conn.execute(
+            "SELECT id, date_ord, text, created FROM tasks WHERE user_id = ? ORDER BY date_ord, id",
+            (user_id,)
+        )
+        user_data = {}
+        for task_id, date_ord, text, created in rows:
+            user_data.setdefault(date_ord, []).append(Task(task_id, text, created))
+        return user_data
+
+    def _insert(self, user_id, date_ord, items, created):
+        self._conn.executemany(
+            "INSERT INTO tasks (user_id, date_ord, text, created) VALUES (?, ?, ?, ?)",
+            [(user_id, date_ord, text, created) for text in items]
+        )
+
+    # Изменения выполняются внутри транзакции пачки, см. _run_batch
+    def _set_tasks(self, user_id, date_ord, items):
+        self._conn.execute(
+            "DELETE FROM tasks WHERE user_id = ? AND date_ord = ?", (user_id, date_ord)
+        )
+        self._insert(user_id, date_ord, items, int(time.time()))
+
+    # id - номер строки, общий для всех пользователей, поэтому копии
+    # получают новые id; время создания сохраняется
+    def _put_tasks(self, user_id, date_ord, tasks):
+        self._conn.execute(
+            "DELETE FROM tasks WHERE user_id = ? AND date_ord = ?", (user_id, date_ord)
+        )
+        self._conn.executemany(
+            "INSERT INTO tasks (user_id, date_ord, text, created) VALUES (?, ?, ?, ?)",
+            [(user_id, date_ord, task.text, task.created) for task in tasks]
+        )
+
+    def _append_tasks(self, user_id, date_ord, items):
+        self._insert(user_id, date_ord, items, int(time.time()))
+
+    def _delete_task(self, user_id, date_ord, number):
+        row = self._conn.execute(
+            "SELECT id, text, created FROM tasks WHERE user_id = ? AND date_ord = ? "
+            "ORDER BY id LIMIT 1 OFFSET ?",
+            (user_id, date_ord, number - 1)
+        ).fetchone()
+        if row is None:
+            return None
+        self._conn.execute("DELETE FROM tasks WHERE id = ?", (row[0],))
+        return Task(*row)
+
+    def _clear_date(self, user_id, date_ord):
+        self._conn.execute(
+            "DELETE FROM tasks WHERE user_id = ? AND date_ord = ?", (user_id, date_ord)
+        )
+
+    def _clear_all(self, user_id):
+        self._conn.execute("DELETE FROM tasks WHERE user_id = ?", (user_id,))
+
+    # Все изменения пачки - одна транзакция. Если она не удалась,
+    # операции повторяются по одной, чтобы ошибка досталась только виновнику.
+    def _run_batch(self, batch):
+        try:
+            with self._conn:
+                return [func(*args) for func, args in batch]
+        except Exception:
+            results = []
+            for func, args in batch:
+                try:
+                    with self._conn:
+                        results.append(func(*args))
+                except Exception as e:
+                    results.append(e)
+            return results
+
+    async def _write_batch(self, batch):
+        started = time.perf_counter()
+        try:
+            return await self._run(self._run_batch, batch)
+        finally:
+            STORAGE_SECONDS.observe(time.perf_counter() - started, op='commit')
+
+    def _dates_from(self, start):
+        return self._conn.execute(
+            "SELECT DISTINCT user_id, date_ord FROM tasks WHERE date_ord >= ?", (start,)
+        ).fetchall()
+
+    def _users_before(self, end):
+        return [row[0] for row in self._conn.execute(
+            "SELECT DISTINCT user_id FROM tasks WHERE date_ord < ?", (end,)
+        )]
+
+    # Импорт {user_id: {дата: [Task, ...]}} целиком
+    def _import_users(self, all_data):
+        with self._conn:
+            for user_id, user_data in all_data.items():
+                for date_ord, tasks in user_data.items():
+                    self._conn.execute(
+                        "DELETE FROM tasks WHERE user_id = ? AND date_ord = ?",
+                        (int(user_id), date_ord)
+                    )
+                    self._conn.executemany(
+                        "INSERT INTO tasks (user_id, date_ord, text, created) VALUES (?, ?, ?, ?)",
+                        [(int(user_id), date_ord, task.text, task.created) for task in tasks]
+                    )
+
+    # Асинхронный интерфейс
+    async def get_user(self, user_id):
+        return await self._run(self._get_user, int(user_id))
+
+    async def set_tasks(self, user_id, date_ord, items):
+        return await self._submit(self._set_tasks, int(user_id), date_ord, list(items))
+
+    async def put_tasks(self, user_id, date_ord, tasks):
+        return await self._submit(self._put_tasks, int(user_id), date_ord, list(tasks))
+
+    async def append_tasks(self, user_id, date_ord, items):
+        return await self._submit(self._append_tasks, int(user_id), date_ord, list(items))
+
+    async def delete_task(self, user_id, date_ord, number):
+        return await self._submit(self._delete_task, int(user_id), date_ord, number)
+
+    async def clear_date(self, user_id, date_ord):
+        return await self._submit(self._clear_date, int(user_id), date_ord)
+
+    async def clear_all(self, user_id):
+        return await self._submit(self._clear_all, int(user_id))
+
+    # Подписчики узнают об изменении после фиксации транзакции
+    async def _submit(self, func, user_id, *args):
+        if not args:
+            result = await self._commit.submit((func, (user_id,)))
+            self._changed(user_id)
+            return result
+        result, count = await self._commit.submit((self._counted, (func, user_id) + args))
+        self._changed(user_id, args[0], count)
+        return result
+
+    # Операция над датой и число заданий, оставшихся за ней, в одной транзакции
+    def _counted(self, func, user_id, date_ord, *args):
+        result = func(user_id, date_ord, *args)
+        count = self._conn.execute(
+            "SELECT COUNT(*) FROM tasks WHERE user_id = ? AND date_ord = ?", (user_id, date_ord)
+        ).fetchone()[0]
+        return result, count
+
+    async def dates_from(self, start):
+        return await self._run(self._dates_from, start)
+
+    async def users_before(self, end):
+        return await self._run(self._users_before, end)
+
+    async def import_users(self, all_data):
+        return await self._run(self._import_users, all_data)
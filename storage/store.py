@@ -0,0 +1,33 @@
+from config import (
+    DATA_FILE, FLUSH_INTERVAL, FLUSH_MAX_DIRTY, STORAGE_MODE, SQLITE_FILE, SNAPSHOT_FILE,
+    CLASSES_FILE, CLASS_SYNC_INTERVAL, SHARDS, SHARD_INDEX
+)
+from metrics import time_storage
+from storage.shared import SharedStorage
+
+
+# Выбор хранилища по STORAGE_MODE из .env
+def create_store(mode=STORAGE_MODE):
+    if mode == 'sqlite':
+        from storage.sqlite import SqliteStorage
+        return SqliteStorage(SQLITE_FILE)
+    if mode == 'snapshot':
+        from storage.snapshot import SnapshotStorage
+        return SnapshotStorage(SNAPSHOT_FILE, FLUSH_INTERVAL, FLUSH_MAX_DIRTY)
+    if mode == 'journal':
+        from storage.journal import JournalStorage
+        return JournalStorage(DATA_FILE, FLUSH_INTERVAL, FLUSH_MAX_DIRTY)
+    from storage.json_store import JsonStorage
+    return JsonStorage(DATA_FILE, FLUSH_INTERVAL, FLUSH_MAX_DIRTY)
+
+
+# Пользователи этого шарда (sharding.py раскладывает по user_id % SHARDS)
+def local_user(user_id):
+    return user_id % SHARDS == int(SHARD_INDEX)
+
+
+# Личные задания вместе с общими списками классов
+store = SharedStorage(create_store(), CLASSES_FILE, CLASS_SYNC_INTERVAL,
+                      local_user if SHARD_INDEX is not None else None)
+# Время каждой операции попадает в метрику bot_storage_seconds
+time_storage(store, ('get_user', 'set_tasks', 'put_tasks', 'append_tasks', 'delete_task', 'clear_date', 'clear_all'))
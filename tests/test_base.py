@@ -0,0 +1,43 @@
+import itertools
+
+import pytest
+
+from storage.base import (
+    Task, date_to_ordinal, decode_user, encode_user, max_task_id, ordinal_to_date,
+    render_tasks, split_legacy_tasks,
+)
+
+DAY = date_to_ordinal("26.02.2026")
+
+
+def test_dates_round_trip():
+    assert ordinal_to_date(DAY) == "26.02.2026"
+    assert date_to_ordinal("1.3.2026") == DAY + 3
+
+@pytest.mark.parametrize("text", ["26.02.26", "2026-02-26", "31.02.2026", "26.02.2026 "])
+def test_bad_dates_are_rejected(text):
+    with pytest.raises(ValueError):
+        date_to_ordinal(text)
+
+def test_legacy_tasks_are_split_and_unnumbered():
+    assert split_legacy_tasks("1. Математика: стр. 45\n2. Физика\n") == ["Математика: стр. 45", "Физика"]
+    # Номер снимается только в начале строки и один раз
+    assert split_legacy_tasks("1. 2. задача\nбез номера") == ["2. задача", "без номера"]
+
+def test_legacy_user_is_decoded_with_new_ids():
+    ids = itertools.count(10)
+    user = decode_user({"26.02.2026": "1. foo\n2. bar", str(DAY + 1): [[3, "baz", 100]]}, ids)
+    assert user == {
+        DAY: [Task(10, "foo", 0), Task(11, "bar", 0)],
+        DAY + 1: [Task(3, "baz", 100)],
+    }
+
+def test_user_round_trips_through_json_form():
+    user = {DAY: [Task(1, "foo", 5), Task(2, "bar", 6)]}
+    assert decode_user(encode_user(user), itertools.count(1)) == user
+
+def test_max_task_id_ignores_legacy_dates():
+    assert max_task_id({"1": {"26.02.2026": "1. foo", str(DAY): [[7, "bar", 0]]}, "2": {}}) == 7
+
+def test_render_tasks_numbers_from_one():
+    assert render_tasks([Task(5, "foo", 0), Task(9, "bar", 0)]) == "1. foo\n2. bar"
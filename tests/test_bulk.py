@@ -0,0 +1,29 @@
+from handlers.bulk import parse_bulk
+from storage.base import date_to_ordinal
+
+
+def test_numbered_lines_with_continuation():
+    tasks, blocks = parse_bulk("1. Математика: стр. 45\nи №123\n2) Физика")
+    assert tasks == ["Математика: стр. 45 и №123", "Физика"]
+    assert blocks == {}
+
+def test_date_blocks():
+    tasks, blocks = parse_bulk("Общее\n26.02.2026:\n- Математика\n- Физика\n27.02.2026: История")
+    assert tasks == ["Общее"]
+    assert blocks == {
+        date_to_ordinal("26.02.2026"): ["Математика", "Физика"],
+        date_to_ordinal("27.02.2026"): ["История"],
+    }
+
+def test_task_starting_with_date_is_not_a_header():
+    tasks, blocks = parse_bulk("26.02.2026 принести тетрадь")
+    assert tasks == ["26.02.2026 принести тетрадь"]
+    assert blocks == {}
+
+def test_invalid_date_is_a_task():
+    tasks, blocks = parse_bulk("31.02.2026: что-то")
+    assert tasks == ["31.02.2026: что-то"]
+    assert blocks == {}
+
+def test_empty_date_block_is_dropped():
+    assert parse_bulk("26.02.2026:\n\n") == ([], {})
@@ -0,0 +1,95 @@
+import asyncio
+import json
+import os
+import zlib
+
+from storage.base import date_to_ordinal
+from storage.journal import JournalStorage
+
+DAY = date_to_ordinal("26.02.2026")
+
+
+def write_ops(path, *ops):
+    async def run():
+        storage = JournalStorage(path, 60, 1000)
+        await storage.start()
+        for op in ops:
+            await op(storage)
+        await storage.close()
+    asyncio.run(run())
+
+def load(path):
+    storage = JournalStorage(path, 60, 1000)
+    storage.load()
+    storage._journal.close()
+    return storage
+
+def texts(storage, user_id, date_ord=DAY):
+    return [task.text for task in storage._data[str(user_id)].tasks(date_ord)]
+
+def journal_line(op):
+    payload = json.dumps(op, ensure_ascii=False).encode('utf-8')
+    return b'%08x %s\n' % (zlib.crc32(payload), payload)
+
+
+def test_state_is_restored_from_the_journal(tmp_path):
+    path = str(tmp_path / 'data.json')
+    write_ops(path,
+              lambda s: s.append_tasks(1, DAY, ["Математика", "Физика"]),
+              lambda s: s.delete_task(1, DAY, 1),
+              lambda s: s.append_tasks(2, DAY, ["История"]))
+    # Снимок при закрытии не пишется - всё восстанавливается из журнала
+    assert not os.path.exists(path)
+    storage = load(path)
+    assert texts(storage, 1) == ["Физика"]
+    assert texts(storage, 2) == ["История"]
+
+def test_torn_tail_is_dropped_and_truncated(tmp_path):
+    path = str(tmp_path / 'data.json')
+    write_ops(path, lambda s: s.append_tasks(1, DAY, ["Математика"]))
+    journal = path + '.journal'
+    valid = os.path.getsize(journal)
+    with open(journal, 'ab') as f:
+        f.write(journal_line({'op': 'append', 'u': '1', 'd': DAY, 'items': [[9, "Физика", 0]], 's': 2})[:-10])
+
+    storage = load(path)
+    assert texts(storage, 1) == ["Математика"]
+    assert os.path.getsize(journal) == valid
+
+def test_bad_checksum_drops_the_rest(tmp_path):
+    path = str(tmp_path / 'data.json')
+    write_ops(path,
+              lambda s: s.append_tasks(1, DAY, ["Математика"]),
+              lambda s: s.append_tasks(1, DAY, ["Физика"]),
+              lambda s: s.append_tasks(1, DAY, ["История"]))
+    journal = path + '.journal'
+    with open(journal, 'rb') as f:
+        lines = f.read().splitlines(keepends=True)
+    lines[1] = lines[1].replace("Физика".encode('utf-8'), "Химия".encode('utf-8'))
+    with open(journal, 'wb') as f:
+        f.write(b''.join(lines))
+
+    storage = load(path)
+    assert texts(storage, 1) == ["Математика"]
+    assert os.path.getsize(journal) == len(lines[0])
+
+def test_legacy_records_are_upgraded(tmp_path):
+    path = str(tmp_path / 'data.json')
+    with open(path + '.journal', 'wb') as f:
+        f.write(journal_line({'op': 'set', 'u': '1', 'd': "26.02.2026", 'items': ["Математика", "Физика"], 's': 1}))
+
+    storage = load(path)
+    tasks = storage._data['1'].tasks(DAY)
+    assert [task.text for task in tasks] == ["Математика", "Физика"]
+    assert len({task.id for task in tasks}) == 2
+
+def test_records_already_in_the_snapshot_are_skipped(tmp_path):
+    path = str(tmp_path / 'data.json')
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'seq': 1, 'users': {'1': {str(DAY): [[1, "Математика", 0]]}}}, f)
+    with open(path + '.journal', 'wb') as f:
+        f.write(journal_line({'op': 'append', 'u': '1', 'd': DAY, 'items': [[1, "Математика", 0]], 's': 1}))
+        f.write(journal_line({'op': 'append', 'u': '1', 'd': DAY, 'items': [[2, "Физика", 0]], 's': 2}))
+
+    storage = load(path)
+    assert texts(storage, 1) == ["Математика", "Физика"]
@@ -0,0 +1,60 @@
+import asyncio
+
+from storage.base import Task
+from storage.json_store import JsonStorage
+from storage.search import SearchIndex, normalize, stem, tokenize
+
+A, B = 800010, 800001
+
+
+def test_normalize_folds_case_yo_and_stress():
+    assert normalize("Ёлка") == "елка"
+    assert normalize("зада́ча") == "задача"
+
+def test_stem_keeps_short_words():
+    assert stem("физике") == stem("физика") == "физик"
+    assert stem("параграфа") == "параграф"
+    assert stem("ами") == "ами"
+
+def test_tokenize_splits_on_punctuation():
+    assert tokenize("Математика: стр. 45, №123") == ["математик", "стр", "45", "123"]
+
+
+def search(storage, index, query):
+    results, _ = asyncio.run(index.search(1, query))
+    return results
+
+def make():
+    storage = JsonStorage('unused.json', 60, 1000)
+    return storage, SearchIndex(storage)
+
+def test_prefix_and_all_terms_match():
+    storage, index = make()
+    asyncio.run(storage.put_tasks(1, A, [Task(1, "Физика: параграф 5", 0), Task(2, "Математика: параграф 7", 0)]))
+    assert search(storage, index, "физ параграф") == [(A, 1, "Физика: параграф 5")]
+    assert search(storage, index, "химия") == []
+
+def test_total_counts_results_past_the_limit():
+    storage, index = make()
+    asyncio.run(storage.put_tasks(1, A, [Task(i, f"Физика {i}", 0) for i in range(1, 6)]))
+    results, total = asyncio.run(index.search(1, "физика", limit=2))
+    assert len(results) == 2 and total == 5
+
+def test_changed_dates_are_reindexed():
+    storage, index = make()
+    asyncio.run(storage.put_tasks(1, A, [Task(1, "Физика", 0), Task(2, "История", 0)]))
+    assert search(storage, index, "история") == [(A, 2, "История")]
+    asyncio.run(storage.delete_task(1, A, 1))
+    assert search(storage, index, "история") == [(A, 1, "История")]
+    assert search(storage, index, "физика") == []
+
+def test_reused_id_on_another_date():
+    storage, index = make()
+    asyncio.run(storage.put_tasks(1, A, [Task(1, "Математика", 0), Task(2, "Физика", 0)]))
+    assert search(storage, index, "физика") == [(A, 2, "Физика")]
+    # id удалённого задания достаётся новому за более раннюю дату
+    asyncio.run(storage.delete_task(1, A, 2))
+    asyncio.run(storage.put_tasks(1, B, [Task(2, "Химия", 0)]))
+    assert search(storage, index, "химия") == [(B, 1, "Химия")]
+    assert search(storage, index, "математика") == [(A, 1, "Математика")]
+    assert search(storage, index, "физика") == []
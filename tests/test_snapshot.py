@@ -0,0 +1,86 @@
+import asyncio
+import os
+
+from storage.base import Task, date_to_ordinal
+from storage.compact import UserTasks, subject_table
+from storage.snapshot import Snapshot, SnapshotStorage, convert, write_merged
+
+DAY = date_to_ordinal("26.02.2026")
+
+USERS = {
+    "7": UserTasks({
+        DAY: [Task(1, "Математика: стр. 45, №3", 100), Task(2, "принести тетрадь", 101)],
+        DAY + 2: [Task(5, "Литература: «Капитанская дочка» 📖", 102)],
+    }),
+    "3": UserTasks({DAY + 1: [Task(4, "Физика: §12", 0)]}),
+}
+
+
+def decoded(snapshot, user_id):
+    return snapshot.get(user_id).to_dict()
+
+
+def test_users_round_trip_through_the_snapshot(tmp_path):
+    path = str(tmp_path / 'data.snap')
+    assert convert(USERS, path, 5) == 2
+    snapshot = Snapshot(path)
+    try:
+        assert (snapshot.seq, snapshot.max_id, snapshot.users) == (0, 5, 2)
+        for user_id, user in USERS.items():
+            assert decoded(snapshot, int(user_id)) == user.to_dict()
+        # Индекс отсортирован по user_id, в нём первая и последняя дата
+        assert [entry[0] for entry in snapshot.entries()] == [3, 7]
+        _, offset, _, first, last = snapshot.find(7)
+        assert (first, last) == (DAY, DAY + 2)
+        assert list(snapshot.dates(offset)) == [DAY, DAY, DAY + 2]
+        assert snapshot.get(5) is None
+    finally:
+        snapshot.close()
+
+def test_merged_snapshot_keeps_untouched_users(tmp_path):
+    path = str(tmp_path / 'data.snap')
+    convert(USERS, path, 5)
+    changed = UserTasks({DAY: [Task(6, "История: конспект", 103)]})
+    old = Snapshot(path)
+    write_merged(path + '.new', old, {"3": None, "9": changed}, 42, 6, subject_table())
+    old.close()
+
+    snapshot = Snapshot(path + '.new')
+    try:
+        assert (snapshot.seq, snapshot.max_id) == (42, 6)
+        assert [entry[0] for entry in snapshot.entries()] == [7, 9]
+        assert decoded(snapshot, 7) == USERS["7"].to_dict()
+        assert decoded(snapshot, 9) == changed.to_dict()
+    finally:
+        snapshot.close()
+
+def test_journal_tail_is_applied_over_the_snapshot(tmp_path):
+    path = str(tmp_path / 'data.snap')
+    convert(USERS, path, 5)
+
+    async def run():
+        storage = SnapshotStorage(path, 60, 1000)
+        await storage.start()
+        await storage.append_tasks(3, DAY + 1, ["Химия"])
+        await storage.close()
+    asyncio.run(run())
+
+    storage = SnapshotStorage(path, 60, 1000)
+    storage.load()
+    storage._journal.close()
+    try:
+        assert [task.text for task in storage._data.get("3").tasks(DAY + 1)] == ["Физика: §12", "Химия"]
+        assert storage._data.get("7").to_dict() == USERS["7"].to_dict()
+        # Новое задание получило id больше наибольшего в снимке
+        assert storage._data.get("3").max_id() == 6
+    finally:
+        storage._snapshot.close()
+
+def test_corrupt_snapshot_is_set_aside(tmp_path, capsys):
+    path = str(tmp_path / 'data.snap')
+    with open(path, 'wb') as f:
+        f.write(b'not a snapshot at all, just some bytes')
+    snapshot = Snapshot(path)
+    assert snapshot.users == 0 and snapshot.get(7) is None
+    assert not os.path.exists(path)
+    assert os.path.exists(path + '.corrupt')
@@ -0,0 +1,261 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from collections import deque
+
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.load import UserScript
+
+
+# Локальная заглушка Telegram Bot API для сквозных прогонов без сети.
+# Отдаёт обновления через getUpdates (из записанных файлов или
+# сгенерированные), принимает sendMessage и остальные методы, умеет
+# добавлять задержку, ответы 429 (flood wait) и ошибки.
+#
+#   python tools/fake_api.py --generate 500 --flood 0.01 --report e2e.json
+#   API_URL=http://127.0.0.1:8081 BOT_TOKEN=123456:fake python main.py
+#
+# Для каждого запроса записывается время обработки, а для ответов бота -
+# время от выдачи обновления в getUpdates до ответа в тот же чат
+# (ответ сопоставляется с самым старым неотвеченным обновлением чата).
+# Отчёт доступен по GET /stats и записывается в --report при остановке.
+
+
+def make_update(update_id, user_id, text):
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private', 'first_name': 'Load'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': 'Load'},
+            'text': text,
+        },
+    }
+
+
+# Сценарии bench/load.py, перемешанные между пользователями:
+# порядок сообщений каждого пользователя сохраняется
+def generate_updates(users, flows, tasks):
+    scripts = {user_id: UserScript(user_id, flows, tasks).texts() for user_id in range(1, users + 1)}
+    update_id = 1
+    while scripts:
+        for user_id, script in list(scripts.items()):
+            text = next(script, None)
+            if text is None:
+                del scripts[user_id]
+                continue
+            yield make_update(update_id, user_id, text)
+            update_id += 1
+
+
+def load_updates(paths):
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            updates = json.load(f)
+        yield from updates if isinstance(updates, list) else [updates]
+
+
+def percentiles(values):
+    if not values:
+        return {'count': 0}
+    values = sorted(values)
+    pick = lambda share: round(values[min(len(values) - 1, int(len(values) * share))] * 1000, 3)
+    return {'count': len(values), 'p50_ms': pick(0.50), 'p95_ms': pick(0.95),
+            'p99_ms': pick(0.99), 'max_ms': round(values[-1] * 1000, 3)}
+
+
+class FakeBotAPI:
+    def __init__(self, updates, args):
+        self.source = iter(updates)
+        self.args = args
+        self.queue = deque()  # обновления, ещё не подтверждённые offset
+        self.last_delivered = 0  # наибольший update_id, уже выданный боту
+        self.arrived = asyncio.Event()
+        self.total = 0
+        self.fed = False  # все обновления источника поставлены в очередь
+        self.confirmed = 0
+        self.message_ids = 0
+        # Время выдачи обновлений по чатам, ожидающих ответа бота
+        self.delivered = {}
+        self.timings = {}  # метод -> [секунды]
+        self.end_to_end = []
+        self.injected = {'flood': 0, 'error': 0}
+        self.sent = {}
+        self.started = None
+        self.drained = None
+
+    # Подача обновлений: все сразу (накопленная очередь) или с темпом --rate в секунду
+    async def feed(self):
+        if self.args.rate <= 0:
+            for update in self.source:
+                self._push(update)
+        else:
+            interval = 1 / self.args.rate
+            for update in self.source:
+                self._push(update)
+                await asyncio.sleep(interval)
+        self.fed = True
+
+    def _push(self, update):
+        self.queue.append(update)
+        self.total += 1
+        self.arrived.set()
+
+    async def handle(self, request):
+        started = time.perf_counter()
+        method = request.match_info['method']
+        # aiogram шлёт формы, а главный процесс sharding.py - JSON
+        if request.content_type == 'application/json':
+            params = await request.json()
+        else:
+            params = dict(await request.post())
+        if self.args.latency:
+            await asyncio.sleep(self.args.latency / 1000)
+
+        try:
+            if method != 'getUpdates' and random.random() < self.args.flood:
+                self.injected['flood'] += 1
+                return self._error(429, f"Too Many Requests: retry after {self.args.retry_after}",
+                                   {'retry_after': self.args.retry_after})
+            if method != 'getUpdates' and random.random() < self.args.errors:
+                self.injected['error'] += 1
+                return self._error(500, "Internal Server Error")
+            return web.json_response({'ok': True, 'result': await self.call(method, params)})
+        finally:
+            self.timings.setdefault(method, []).append(time.perf_counter() - started)
+
+    def _error(self, code, description, parameters=None):
+        body = {'ok': False, 'error_code': code, 'description': description}
+        if parameters:
+            body['parameters'] = parameters
+        return web.json_response(body, status=code)
+
+    async def call(self, method, params):
+        if method == 'getUpdates':
+            return await self.get_updates(params)
+        if method == 'getMe':
+            return {'id': 123456, 'is_bot': True, 'first_name': 'Fake', 'username': 'fake_bot'}
+        self.sent[method] = self.sent.get(method, 0) + 1
+        if method in ('sendMessage', 'editMessageText'):
+            return self.message(params)
+        return True
+
+    def message(self, params):
+        chat_id = int(params['chat_id'])
+        waiting = self.delivered.get(chat_id)
+        if waiting:
+            self.end_to_end.append(time.perf_counter() - waiting.popleft())
+            if not waiting:
+                del self.delivered[chat_id]
+        self.message_ids += 1
+        return {
+            'message_id': int(params.get('message_id') or self.message_ids),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'text': params.get('text', ''),
+        }
+
+    async def get_updates(self, params):
+        if self.started is None:
+            self.started = time.perf_counter()
+        offset = int(params.get('offset') or 0)
+        limit = int(params.get('limit') or 100)
+        timeout = float(params.get('timeout') or 0)
+
+        # offset подтверждает всё, что было выдано раньше
+        while self.queue and self.queue[0]['update_id'] < offset:
+            self.queue.popleft()
+            self.confirmed += 1
+        if self.fed and not self.queue and self.drained is None and self.confirmed:
+            self.drained = time.perf_counter()
+
+        if not self.queue and timeout:
+            self.arrived.clear()
+            try:
+                await asyncio.wait_for(self.arrived.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+        batch = [self.queue[i] for i in range(min(limit, len(self.queue)))]
+        now = time.perf_counter()
+        for update in batch:
+            # Повторная выдача (бот не подтвердил offset) не сбивает замер
+            if update['update_id'] > self.last_delivered:
+                self.last_delivered = update['update_id']
+                chat = update.get('message', {}).get('chat', {}).get('id')
+                if chat is not None:
+                    self.delivered.setdefault(chat, deque()).append(now)
+        return batch
+
+    def stats(self):
+        drain = None
+        if self.drained is not None and self.started is not None:
+            seconds = self.drained - self.started
+            drain = {'seconds': round(seconds, 3), 'updates_per_sec': round(self.confirmed / seconds, 1)}
+        return {
+            'updates': self.total,
+            'confirmed': self.confirmed,
+            'backlog': len(self.queue),
+            'drain': drain,
+            'end_to_end': percentiles(self.end_to_end),
+            'requests': {method: percentiles(values) for method, values in self.timings.items()},
+            'sent': self.sent,
+            'injected': self.injected,
+        }
+
+    async def handle_stats(self, request):
+        return web.json_response(self.stats())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('files', nargs='*', help='файлы с записанными обновлениями (tools/updates/*.json)')
+    parser.add_argument('--generate', type=int, default=0, help='сгенерировать сценарии для N пользователей')
+    parser.add_argument('--flows', type=int, default=5, help='сценариев на пользователя')
+    parser.add_argument('--tasks', type=int, default=4)
+    parser.add_argument('--rate', type=float, default=0, help='обновлений в секунду (0 - все сразу)')
+    parser.add_argument('--latency', type=float, default=0, help='задержка каждого ответа, мс')
+    parser.add_argument('--flood', type=float, default=0, help='доля ответов 429')
+    parser.add_argument('--retry-after', type=int, default=1)
+    parser.add_argument('--errors', type=float, default=0, help='доля ответов 500')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--report', help='файл для отчёта в JSON при остановке')
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    updates = load_updates(args.files)
+    if args.generate:
+        updates = generate_updates(args.generate, args.flows, args.tasks)
+    api = FakeBotAPI(updates, args)
+
+    async def start_feed(app):
+        app['feed'] = asyncio.create_task(api.feed())
+
+    async def write_report(app):
+        app['feed'].cancel()
+        report = json.dumps(api.stats(), ensure_ascii=False, indent=4)
+        print(report)
+        if args.report:
+            with open(args.report, 'w', encoding='utf-8') as f:
+                f.write(report)
+
+    app = web.Application()
+    app.router.add_post('/bot{token}/{method}', api.handle)
+    app.router.add_get('/stats', api.handle_stats)
+    app.on_startup.append(start_feed)
+    app.on_shutdown.append(write_report)
+    web.run_app(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+import aiohttp
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET
+
+
+# Отправка записанных обновлений на локальный webhook:
+#   python tools/post_update.py tools/updates/start.json
+# Файл может содержать одно обновление или список обновлений.
+async def main(args):
+    headers = {}
+    if WEBHOOK_SECRET:
+        headers['X-Telegram-Bot-Api-Secret-Token'] = WEBHOOK_SECRET
+
+    async with aiohttp.ClientSession(headers=headers) as session:
+        for path in args.files:
+            with open(path, 'r', encoding='utf-8') as f:
+                updates = json.load(f)
+            if isinstance(updates, dict):
+                updates = [updates]
+
+            for update in updates:
+                started = time.perf_counter()
+                async with session.post(args.url, json=update) as response:
+                    await response.read()
+                    elapsed = (time.perf_counter() - started) * 1000
+                    print(f"{path} update_id={update.get('update_id')}: "
+                          f"HTTP {response.status} за {elapsed:.1f} мс")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('files', nargs='+')
+    parser.add_argument('--url', default=f"http://{WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+    asyncio.run(main(parser.parse_args()))